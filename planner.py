@@ -8,10 +8,19 @@ required_open_webui_version: 0.6.26
 """
 
 import copy
+import hashlib
+import math
+import heapq
+import os
+import sqlite3
 import re
+import shlex
+import time
 import logging
 import json
 import asyncio
+import collections
+import contextvars
 import textwrap
 import sys
 import types
@@ -248,6 +257,332 @@ def clean_json_response(response_text: str) -> str:
     return response_text[start:end]
 
 
+_TOOL_SELECTION_GUIDELINES = """INSTRUCTIONS:
+1. Analyze the action description to understand what needs to be accomplished
+2. Select the most appropriate tool(s) from the available list
+3. Return ONLY the tool_id(s) that best match the action requirements
+4. If multiple tools are needed, list all relevant tool_ids
+5. Focus on tools that directly accomplish the action's objective
+
+SPECIFIC TOOL MAPPING GUIDELINES:
+- Research actions (search, find information, gather data): Use search tools (arxiv_search_tool, wiki_search_tool, perplexica_search)
+- Image generation actions: Use image generation tools (native_image_gen, create_image_hf, pexels_image_search_tool)
+- File operations (save, write): Use appropriate file/save tools
+- API integrations: Use specific API tools as needed
+
+CRITICAL: If the action requires external capabilities (search, file operations, API calls), you MUST select appropriate tools. Do not return an empty list unless the action truly doesn't need any external tools."""
+
+
+_LIGHTWEIGHT_CONTEXT_RUBRIC = """CRITICAL UNDERSTANDING - LIGHTWEIGHT CONTEXT MODE:
+- Lightweight context = Action receives only METADATA about dependencies (content type, length, brief description)
+- Full context = Action receives complete primary_output content from dependencies
+- @action_id references in tool parameters work in BOTH modes (they auto-resolve to full content)
+- The key difference: Can the action work effectively with just @action_id references, or does it need to read/analyze the full content in its reasoning?
+
+WHEN TO USE LIGHTWEIGHT CONTEXT:
+✅ SHOULD USE (action works with @action_id references in tools):
+- File operations that save/organize content: uses @action_id in file paths/content parameters
+- Obsidian/note operations: uses @action_id to reference content to save
+- Data compilation: uses @action_id to gather content into tools
+- Archive/backup operations: uses @action_id to specify what to archive
+- Organization tasks: uses @action_id to reference what to organize
+- Actions that primarily MOVE, SAVE, or ORGANIZE existing content
+
+❌ SHOULD NOT USE (action needs full content for reasoning/analysis):
+- Content analysis: needs to READ and analyze actual content for decision-making
+- Image generation based on content: needs full text to understand what image to create
+- Content creation that builds upon previous content: needs full context for coherent writing
+- Summarization: needs full content to create accurate summaries
+- Translation: needs full source text for accurate translation
+- Quality assessment: needs full content to evaluate
+- Actions that need to read, understand, or analyze content for their reasoning
+
+KEY INSIGHT - @action_id vs CONTENT ANALYSIS:
+- Actions that use @action_id in tool parameters to pass content → YES lightweight
+- Actions that need to read/understand content for decision-making → NO lightweight
+- File saving with @chapter_content works with lightweight (just passes reference)
+- Image generation needs full chapter content for reasoning (needs to understand what to illustrate)"""
+
+_LIGHTWEIGHT_CONTEXT_EXAMPLES = """ANALYSIS LOGIC:
+1. Does this action need to READ/analyze the actual content of dependencies? → NO lightweight
+2. Does this action work by saving/organizing content using references? → YES lightweight  
+3. Is this image generation that needs source content for context? → NO lightweight
+4. Is this file/note organization that works with content IDs? → YES lightweight
+
+EXAMPLES WITH REASONING:
+- "Generate illustration for chapter" → NO (needs to understand chapter content to decide what to illustrate)
+- "Save chapters to Obsidian vault" → YES (uses @chapter_id to save, doesn't need to analyze content)
+- "Organize all content into folder structure" → YES (uses @action_id references to organize by reference)
+- "Create summary based on research" → NO (needs to read and analyze research content for summarization)
+- "Compile all reports into ZIP file" → YES (uses @report_id references, doesn't analyze content)
+- "Write conclusion based on analysis" → NO (needs to read analysis content for reasoning)"""
+
+
+_LIGHTWEIGHT_KEYWORDS = (
+    "save",
+    "organize",
+    "file",
+    "folder",
+    "archive",
+    "store",
+    "obsidian",
+    "vault",
+)
+
+# Verbs of steps that move content around by reference versus steps that must read it.
+_TRANSFER_VERB_PATTERN = re.compile(
+    r"\b(save|saves|saving|store|stores|archive|archives|organi[sz]e|organi[sz]es|"
+    r"upload|uploads|export|exports|move|moves|copy|copies|compile|compiles|bundle|"
+    r"zip|backup|back up|file|files|folder|folders|vault|obsidian|publish|send|attach)\b"
+)
+_REASONING_VERB_PATTERN = re.compile(
+    r"\b(analy[sz]e|analy[sz]es|analysis|summari[sz]e|summary|write|writes|draft|rewrite|"
+    r"translate|review|evaluate|assess|compare|explain|illustrate|illustration|"
+    r"generate an? image|describe|critique|conclude|conclusion|interpret|extract)\b"
+)
+
+
+def _is_lightweight_candidate(action: "Action") -> bool:
+    """Keyword and dependency prefilter for lightweight context mode."""
+
+    if action.id == "final_synthesis" or len(action.dependencies) < 2:
+        return False
+    description = action.description.lower()
+    has_file_operations = any(keyword in description for keyword in _LIGHTWEIGHT_KEYWORDS)
+    has_many_dependencies = len(action.dependencies) > 3
+    return has_file_operations or (bool(action.tool_ids) and has_many_dependencies)
+
+
+def _lightweight_context_features(
+    action: "Action", dependency_outputs: dict[str, dict[str, Any]] | None = None
+) -> dict[str, Any]:
+    """Collect the signals used to score an action for lightweight context mode."""
+
+    description = action.description.lower()
+    dependency_bytes = 0
+    for dep in action.dependencies:
+        output = (dependency_outputs or {}).get(dep) or {}
+        dependency_bytes += len(str(output.get("primary_output", "")).encode("utf-8"))
+    return {
+        "fan_in": len(set(action.dependencies)),
+        "dependency_bytes": dependency_bytes,
+        "has_tools": bool(action.tool_ids),
+        "transfer_verbs": sorted(set(_TRANSFER_VERB_PATTERN.findall(description))),
+        "reasoning_verbs": sorted(set(_REASONING_VERB_PATTERN.findall(description))),
+    }
+
+
+def _score_lightweight_context(features: dict[str, Any]) -> float:
+    """Score in [0, 1]; high means the step only passes content along by reference."""
+
+    score = 0.5
+    if features["transfer_verbs"]:
+        score += 0.3
+    if features["reasoning_verbs"]:
+        score -= 0.35
+    # Without tools there are no @action_id parameters to carry the content.
+    score += 0.1 if features["has_tools"] else -0.2
+    score += min(0.15, 0.05 * max(0, features["fan_in"] - 2))
+    if features["dependency_bytes"] > 20000:
+        score += 0.1
+    return round(min(1.0, max(0.0, score)), 3)
+
+
+def _parse_tool_id_list(response_text: str) -> list[str] | None:
+    """Parse a tool selection answer given either as {"tool_ids": [...]} or a bare array."""
+
+    text = response_text.strip()
+    array_match = re.search(r"\[.*\]", text, re.DOTALL)
+    try:
+        if text.startswith("[") and array_match:
+            parsed: Any = json.loads(array_match.group(0))
+        else:
+            parsed = json.loads(clean_json_response(text)).get("tool_ids")
+    except (json.JSONDecodeError, AttributeError):
+        return None
+    if not isinstance(parsed, list):
+        return None
+    return [str(tool_id) for tool_id in parsed]
+
+
+_APPROX_CHARS_PER_TOKEN = 4
+
+
+def _identifier_key(value: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", value.lower())
+
+
+def _truncate_to_token_budget(text: str, budget: int) -> str:
+    """Cut text to roughly ``budget`` tokens at a word boundary (0 keeps it whole)."""
+
+    limit = budget * _APPROX_CHARS_PER_TOKEN
+    if budget <= 0 or len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0].rstrip(" ,;:-")
+    return f"{cut}…"
+
+
+def _split_sentences(text: str) -> list[str]:
+    return [part.strip() for part in re.split(r"(?<=[.!?])\s+", text.strip()) if part.strip()]
+
+
+def _encode_tool_catalog(
+    tools: list[dict[str, Any]], description_token_budget: int = 0
+) -> str:
+    """Encode tool summaries as compact JSON for planning and tool selection prompts.
+
+    Names that merely restate the tool id are dropped, sentences repeated across at
+    least half of the catalog are emitted once under ``shared_description``, and
+    the remaining description is cut to ``description_token_budget`` tokens.
+    """
+
+    sentences_per_tool: list[list[str]] = []
+    sentence_counts: collections.Counter[str] = collections.Counter()
+    for tool in tools:
+        sentences = list(
+            dict.fromkeys(_split_sentences(str(tool.get("tool_description") or "")))
+        )
+        sentences_per_tool.append(sentences)
+        sentence_counts.update(sentences)
+
+    threshold = max(2, (len(tools) + 1) // 2)
+    shared = [sentence for sentence, count in sentence_counts.items() if count >= threshold]
+
+    entries: list[dict[str, str]] = []
+    for tool, sentences in zip(tools, sentences_per_tool):
+        tool_id = str(tool["tool_id"])
+        entry = {"tool_id": tool_id}
+        name = str(tool.get("tool_name") or "")
+        if name and _identifier_key(name) != _identifier_key(tool_id):
+            entry["name"] = name
+        description = _truncate_to_token_budget(
+            " ".join(s for s in sentences if s not in shared), description_token_budget
+        )
+        if description:
+            entry["description"] = description
+        entries.append(entry)
+
+    payload: Any = (
+        {"shared_description": " ".join(shared), "tools": entries} if shared else entries
+    )
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+def _bm25_terms(text: str) -> list[str]:
+    return [
+        term
+        for term in re.findall(r"[a-z0-9]+", text.lower())
+        if term not in _SHORT_LABEL_STOPWORDS
+    ]
+
+
+def _tool_spec_text(specs: Any) -> str:
+    """Flatten function specs (names, descriptions, parameter names) into index text."""
+
+    parts: list[str] = []
+    for spec in specs if isinstance(specs, list) else []:
+        if not isinstance(spec, dict):
+            continue
+        parts.append(str(spec.get("name") or ""))
+        parts.append(str(spec.get("description") or ""))
+        properties = (spec.get("parameters") or {}).get("properties") or {}
+        for param_name, param in properties.items():
+            parts.append(str(param_name))
+            if isinstance(param, dict):
+                parts.append(str(param.get("description") or ""))
+    return " ".join(part for part in parts if part)
+
+
+class _ToolRetrievalIndex:
+    """In-process BM25 inverted index over the tool catalog.
+
+    Documents combine the tool id, name, description and (optionally) the function
+    specs of each tool. The index is immutable; callers rebuild it when
+    ``fingerprint`` of the catalog changes.
+    """
+
+    def __init__(
+        self,
+        catalog: list[Any],
+        include_specs: bool = True,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> None:
+        self.fingerprint = self.catalog_fingerprint(catalog, include_specs)
+        self.summaries: list[dict[str, Any]] = [
+            {
+                "tool_id": tool.id,
+                "tool_name": tool.name,
+                "tool_description": tool.meta.description,
+            }
+            for tool in catalog
+        ]
+        self._postings: dict[str, list[tuple[int, int]]] = {}
+        self._lengths: list[int] = []
+        for index, tool in enumerate(catalog):
+            text = " ".join(
+                [str(tool.id), str(tool.name), str(tool.meta.description or "")]
+                + ([_tool_spec_text(getattr(tool, "specs", None))] if include_specs else [])
+            )
+            terms = _bm25_terms(text)
+            self._lengths.append(len(terms))
+            for term, tf in collections.Counter(terms).items():
+                self._postings.setdefault(term, []).append((index, tf))
+        self._average_length = (
+            sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+        ) or 1.0
+        self._k1 = k1
+        self._b = b
+
+    @staticmethod
+    def catalog_fingerprint(catalog: list[Any], include_specs: bool = True) -> str:
+        entries = [
+            [
+                str(tool.id),
+                str(tool.name),
+                str(tool.meta.description or ""),
+                getattr(tool, "specs", None) if include_specs else None,
+            ]
+            for tool in catalog
+        ]
+        return hashlib.sha256(
+            json.dumps(entries, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.summaries)
+
+    def scores(self, query: str) -> dict[int, float]:
+        """Return BM25 scores of the tools matching any query term, keyed by catalog position."""
+
+        total = len(self._lengths)
+        scores: dict[int, float] = {}
+        for term in set(_bm25_terms(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, tf in postings:
+                norm = 1 - self._b + self._b * self._lengths[index] / self._average_length
+                scores[index] = scores.get(index, 0.0) + idf * tf * (self._k1 + 1) / (
+                    tf + self._k1 * norm
+                )
+        return scores
+
+    def query(self, query: str, top_k: int) -> list[dict[str, Any]]:
+        """Return the ``top_k`` tool summaries ranked for ``query``; ties keep catalog order.
+
+        Tools without any matching term fill the remaining slots in catalog order.
+        """
+
+        scores = self.scores(query)
+        ranked = sorted(scores, key=lambda index: (-scores[index], index))
+        if len(ranked) < top_k:
+            matched = set(ranked)
+            ranked += [i for i in range(len(self.summaries)) if i not in matched]
+        return [self.summaries[index] for index in ranked[:top_k]]
+
+
 def _clean_inline_text(value: str) -> str:
     """Normalize whitespace for inline rendering."""
 
@@ -493,6 +828,502 @@ def parse_llm_response(
     return content, tool_calls, response_dict
 
 
+def _resolve_action_references(
+    params: dict[str, Any], action_results: dict[str, dict[str, str]]
+) -> dict[str, Any]:
+    """Recursively resolve @action_id references in tool parameters"""
+    logger.info(f"resolve_action_references called with params: {params}")
+    logger.info(f"Available action_results keys: {list(action_results.keys())}")
+    resolved_params: dict[str, Any] = {}
+    for key, value in params.items():
+        if isinstance(value, str):
+            logger.info(f"Processing string parameter '{key}' with value: {value}")
+
+            # Check if this is a pure @action_id reference (no other content)
+            if value.startswith("@") and re.match(r"^@[a-zA-Z0-9_-]+$", value):
+                action_id = value[1:]
+                logger.info(f"Found direct @action_id reference: {action_id}")
+                if action_id in action_results:
+                    resolved_params[key] = action_results[action_id].get(
+                        "primary_output", ""
+                    )
+                    logger.info(
+                        f"Resolved @{action_id} reference in parameter '{key}'"
+                    )
+                else:
+                    resolved_params[key] = value
+                    logger.warning(
+                        f"Action ID '{action_id}' not found for reference in parameter '{key}'"
+                    )
+            else:
+                # Look for embedded @action_id references in the string
+                pattern = r"@([a-zA-Z0-9_-]+)"
+                matches = re.findall(pattern, value)
+                logger.info(
+                    f"Looking for embedded @action_id references in '{value}', found matches: {matches}"
+                )
+
+                if matches:
+                    resolved_value = value
+                    for match in matches:
+                        action_id = match
+                        if action_id in action_results:
+                            replacement = action_results[action_id].get(
+                                "primary_output", ""
+                            )
+                            resolved_value = resolved_value.replace(
+                                f"@{action_id}", replacement
+                            )
+                            logger.info(
+                                f"Resolved embedded @{action_id} reference in string parameter '{key}'"
+                            )
+                        else:
+                            logger.warning(
+                                f"Embedded action ID '{action_id}' not found in string parameter '{key}'"
+                            )
+                    resolved_params[key] = resolved_value
+                else:
+                    resolved_params[key] = value
+        elif isinstance(value, dict):
+            resolved_params[key] = _resolve_action_references(value, action_results)  # type: ignore
+        elif isinstance(value, list):
+            resolved_list: list[Any] = []
+            for item in value:
+                if isinstance(item, str) and item.startswith("@"):
+                    action_id = item[1:]
+                    if action_id in action_results:
+                        resolved_list.append(
+                            action_results[action_id].get("primary_output", "")
+                        )
+                        logger.info(
+                            f"Resolved @{action_id} reference in list parameter '{key}'"
+                        )
+                    else:
+                        resolved_list.append(item)
+                        logger.warning(
+                            f"Action ID '{action_id}' not found for reference in list parameter '{key}'"
+                        )
+                elif isinstance(item, dict):
+                    resolved_list.append(
+                        _resolve_action_references(item, action_results)  # type: ignore
+                    )
+                else:
+                    resolved_list.append(item)
+            resolved_params[key] = resolved_list
+        else:
+            resolved_params[key] = value
+    return resolved_params
+
+
+def _tool_call_signature(tool_call: dict[str, Any]) -> tuple[str, str]:
+    """Return a (name, canonical arguments) key used to detect repeated tool calls."""
+
+    function = tool_call.get("function", {})
+    arguments = function.get("arguments") or "{}"
+    if isinstance(arguments, str):
+        try:
+            arguments = json.loads(arguments)
+        except json.JSONDecodeError:
+            return str(function.get("name")), arguments.strip()
+    return str(function.get("name")), json.dumps(arguments, sort_keys=True, default=str)
+
+
+def _messages_char_count(messages: list[dict[str, Any]]) -> int:
+    """Approximate prompt size as the total characters of message contents."""
+
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            total += len(content)
+        elif content is not None:
+            total += len(json.dumps(content, default=str))
+        if message.get("tool_calls"):
+            total += len(json.dumps(message["tool_calls"], default=str))
+    return total
+
+
+def _params_contain_references(params: dict[str, Any]) -> bool:
+    """Return True when any (nested) string parameter still carries an '@' marker."""
+
+    for value in params.values():
+        if isinstance(value, str) and "@" in value:
+            return True
+        if isinstance(value, dict) and _params_contain_references(value):
+            return True
+    return False
+
+
+_DEFAULT_ACTION_LATENCY_ESTIMATES: dict[str, float] = {
+    "tool": 30.0,
+    "text": 45.0,
+    "code": 60.0,
+}
+_FALLBACK_ACTION_LATENCY_ESTIMATE = 45.0
+
+
+def _compute_critical_path_lengths(
+    actions: list["Action"], weights: dict[str, float]
+) -> dict[str, float]:
+    """Return, for each action, the weighted length of its longest remaining dependency chain."""
+
+    known_ids = {action.id for action in actions}
+    dependents: dict[str, list[str]] = {action.id: [] for action in actions}
+    for action in actions:
+        for dep in action.dependencies:
+            if dep in known_ids and dep != action.id:
+                dependents[dep].append(action.id)
+
+    lengths: dict[str, float] = {}
+    visiting: set[str] = set()
+
+    def visit(action_id: str) -> float:
+        if action_id in lengths:
+            return lengths[action_id]
+        if action_id in visiting:
+            # Cycles are reported elsewhere; do not let them recurse forever here.
+            return 0.0
+        visiting.add(action_id)
+        downstream = max(
+            (visit(child) for child in dependents.get(action_id, [])), default=0.0
+        )
+        visiting.discard(action_id)
+        lengths[action_id] = weights.get(action_id, 0.0) + downstream
+        return lengths[action_id]
+
+    for action in actions:
+        visit(action.id)
+
+    return lengths
+
+
+class _ReadyQueue:
+    """Indegree-counting ready queue over plan actions, ordered by dispatch priority.
+
+    The dependency graph is indexed once; completing an action only touches its
+    outgoing edges, so readiness never requires rescanning the whole plan.
+    """
+
+    def __init__(
+        self,
+        actions: list["Action"],
+        priorities: dict[str, float] | None = None,
+        completed: set[str] | None = None,
+    ) -> None:
+        done = set(completed or ())
+        self._actions = {action.id: action for action in actions}
+        self._positions = {action.id: index for index, action in enumerate(actions)}
+        self._priorities = priorities or {}
+        self._dependents: dict[str, list[str]] = {action.id: [] for action in actions}
+        self._remaining: dict[str, int] = {}
+        self._heap: list[tuple[float, int, str]] = []
+
+        for action in actions:
+            if action.id in done:
+                continue
+            dependencies = set(action.dependencies) - done
+            self._remaining[action.id] = len(dependencies)
+            for dep in dependencies:
+                if dep in self._dependents:
+                    self._dependents[dep].append(action.id)
+
+        for action_id, remaining in self._remaining.items():
+            if remaining == 0:
+                self._push(action_id)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _push(self, action_id: str) -> None:
+        heapq.heappush(
+            self._heap,
+            (
+                -self._priorities.get(action_id, 0.0),
+                self._positions[action_id],
+                action_id,
+            ),
+        )
+
+    def pop(self) -> "Action | None":
+        """Return the highest-priority ready action, or None when nothing is ready."""
+
+        if not self._heap:
+            return None
+        _, _, action_id = heapq.heappop(self._heap)
+        return self._actions[action_id]
+
+    def requeue(self, action_id: str) -> None:
+        """Make an action that was popped but not run ready again."""
+
+        self._push(action_id)
+
+    def mark_done(self, action_id: str) -> list[str]:
+        """Release the dependents of a finished action and return those that became ready."""
+
+        released: list[str] = []
+        for child_id in self._dependents.get(action_id, []):
+            self._remaining[child_id] -= 1
+            if self._remaining[child_id] == 0:
+                self._push(child_id)
+                released.append(child_id)
+        return released
+
+
+_TEMPLATE_PLACEHOLDER_PATTERN = r"\{([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+)*)\}"
+
+_TEMPLATE_CODE_PATTERNS = (
+    (r"<[a-zA-Z][^>]*>", "HTML tags"),
+    (r"def\s+\w+\s*\(", "Python function definitions"),
+    (r"class\s+\w+\s*[:\(]", "Python class definitions"),
+    (r"import\s+\w+", "Python imports"),
+    (r"function\s+\w+\s*\(", "JavaScript functions"),
+    (r"<!DOCTYPE", "HTML DOCTYPE declarations"),
+    (r"<\?xml", "XML declarations"),
+)
+
+
+def _find_dependency_cycles(actions: list["Action"]) -> list[list[str]]:
+    """Return one representative path for every dependency cycle among the actions."""
+
+    graph: dict[str, list[str]] = {}
+    for action in actions:
+        graph.setdefault(action.id, [])
+    for action in actions:
+        graph[action.id].extend(dep for dep in action.dependencies if dep in graph)
+
+    state: dict[str, int] = {}  # 1 = on the current path, 2 = fully explored
+    path: list[str] = []
+    cycles: list[list[str]] = []
+    seen: set[frozenset[str]] = set()
+
+    def visit(node: str) -> None:
+        state[node] = 1
+        path.append(node)
+        for dep in graph[node]:
+            if state.get(dep) == 1:
+                cycle = path[path.index(dep) :] + [dep]
+                key = frozenset(cycle)
+                if key not in seen:
+                    seen.add(key)
+                    cycles.append(cycle)
+            elif dep not in state:
+                visit(dep)
+        path.pop()
+        state[node] = 2
+
+    for node in graph:
+        if node not in state:
+            visit(node)
+
+    return cycles
+
+
+def _analyze_dependency_graph(actions: list["Action"]) -> dict[str, Any]:
+    """Run Kahn's algorithm over action dependencies and report what cannot execute.
+
+    Returns the executable ``order``, ``missing`` dependency ids per action, the
+    dependency ``cycles`` found among the leftovers and every ``blocked`` action id
+    (cycle members, actions with missing dependencies and everything downstream).
+    """
+
+    known_ids = {action.id for action in actions}
+    missing: dict[str, list[str]] = {}
+    indegree: dict[str, int] = {}
+    dependents: dict[str, list[str]] = {action.id: [] for action in actions}
+    for action in actions:
+        dependencies = list(dict.fromkeys(action.dependencies))
+        unknown = [dep for dep in dependencies if dep not in known_ids]
+        if unknown:
+            missing[action.id] = unknown
+        known = [dep for dep in dependencies if dep in known_ids]
+        indegree[action.id] = len(known)
+        for dep in known:
+            dependents[dep].append(action.id)
+
+    queue = collections.deque(
+        action.id
+        for action in actions
+        if indegree[action.id] == 0 and action.id not in missing
+    )
+    order: list[str] = []
+    while queue:
+        current = queue.popleft()
+        order.append(current)
+        for child in dependents[current]:
+            indegree[child] -= 1
+            if indegree[child] == 0 and child not in missing:
+                queue.append(child)
+
+    executable = set(order)
+    leftovers = [action for action in actions if action.id not in executable]
+    return {
+        "order": order,
+        "missing": missing,
+        "cycles": _find_dependency_cycles(leftovers),
+        "blocked": list(dict.fromkeys(action.id for action in leftovers)),
+    }
+
+
+def _break_dependency_cycles(actions: list["Action"]) -> list[tuple[str, str]]:
+    """Drop one edge per dependency cycle until the graph is acyclic.
+
+    The dropped edge is the one pointing furthest forward in plan order, which is
+    usually the dependency the planner added by mistake. Returns the dropped
+    ``(action_id, dependency_id)`` pairs.
+    """
+
+    positions: dict[str, int] = {}
+    for index, action in enumerate(actions):
+        positions.setdefault(action.id, index)
+    by_id = {action.id: action for action in actions}
+    dropped: list[tuple[str, str]] = []
+
+    while True:
+        cycles = _find_dependency_cycles(actions)
+        if not cycles:
+            return dropped
+        cycle = cycles[0]
+        edges = list(zip(cycle, cycle[1:]))
+        action_id, dep = max(
+            edges, key=lambda edge: positions[edge[1]] - positions[edge[0]]
+        )
+        owner = by_id[action_id]
+        owner.dependencies = [d for d in owner.dependencies if d != dep]
+        dropped.append((action_id, dep))
+
+
+def _validate_plan_structure(
+    plan: "Plan", known_tool_ids: set[str] | None = None
+) -> tuple[list[str], list[str]]:
+    """Check a parsed plan's structure in one pass and repair what needs no LLM.
+
+    Trivially fixable problems (final_synthesis out of position, dependencies on
+    final_synthesis or on ids that do not exist, unknown tool_ids, template
+    references missing from final_synthesis' dependencies) are repaired in place.
+    Everything else is collected so a single correction round can address all of it.
+    Actions that final_synthesis does not depend on are only logged.
+
+    Returns ``(errors, repairs)`` as human-readable messages.
+    """
+
+    errors: list[str] = []
+    repairs: list[str] = []
+
+    ids = [action.id for action in plan.actions]
+    id_set = set(ids)
+    duplicates = sorted({action_id for action_id in ids if ids.count(action_id) > 1})
+    if duplicates:
+        errors.append(
+            f"Action ids must be unique. Duplicated ids: {duplicates}."
+        )
+
+    final_index = next(
+        (i for i, action in enumerate(plan.actions) if action.id == "final_synthesis"),
+        None,
+    )
+    if final_index is not None and final_index != len(plan.actions) - 1:
+        plan.actions.append(plan.actions.pop(final_index))
+        repairs.append(
+            f"Moved 'final_synthesis' from position {final_index + 1} to the end of the plan."
+        )
+
+    for action in plan.actions:
+        kept: list[str] = []
+        dropped: list[str] = []
+        for dep in action.dependencies:
+            if dep in kept:
+                continue
+            if dep == action.id or dep not in id_set or (
+                dep == "final_synthesis" and action.id != "final_synthesis"
+            ):
+                dropped.append(dep)
+                continue
+            kept.append(dep)
+        if dropped:
+            repairs.append(
+                f"Dropped invalid dependencies {dropped} from action '{action.id}'."
+            )
+        action.dependencies = kept
+
+        if known_tool_ids and action.tool_ids:
+            unknown_tools = [t for t in action.tool_ids if t not in known_tool_ids]
+            if unknown_tools:
+                action.tool_ids = [t for t in action.tool_ids if t in known_tool_ids]
+                repairs.append(
+                    f"Removed unknown tool_ids {unknown_tools} from action '{action.id}'."
+                )
+
+    final_synthesis = plan.actions[-1] if final_index is not None else None
+    if final_synthesis is not None:
+        template = final_synthesis.description or ""
+        placeholders = re.findall(_TEMPLATE_PLACEHOLDER_PATTERN, template)
+
+        nested = [p for p in placeholders if "." in p]
+        if nested:
+            errors.append(
+                f"Template contains invalid nested placeholders: {nested}. "
+                f"Use simple {{action_id}} format only, not {{action_id.field}} or {{action_id.output.field}}."
+            )
+
+        for pattern, description in _TEMPLATE_CODE_PATTERNS:
+            if re.search(pattern, template):
+                errors.append(
+                    f"Template contains {description}. Templates should not contain code. "
+                    f"Create a separate action to generate code and reference it with {{action_id}}."
+                )
+                break
+
+        simple = list(dict.fromkeys(p for p in placeholders if "." not in p))
+        missing = [p for p in simple if p not in id_set]
+        if missing:
+            errors.append(
+                f"Template references non-existent actions: {missing}. "
+                f"All placeholders must reference valid action IDs."
+            )
+
+        unlisted = [
+            p
+            for p in simple
+            if p in id_set
+            and p != "final_synthesis"
+            and p not in final_synthesis.dependencies
+        ]
+        if unlisted:
+            final_synthesis.dependencies.extend(unlisted)
+            repairs.append(
+                f"Added template references {unlisted} to final_synthesis dependencies."
+            )
+
+    for cycle in _find_dependency_cycles(plan.actions):
+        errors.append(f"Dependency cycle detected: {' -> '.join(reversed(cycle))}.")
+
+    if final_synthesis is not None:
+        edges: dict[str, list[str]] = {}
+        for action in plan.actions:
+            edges.setdefault(action.id, []).extend(action.dependencies)
+        reachable: set[str] = set()
+        stack = ["final_synthesis"]
+        while stack:
+            current = stack.pop()
+            if current in reachable:
+                continue
+            reachable.add(current)
+            stack.extend(edges.get(current, []))
+        unreachable = [
+            action_id
+            for action_id in dict.fromkeys(ids)
+            if action_id not in reachable
+        ]
+        if unreachable:
+            # Leaves such as "save to vault" steps are legitimate side effects.
+            logger.warning(
+                f"Actions {unreachable} do not contribute to 'final_synthesis'; "
+                f"they still run but their output is not part of the deliverable."
+            )
+
+    return errors, repairs
+
+
 class UserAbortedException(Exception):
     """Custom exception for when user aborts plan execution"""
 
@@ -501,6 +1332,10 @@ class UserAbortedException(Exception):
         super().__init__(message)
 
 
+class _SpeculationNeedsUser(Exception):
+    """Raised when a speculative run would have to ask the user something"""
+
+
 class PlanExecutionAbortedException(Exception):
     """Custom exception for when plan execution is aborted gracefully"""
 
@@ -508,6 +1343,716 @@ class PlanExecutionAbortedException(Exception):
         super().__init__(message)
 
 
+class _ToolRegistry:
+    """Run-scoped cache of the Open WebUI tool catalog and resolved tool callables.
+
+    Each distinct set of tool ids is resolved through ``get_tools`` once and then
+    shared by every action and retry of the run. Concurrent requests for the same
+    set await the same pending resolution.
+    """
+
+    def __init__(self) -> None:
+        self._catalog: list[Any] | None = None
+        self._resolved: dict[frozenset[str], asyncio.Future[dict[str, Any]]] = {}
+
+    def catalog(self) -> list[Any]:
+        """Return the tool models visible to the planner, loading them on first use."""
+
+        if self._catalog is None:
+            self._catalog = list(Tools.get_tools())
+        return self._catalog
+
+    async def resolve(
+        self,
+        tool_ids: list[str],
+        loader: Callable[[list[str]], Awaitable[dict[str, Any]]],
+    ) -> dict[str, Any]:
+        """Return tool specs and callables for ``tool_ids``, loading them at most once."""
+
+        key = frozenset(tool_ids)
+        pending = self._resolved.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(loader(sorted(key)))
+            self._resolved[key] = pending
+
+        try:
+            tools = await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if self._resolved.get(key) is pending:
+                del self._resolved[key]
+            raise
+
+        return dict(tools)
+
+    def invalidate(self, tool_ids: list[str] | None = None) -> None:
+        """Drop cached resolutions; without ``tool_ids`` the catalog is dropped as well."""
+
+        if tool_ids is None:
+            self._catalog = None
+            self._resolved.clear()
+            return
+
+        requested = set(tool_ids)
+        for key in [key for key in self._resolved if key & requested]:
+            del self._resolved[key]
+
+
+class RunContext:
+    """Per-request state of a single planner run.
+
+    Open WebUI reuses one Pipe instance for every request, so the requesting user,
+    the request object and the event callbacks are kept here instead of on the Pipe.
+    The active context is bound to a ContextVar, which asyncio copies into every task
+    spawned during the run.
+    """
+
+    def __init__(
+        self,
+        user: Any = None,
+        request: Any = None,
+        user_info: dict[str, Any] | Any = None,
+        event_emitter: Callable[[dict[str, Any]], Awaitable[None]] | None = None,
+        event_call: Callable[[dict[str, Any]], Awaitable[Any]] | None = None,
+        model: str = "",
+    ) -> None:
+        self.user = user
+        self.request = request
+        self.user_info = user_info
+        self.event_emitter = event_emitter
+        self.event_call = event_call
+        self.model = model
+        self.emitted_messages: list[str] = []
+        self.tool_registry = _ToolRegistry()
+        self.journal: _RunJournal | None = None
+        self.validation_semaphore: asyncio.Semaphore | None = None
+        self.reflection_batcher: _ReflectionBatcher | None = None
+
+
+_CURRENT_RUN_CONTEXT: contextvars.ContextVar[RunContext | None] = (
+    contextvars.ContextVar("planner_run_context", default=None)
+)
+
+# Set by execute_plan for the task running an action; execute_action reports each
+# parsed output through it before the output is judged.
+_PROVISIONAL_OUTPUT_CALLBACK: contextvars.ContextVar[
+    Callable[["Action", dict[str, Any]], None] | None
+] = contextvars.ContextVar("planner_provisional_output_callback", default=None)
+
+# Set by execute_plan for speculative runs: chat messages are collected here and
+# only emitted once the run is committed.
+_SPECULATIVE_MESSAGES: contextvars.ContextVar[list[str] | None] = (
+    contextvars.ContextVar("planner_speculative_messages", default=None)
+)
+
+# Set by execute_plan for the task running an action; user dialogs add the time
+# spent waiting for an answer so it can be left out of latency estimates.
+_USER_WAIT_SECONDS: contextvars.ContextVar[list[float] | None] = (
+    contextvars.ContextVar("planner_user_wait_seconds", default=None)
+)
+
+_LLM_CACHE_BYPASS: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "planner_llm_cache_bypass", default=False
+)
+
+
+class _bypass_llm_cache:
+    """Context manager that keeps get_completion calls inside it out of the response cache.
+
+    Used around creative calls, such as action execution, whose answer should be
+    generated fresh even when the exact same prompt was seen before. Such calls are
+    not coalesced with identical in-flight requests either.
+    """
+
+    def __enter__(self) -> None:
+        self._token = _LLM_CACHE_BYPASS.set(True)
+
+    def __exit__(self, *_exc: Any) -> None:
+        _LLM_CACHE_BYPASS.reset(self._token)
+
+
+def _canonical_request_hash(form_data: dict[str, Any], user_id: str = "") -> str:
+    """Hash the parts of a chat completion request that determine its answer.
+
+    The requesting user is part of the key: the backend call runs with that user's
+    model access checks and is billed to them, so it is never shared across users.
+    """
+
+    canonical = json.dumps(
+        {
+            "user": user_id,
+            "model": form_data.get("model"),
+            "messages": form_data.get("messages"),
+            "tools": form_data.get("tools"),
+            "response_format": form_data.get("response_format"),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _SingleFlight:
+    """Coalesce concurrent calls that share a key into a single execution.
+
+    The first caller for a key (the leader) runs the call; callers arriving while it is
+    in flight await the same result instead of issuing their own. If the leader is
+    cancelled, waiting followers retry and one of them becomes the new leader.
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: dict[str, asyncio.Future[Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "in_flight": len(self._in_flight),
+        }
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            pending = self._in_flight.get(key)
+            if pending is None:
+                break
+            self.hits += 1
+            try:
+                return copy.deepcopy(await asyncio.shield(pending))
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                self.hits -= 1
+                logger.debug("Coalesced LLM request lost its leader, retrying")
+
+        self.misses += 1
+        future: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when no follower is waiting for it.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+
+class _LLMResponseCache:
+    """SQLite-backed store of chat completion payloads with TTL and LRU eviction.
+
+    Every operation opens its own connection so the cache can be used from worker
+    threads (see asyncio.to_thread) without sharing a connection between them.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, payload TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str, ttl_seconds: float = 0) -> dict[str, Any] | None:
+        now = time.time()
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT payload, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            payload, created_at = row
+            if ttl_seconds and ttl_seconds > 0 and now - created_at > ttl_seconds:
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        try:
+            return json.loads(payload)
+        except json.JSONDecodeError:
+            return None
+
+    def put(self, key: str, payload: dict[str, Any], max_entries: int = 0) -> None:
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, payload, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(payload, default=str), now, now),
+            )
+            if max_entries and max_entries > 0:
+                connection.execute(
+                    "DELETE FROM responses WHERE key NOT IN ("
+                    "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT ?)",
+                    (max_entries,),
+                )
+
+    def __len__(self) -> int:
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def _normalize_goal(goal: str) -> str:
+    return re.sub(r"\s+", " ", goal.strip().lower())
+
+
+def _goal_shingles(normalized_goal: str, size: int = 3) -> set[str]:
+    """Word n-gram shingles of a normalized goal (the words themselves for short goals)."""
+
+    tokens = re.findall(r"\w+", normalized_goal)
+    if len(tokens) < size:
+        return set(tokens)
+    return {" ".join(tokens[i : i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def _jaccard(first: set[str], second: set[str]) -> float:
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+# Valves that change what create_plan and its validation passes produce; only these
+# are part of a cached plan's context key.
+_PLANNING_VALVES = frozenset(
+    {
+        "MODEL",
+        "ACTION_MODEL",
+        "WRITER_MODEL",
+        "CODER_MODEL",
+        "ENABLE_TOOL_INTEGRATION",
+        "ENABLE_LIGHTWEIGHT_CONTEXT_OPTIMIZATION",
+        "BATCH_TOOL_SELECTION",
+        "TOOL_DESCRIPTION_TOKEN_BUDGET",
+        "TOOL_CATALOG_TOP_K",
+        "TOOL_INDEX_INCLUDE_SPECS",
+        "LIGHTWEIGHT_ACCEPT_THRESHOLD",
+        "LIGHTWEIGHT_REJECT_THRESHOLD",
+        "BATCH_LIGHTWEIGHT_CLASSIFICATION",
+    }
+)
+
+
+class _PlanCache:
+    """In-memory per-user cache of validated plans with TTL and LRU eviction.
+
+    Entries are scoped by a context key (tool catalog fingerprint plus planning
+    valves) so a plan is never reused after the tools or models it was built for change.
+    """
+
+    def __init__(self) -> None:
+        self._entries: "collections.OrderedDict[str, dict[str, Any]]" = (
+            collections.OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _key(user_id: str, context_key: str, normalized_goal: str) -> str:
+        return hashlib.sha256(
+            f"{user_id}\n{context_key}\n{normalized_goal}".encode("utf-8")
+        ).hexdigest()
+
+    def _expire(self, ttl_seconds: float) -> None:
+        if not ttl_seconds or ttl_seconds <= 0:
+            return
+        cutoff = time.time() - ttl_seconds
+        for key in [k for k, e in self._entries.items() if e["created_at"] < cutoff]:
+            del self._entries[key]
+
+    def get(
+        self,
+        user_id: str,
+        context_key: str,
+        goal: str,
+        ttl_seconds: float = 0,
+        similarity_threshold: float = 0,
+    ) -> tuple[dict[str, Any], float] | None:
+        """Return (plan data, similarity) for an exact or near-duplicate goal."""
+
+        self._expire(ttl_seconds)
+        normalized = _normalize_goal(goal)
+        key = self._key(user_id, context_key, normalized)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return copy.deepcopy(self._entries[key]["plan"]), 1.0
+
+        if not similarity_threshold or similarity_threshold <= 0:
+            return None
+        shingles = _goal_shingles(normalized)
+        best_key, best_score = None, 0.0
+        for entry_key, entry in self._entries.items():
+            if entry["user_id"] != user_id or entry["context_key"] != context_key:
+                continue
+            score = _jaccard(shingles, entry["shingles"])
+            if score > best_score:
+                best_key, best_score = entry_key, score
+        if best_key is None or best_score < similarity_threshold:
+            return None
+        self._entries.move_to_end(best_key)
+        return copy.deepcopy(self._entries[best_key]["plan"]), best_score
+
+    def put(
+        self,
+        user_id: str,
+        context_key: str,
+        goal: str,
+        plan_data: dict[str, Any],
+        max_entries: int = 0,
+    ) -> None:
+        normalized = _normalize_goal(goal)
+        key = self._key(user_id, context_key, normalized)
+        self._entries[key] = {
+            "user_id": user_id,
+            "context_key": context_key,
+            "shingles": _goal_shingles(normalized),
+            "plan": copy.deepcopy(plan_data),
+            "created_at": time.time(),
+        }
+        self._entries.move_to_end(key)
+        while max_entries and max_entries > 0 and len(self._entries) > max_entries:
+            self._entries.popitem(last=False)
+
+
+class _ReflectionCache:
+    """Content-addressed LRU cache of output evaluations.
+
+    Keys hash everything the verdict depends on (goal, action description, tool
+    usage and results, the whitespace-normalized output and the judge models), so
+    identical outputs are never judged twice.
+    """
+
+    def __init__(self) -> None:
+        self._entries: "collections.OrderedDict[str, dict[str, Any]]" = (
+            collections.OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(
+        goal: str,
+        description: str,
+        tool_ids: list[str],
+        tool_calls: list[str],
+        tool_results: dict[str, Any],
+        output: str,
+        tools_enabled: bool,
+        judge_models: list[str],
+    ) -> str:
+        normalized_output = re.sub(r"\s+", " ", output or "").strip()
+        return hashlib.sha256(
+            json.dumps(
+                [
+                    goal,
+                    description,
+                    tool_ids,
+                    tool_calls,
+                    tool_results,
+                    normalized_output,
+                    tools_enabled,
+                    judge_models,
+                ],
+                ensure_ascii=False,
+                sort_keys=True,
+                default=str,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(entry)
+
+    def put(self, key: str, reflection: dict[str, Any], max_entries: int) -> None:
+        self._entries[key] = copy.deepcopy(reflection)
+        self._entries.move_to_end(key)
+        while len(self._entries) > max(0, max_entries):
+            self._entries.popitem(last=False)
+
+
+class _PlanTemplate:
+    """A named, parameterized plan loaded from the templates directory."""
+
+    def __init__(self, data: dict[str, Any], source: str) -> None:
+        self.name = str(data.get("name") or os.path.splitext(os.path.basename(source))[0])
+        self.source = source
+        self.description = str(data.get("description", ""))
+        params = data.get("params", {}) or {}
+        # A list declares required parameters; a mapping gives defaults (null = required).
+        self.params: dict[str, Any] = (
+            {str(param): None for param in params}
+            if isinstance(params, list)
+            else {str(key): value for key, value in params.items()}
+        )
+        self.patterns = [
+            re.compile(pattern, re.IGNORECASE) for pattern in data.get("match", []) or []
+        ]
+        self.goal = str(data.get("goal", ""))
+        self.actions: list[dict[str, Any]] = list(data.get("actions", []) or [])
+        if not self.actions:
+            raise ValueError(f"Plan template '{self.name}' ({source}) has no actions")
+
+    def bind(self, values: dict[str, str]) -> tuple[str, list[dict[str, Any]], dict[str, str]]:
+        """Substitute {{param}} slots; placeholders that are not parameters are left intact."""
+
+        bound_params = {
+            key: str(value) for key, value in self.params.items() if value is not None
+        }
+        bound_params.update({key: value for key, value in values.items() if key in self.params})
+        missing = [key for key in self.params if key not in bound_params]
+        if missing:
+            raise ValueError(
+                f"Plan template '{self.name}' is missing parameter(s): {', '.join(missing)}"
+            )
+        pattern = re.compile(
+            r"\{\{\s*(" + "|".join(re.escape(key) for key in self.params) + r")\s*\}\}"
+        ) if self.params else None
+
+        def substitute(value: Any) -> Any:
+            if isinstance(value, str) and pattern is not None:
+                return pattern.sub(lambda match: bound_params[match.group(1)], value)
+            if isinstance(value, list):
+                return [substitute(item) for item in value]
+            if isinstance(value, dict):
+                return {key: substitute(item) for key, item in value.items()}
+            return value
+
+        return substitute(self.goal), substitute(copy.deepcopy(self.actions)), bound_params
+
+
+class _PlanTemplateLibrary:
+    """Plan templates read from JSON (and YAML, when PyYAML is installed) files in a directory."""
+
+    def __init__(self, templates: list[_PlanTemplate]) -> None:
+        self.templates = {template.name: template for template in templates}
+
+    @staticmethod
+    def fingerprint(directory: str) -> tuple[tuple[str, float], ...]:
+        if not os.path.isdir(directory):
+            return ()
+        return tuple(
+            sorted(
+                (entry.name, entry.stat().st_mtime)
+                for entry in os.scandir(directory)
+                if entry.is_file()
+                and entry.name.lower().endswith((".json", ".yaml", ".yml"))
+            )
+        )
+
+    @classmethod
+    def load(cls, directory: str) -> "_PlanTemplateLibrary":
+        templates: list[_PlanTemplate] = []
+        yaml_module = None
+        for file_name, _ in cls.fingerprint(directory):
+            path = os.path.join(directory, file_name)
+            try:
+                with open(path, "r", encoding="utf-8") as handle:
+                    if file_name.lower().endswith(".json"):
+                        data = json.load(handle)
+                    else:
+                        if yaml_module is None:
+                            if importlib.util.find_spec("yaml") is None:
+                                logger.warning(
+                                    f"Skipping plan template {path}: PyYAML is not installed"
+                                )
+                                continue
+                            import yaml as yaml_module  # type: ignore
+                        data = yaml_module.safe_load(handle)
+                templates.append(_PlanTemplate(data or {}, path))
+            except Exception as e:
+                logger.warning(f"Skipping invalid plan template {path}: {e}")
+        return cls(templates)
+
+    def match(self, message: str) -> tuple[_PlanTemplate, dict[str, str]] | None:
+        """Find the template for a message: an explicit `/plan name key=value` prefix or a regex matcher.
+
+        Raises ValueError for an explicit /plan request that cannot be honoured.
+        """
+
+        text = message.strip()
+        if text.lower().startswith("/plan"):
+            tokens = shlex.split(text[len("/plan") :])
+            if not tokens:
+                raise ValueError(
+                    f"Usage: /plan <template> key=value ... (available: {', '.join(sorted(self.templates)) or 'none'})"
+                )
+            template = self.templates.get(tokens[0])
+            if template is None:
+                raise ValueError(
+                    f"Unknown plan template '{tokens[0]}' (available: {', '.join(sorted(self.templates)) or 'none'})"
+                )
+            values: dict[str, str] = {}
+            free_words: list[str] = []
+            for token in tokens[1:]:
+                key, separator, value = token.partition("=")
+                if separator and key in template.params:
+                    values[key] = value
+                else:
+                    free_words.append(token)
+            if free_words:
+                # Bare words fill the first parameter that has not been given.
+                unset = [key for key in template.params if key not in values]
+                if unset:
+                    values[unset[0]] = " ".join(free_words)
+            return template, values
+
+        for template in self.templates.values():
+            for pattern in template.patterns:
+                found = pattern.search(text)
+                if found:
+                    return template, {
+                        key: value.strip()
+                        for key, value in found.groupdict().items()
+                        if value is not None
+                    }
+        return None
+
+
+class _RunJournal:
+    """Append-only JSONL journal of a plan run, used to resume interrupted executions.
+
+    Events are one JSON object per line: a ``plan`` event with the validated plan and
+    its ``created_at`` timestamp, one ``action`` event per completed action and a
+    ``complete`` event once the final synthesis has been produced. A journal without
+    ``complete`` can be resumed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    @classmethod
+    def for_goal(cls, directory: str, user_id: str, goal: str) -> "_RunJournal":
+        digest = hashlib.sha256(f"{user_id}\n{goal}".encode("utf-8")).hexdigest()
+        return cls(os.path.join(directory, f"{digest}.jsonl"))
+
+    def read(self) -> list[dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        events: list[dict[str, Any]] = []
+        with open(self.path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn trailing write from a crash; everything before it is usable.
+                    logger.warning(f"Ignoring unreadable journal line in {self.path}")
+                    break
+        return events
+
+    def _write(self, event: dict[str, Any], mode: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, mode, encoding="utf-8") as handle:
+            handle.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def start(self, event: dict[str, Any]) -> None:
+        """Truncate the journal and write its first event."""
+
+        self._write(event, "w")
+
+    def append(self, event: dict[str, Any]) -> None:
+        self._write(event, "a")
+
+
+class _ReflectionBatcher:
+    """Collects output evaluations requested close together and judges them in one call.
+
+    A batch is submitted when the collection window closes, when it holds
+    ``max_items`` items or when the items' combined size reaches ``char_budget``.
+    ``judge_batch`` receives the items and returns one result per item, in order.
+    """
+
+    def __init__(
+        self,
+        judge_batch: Callable[[list[Any]], Awaitable[list[Any]]],
+        window_seconds: float,
+        max_items: int,
+        char_budget: int,
+    ) -> None:
+        self._judge_batch = judge_batch
+        self._window_seconds = window_seconds
+        self._max_items = max(1, max_items)
+        self._char_budget = char_budget
+        self._pending: list[tuple[Any, asyncio.Future[Any]]] = []
+        self._pending_chars = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def submit(self, item: Any, size: int) -> Any:
+        """Queue ``item`` for the next batch and wait for its result."""
+
+        if self._pending and self._char_budget > 0 and (
+            self._pending_chars + size > self._char_budget
+        ):
+            self._flush()
+        future: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        self._pending_chars += size
+        if len(self._pending) >= self._max_items or (
+            self._char_budget > 0 and self._pending_chars >= self._char_budget
+        ):
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self._window_seconds, self._flush
+            )
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_chars = self._pending, [], 0
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[Any, asyncio.Future[Any]]]) -> None:
+        try:
+            results = await self._judge_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
 class Action(BaseModel):
     """Model for a single action in the plan"""
 
@@ -518,7 +2063,7 @@ class Action(BaseModel):
     dependencies: List[str] = Field(default_factory=list)
     tool_ids: Optional[list[str]] = None
     output: Optional[Dict[str, str]] = None
-    status: str = "pending"  # pending, in_progress, completed, failed, warning
+    status: str = "pending"  # pending, in_progress, completed, failed, warning, skipped
     start_time: Optional[str] = None
     end_time: Optional[str] = None
     model: Optional[str] = None
@@ -533,6 +2078,10 @@ class Action(BaseModel):
     tool_results: Dict[str, str] = Field(
         default_factory=dict, description="Results from tool calls, keyed by tool name"
     )
+    tool_turns: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Per-turn timing of the tool-calling loop (tools called, LLM and tool seconds, prompt size)",
+    )
 
 
 class Plan(BaseModel):
@@ -563,11 +2112,42 @@ class ReflectionResult(BaseModel):
     )
 
 
-class Pipe:
-    __current_event_emitter__: Callable[[dict[str, Any]], Awaitable[None]]
-    __user__: User
-    __model__: str
+_REFLECTION_ANALYSIS_FORMAT: dict[str, Any] = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "reflection_analysis",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "is_successful": {"type": "boolean"},
+                "quality_score": {
+                    "type": "number",
+                    "minimum": 0.0,
+                    "maximum": 1.0,
+                },
+                "issues": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                },
+                "suggestions": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                },
+            },
+            "required": [
+                "is_successful",
+                "quality_score",
+                "issues",
+                "suggestions",
+            ],
+            "additionalProperties": False,
+        },
+    },
+}
+
 
+class Pipe:
     _TEXTUAL_CODE_FENCE_LANGUAGES = {"", "markdown", "md", "text", "txt"}
 
     class Valves(BaseModel):
@@ -817,38 +2397,194 @@ EXAMPLE:
 Remember: Metadata = what's available. @action_id = how to get the real content.""",
             description="Additional requirements for actions using lightweight context mode",
         )
-        LIGHTWEIGHT_CONTEXT_NO_TOOL_SUFFIX: str = Field(
-            default="""
-🔍 LIGHTWEIGHT CONTEXT MODE ACTIVE 🔍
-
-CONTEXT LIMITATIONS:
-- You receive metadata about previous actions rather than full content
-- Tool-based substitutions are unavailable, so you must infer or restate needed details manually
-
-WORKING GUIDELINES:
-- Use the metadata and supporting_details to understand what content is available
-- Reference prior outputs explicitly in your response when they are required for continuity
-- Ensure the final message remains complete and comprehensible without relying on hidden content""",
-            description="Additional requirements for lightweight context when tools are disabled",
+        LIGHTWEIGHT_CONTEXT_NO_TOOL_SUFFIX: str = Field(
+            default="""
+🔍 LIGHTWEIGHT CONTEXT MODE ACTIVE 🔍
+
+CONTEXT LIMITATIONS:
+- You receive metadata about previous actions rather than full content
+- Tool-based substitutions are unavailable, so you must infer or restate needed details manually
+
+WORKING GUIDELINES:
+- Use the metadata and supporting_details to understand what content is available
+- Reference prior outputs explicitly in your response when they are required for continuity
+- Ensure the final message remains complete and comprehensible without relying on hidden content""",
+            description="Additional requirements for lightweight context when tools are disabled",
+        )
+        ENABLE_LIGHTWEIGHT_CONTEXT_OPTIMIZATION: bool = Field(
+            default=True,
+            description="Enable automatic lightweight context optimization for appropriate actions",
+        )
+        ENABLE_TOOL_RESULT_TRUNCATION: bool = Field(
+            default=True,
+            description="Enable truncation of tool results when substitutions are used in lightweight context mode",
+        )
+        AUTOMATIC_TAKS_REQUIREMENT_ENHANCEMENT: bool = Field(
+            default=False,
+            description="Use an LLM call to refine the requirements of each ACTION based on the whole PLAN and GOAL before executing an ACTION (uses the ACTION_PROMPT_REQUIREMENTS_TEMPLATE as an example of requirements)",
+        )
+        MAX_RETRIES: int = Field(
+            default=3, description="Maximum number of retry attempts"
+        )
+        CONCURRENT_ACTIONS: int = Field(
+            default=1,
+            description="Maximum number of independent actions executed concurrently as asyncio tasks (1 = sequential execution)",
+        )
+        MAX_PARALLEL_TOOL_CALLS: int = Field(
+            default=4,
+            description="Maximum number of tool calls from a single model turn executed concurrently",
+        )
+        TOOL_CALL_TIMEOUT: int = Field(
+            default=120,
+            description="Timeout for a single tool call (seconds). A timed-out call returns an error result to the model instead of failing the whole step. 0 disables the timeout.",
+        )
+        MAX_TOOL_TURNS: int = Field(
+            default=6,
+            description="Maximum number of tool-calling turns per completion before the model is asked for a final answer without tools (0 = unlimited)",
+        )
+        TOOL_LOOP_CHAR_BUDGET: int = Field(
+            default=200000,
+            description="Character budget for the conversation accumulated by the tool-calling loop; once exceeded the model must answer without further tool calls (0 = unlimited)",
+        )
+        PLAN_TEMPLATES_DIR: str = Field(
+            default="",
+            description="Directory of named plan templates (JSON or YAML files with params, optional regex matchers, actions and a final_synthesis template). A request like '/plan <name> key=value' or a matching message uses the template instead of LLM planning. Empty disables templates.",
+        )
+        PLAN_CACHE_ENABLED: bool = Field(
+            default=False,
+            description="Reuse the validated plan of a previous identical request from the same user instead of planning again (keyed by normalized goal, tool catalog and planning valves)",
+        )
+        PLAN_CACHE_TTL_SECONDS: int = Field(
+            default=86400,
+            description="Age after which a cached plan is discarded (seconds, 0 = never expires)",
+        )
+        PLAN_CACHE_MAX_ENTRIES: int = Field(
+            default=100,
+            description="Maximum number of cached plans; least recently used plans are evicted",
+        )
+        PLAN_CACHE_SIMILARITY_THRESHOLD: float = Field(
+            default=0.0,
+            description="Also reuse a cached plan for near-identical goals whose word-shingle Jaccard similarity reaches this value (e.g. 0.8). Only the plan's goal is replaced; action descriptions and the final template stay as written for the cached goal, so use a high threshold. 0 reuses exact matches only.",
+        )
+        RUN_JOURNAL_DIR: str = Field(
+            default="",
+            description="Directory where each plan run is journaled (plan, completed action outputs, reflections and timings) so an interrupted run can be resumed. Empty disables journaling.",
+        )
+        RESUME_FROM_JOURNAL: bool = Field(
+            default=True,
+            description="When the same user sends the same request again and its journal is incomplete, resume the journaled plan and only run the remaining actions instead of replanning",
+        )
+        RUN_JOURNAL_TTL_SECONDS: int = Field(
+            default=86400,
+            description="Incomplete journals older than this many seconds are not resumed; the request starts a fresh run. Keeps recurring goals such as 'write today's report' from reusing old outputs. 0 resumes journals of any age",
         )
-        ENABLE_LIGHTWEIGHT_CONTEXT_OPTIMIZATION: bool = Field(
+        COALESCE_LLM_REQUESTS: bool = Field(
             default=True,
-            description="Enable automatic lightweight context optimization for appropriate actions",
+            description="Share one backend call between identical planning, validation and evaluation requests of the same user that are in flight at the same time. Action execution calls are never shared",
         )
-        ENABLE_TOOL_RESULT_TRUNCATION: bool = Field(
+        LLM_CACHE_ENABLED: bool = Field(
+            default=False,
+            description="Cache planner LLM responses on disk so identical requests (same model, messages, tools and response format) are answered without calling the model again. Action execution always bypasses the cache so steps and retries are generated fresh.",
+        )
+        LLM_CACHE_PATH: str = Field(
+            default="planner_llm_cache.sqlite3",
+            description="Path of the SQLite file used by the LLM response cache",
+        )
+        LLM_CACHE_TTL_SECONDS: int = Field(
+            default=86400,
+            description="Age after which a cached LLM response is discarded (seconds, 0 = never expires)",
+        )
+        LLM_CACHE_MAX_ENTRIES: int = Field(
+            default=2000,
+            description="Maximum number of cached LLM responses; least recently used entries are evicted (0 = unlimited)",
+        )
+        BATCH_TOOL_SELECTION: bool = Field(
             default=True,
-            description="Enable truncation of tool results when substitutions are used in lightweight context mode",
+            description="Select tools for all tool actions missing tool_ids in a single LLM call (the tool catalog is sent once); actions whose entry is missing or invalid fall back to individual calls",
         )
-        AUTOMATIC_TAKS_REQUIREMENT_ENHANCEMENT: bool = Field(
+        TOOL_DESCRIPTION_TOKEN_BUDGET: int = Field(
+            default=60,
+            description="Approximate token budget for each tool description in planning and tool selection prompts; longer descriptions are cut at a word boundary (0 = no limit)",
+        )
+        TOOL_CATALOG_TOP_K: int = Field(
+            default=0,
+            description="Shortlist the K tools ranked most relevant by the local retrieval index: against the goal for the planner and against each action description for tool selection (0 = send the whole catalog)",
+        )
+        TOOL_INDEX_INCLUDE_SPECS: bool = Field(
+            default=True,
+            description="Index tool function specs (function names, descriptions and parameter names) alongside tool ids, names and descriptions in the tool retrieval index",
+        )
+        LIGHTWEIGHT_ACCEPT_THRESHOLD: float = Field(
+            default=0.75,
+            description="Local lightweight context score at or above which an action is flagged without asking the LLM (score uses dependency fan-in, dependency output size, tool presence and the verbs of the description)",
+        )
+        LIGHTWEIGHT_REJECT_THRESHOLD: float = Field(
+            default=0.35,
+            description="Local lightweight context score at or below which an action keeps full context without asking the LLM; scores between the two thresholds are sent to the LLM",
+        )
+        BATCH_LIGHTWEIGHT_CLASSIFICATION: bool = Field(
+            default=True,
+            description="Classify all lightweight context candidates in a single structured LLM call (one boolean and reason per action); actions missing from the answer are classified individually",
+        )
+        PLAN_VALIDATION_CONCURRENCY: int = Field(
+            default=4,
+            description="Maximum number of concurrent LLM calls made while validating a new plan (tool selection, lightweight context classification, template enhancement)",
+        )
+        CYCLE_BREAKING_POLICY: str = Field(
+            default="skip",
+            description="How execution handles dependency cycles found before a plan runs: 'skip' marks the cyclic actions and everything downstream as skipped, 'break' drops the dependency pointing furthest forward in plan order from each cycle and runs the whole plan",
+        )
+        JUDGE_MODEL: str = Field(
+            default="",
+            description="Model used to evaluate action outputs (empty = ACTION_MODEL). A smaller, cheaper model is usually sufficient",
+        )
+        JUDGE_ESCALATION_MODEL: str = Field(
+            default="",
+            description="Stronger model that re-evaluates outputs when the first verdict is uncertain: its score lands within JUDGE_ESCALATION_MARGIN of JUDGE_PASS_THRESHOLD or contradicts is_successful (empty = never escalate)",
+        )
+        JUDGE_PASS_THRESHOLD: float = Field(
+            default=0.7,
+            description="Quality score separating passing from failing verdicts when deciding whether to escalate",
+        )
+        JUDGE_ESCALATION_MARGIN: float = Field(
+            default=0.1,
+            description="Scores within this distance of JUDGE_PASS_THRESHOLD are escalated to JUDGE_ESCALATION_MODEL",
+        )
+        REFLECTION_BATCH_WINDOW_SECONDS: float = Field(
+            default=0.0,
+            description="Collect output evaluations requested within this many seconds and judge them in one LLM call (0 = evaluate each output on its own)",
+        )
+        REFLECTION_BATCH_MAX_ITEMS: int = Field(
+            default=4,
+            description="Maximum number of action outputs judged in one batched evaluation call",
+        )
+        REFLECTION_BATCH_CHAR_BUDGET: int = Field(
+            default=60000,
+            description="Submit a batched evaluation early once the collected outputs reach this many characters (0 = no limit)",
+        )
+        REFLECTION_CACHE_MAX_ENTRIES: int = Field(
+            default=256,
+            description="Number of output evaluations kept in memory, keyed by a hash of goal, action description, tool usage and normalized output, so identical outputs are never re-judged (0 = disabled)",
+        )
+        SPECULATIVE_EXECUTION_DEPTH: int = Field(
+            default=0,
+            description="Start dependents on an action's output while the LLM evaluator is still judging it, up to this many speculative levels deep (0 = disabled). Speculative runs do not count against CONCURRENT_ACTIONS; they are cancelled and rerun if the parent's final output differs",
+        )
+        SPECULATE_TOOL_ACTIONS: bool = Field(
             default=False,
-            description="Use an LLM call to refine the requirements of each ACTION based on the whole PLAN and GOAL before executing an ACTION (uses the ACTION_PROMPT_REQUIREMENTS_TEMPLATE as an example of requirements)",
+            description="Allow tool actions to run speculatively (tool calls may have side effects that a discarded run cannot undo)",
         )
-        MAX_RETRIES: int = Field(
-            default=3, description="Maximum number of retry attempts"
+        ENABLE_LOCAL_PRE_EVALUATION: bool = Field(
+            default=True,
+            description="Judge mechanically decidable action outputs locally (non-JSON, empty or deferring primary_output, content in supporting_details, expected tools never called) instead of calling the LLM evaluator",
         )
-        CONCURRENT_ACTIONS: int = Field(
-            default=1,
-            description="Maximum concurrent actions (experimental try on your own risk)",
+        PRE_EVALUATION_FAST_ACCEPT_MIN_CHARS: int = Field(
+            default=0,
+            description="Accept well-formed outputs whose primary_output has at least this many characters without the LLM evaluator, for text steps without tools other than final_synthesis (0 = disabled)",
+        )
+        SCHEDULING_POLICY: str = Field(
+            default="critical_path",
+            description="Order in which ready actions are dispatched: 'critical_path' starts the action on the longest remaining dependency chain first (weighted by per-type latency estimates and observed timings), 'plan_order' keeps the declaration order of the plan",
         )
         USER_RESPONSE_TIMEOUT: int = Field(
             default=120,
@@ -867,7 +2603,90 @@ WORKING GUIDELINES:
         self.type = "manifold"
         self.valves = self.Valves()
         self.current_output = ""
-        self._emitted_messages: list[str] = []
+        self._default_run_context = RunContext()
+        self._action_latency_history: dict[str, float] = {}
+        self._llm_cache: _LLMResponseCache | None = None
+        self._llm_single_flight = _SingleFlight()
+        self._plan_cache = _PlanCache()
+        self._plan_templates: tuple[Any, _PlanTemplateLibrary] | None = None
+        self._tool_index: _ToolRetrievalIndex | None = None
+        self._reflection_cache = _ReflectionCache()
+        self._judge_stats: dict[str, dict[str, float]] = {}
+
+    @property
+    def run_context(self) -> RunContext:
+        """Return the context of the run being served by the current task."""
+
+        run_context = _CURRENT_RUN_CONTEXT.get()
+        if run_context is not None:
+            return run_context
+        return self._default_run_context
+
+    @property
+    def __user__(self) -> User:
+        return self.run_context.user
+
+    @__user__.setter
+    def __user__(self, value: User) -> None:
+        self.run_context.user = value
+
+    @property
+    def __request__(self) -> Request:
+        return self.run_context.request
+
+    @__request__.setter
+    def __request__(self, value: Request) -> None:
+        self.run_context.request = value
+
+    @property
+    def user(self) -> dict[str, Any] | Any:
+        return self.run_context.user_info
+
+    @user.setter
+    def user(self, value: dict[str, Any] | Any) -> None:
+        self.run_context.user_info = value
+
+    def _current_user_id(self) -> str:
+        user = self.user
+        if isinstance(user, dict):
+            return str(user.get("id") or "")
+        return str(getattr(user, "id", "") or "")
+
+    @property
+    def __current_event_emitter__(self) -> Callable[[dict[str, Any]], Awaitable[None]]:
+        return self.run_context.event_emitter  # type: ignore[return-value]
+
+    @__current_event_emitter__.setter
+    def __current_event_emitter__(
+        self, value: Callable[[dict[str, Any]], Awaitable[None]]
+    ) -> None:
+        self.run_context.event_emitter = value
+
+    @property
+    def __current_event_call__(self) -> Callable[[dict[str, Any]], Awaitable[Any]]:
+        return self.run_context.event_call  # type: ignore[return-value]
+
+    @__current_event_call__.setter
+    def __current_event_call__(
+        self, value: Callable[[dict[str, Any]], Awaitable[Any]]
+    ) -> None:
+        self.run_context.event_call = value
+
+    @property
+    def __model__(self) -> str:
+        return self.run_context.model
+
+    @__model__.setter
+    def __model__(self, value: str) -> None:
+        self.run_context.model = value
+
+    @property
+    def _emitted_messages(self) -> list[str]:
+        return self.run_context.emitted_messages
+
+    @_emitted_messages.setter
+    def _emitted_messages(self, value: list[str]) -> None:
+        self.run_context.emitted_messages = value
 
     @property
     def tool_integration_enabled(self) -> bool:
@@ -1228,6 +3047,161 @@ WORKING GUIDELINES:
 
         return f"SYSTEM: {system_prompt}\n{base_context}"
 
+    async def _execute_tool_call(
+        self,
+        tool_call: dict[str, Any],
+        tools: dict[str, dict[Any, Any]],
+        action: Optional[Action],
+        action_results: dict[str, dict[str, str]],
+    ) -> str:
+        """Run one tool call requested by the model and return its result as text."""
+
+        tool_function_name = tool_call["function"].get("name", None)
+
+        if tool_function_name not in tools:
+            tool_result = f"{tool_function_name} not in {tools}"
+            if action:
+                action.tool_results[tool_function_name] = f"ERROR: {tool_result}"
+            return tool_result
+
+        tool = tools[tool_function_name]
+        spec = tool.get("spec", {})
+        allowed_params = spec.get("parameters", {}).get("properties", {}).keys()
+        timeout_seconds = self.valves.TOOL_CALL_TIMEOUT
+
+        try:
+            raw_arguments = tool_call["function"].get("arguments") or "{}"
+            tool_function_params = (
+                raw_arguments
+                if isinstance(raw_arguments, dict)
+                else json.loads(raw_arguments)
+            )
+            tool_function_params = {
+                k: v for k, v in tool_function_params.items() if k in allowed_params
+            }
+            tool_function_params = _resolve_action_references(
+                tool_function_params, action_results
+            )
+
+            tool_function = tool["callable"]
+            logger.debug(f"{tool_call} , {tool_function_params}")
+            tool_coroutine = tool_function(**tool_function_params)
+            if timeout_seconds and timeout_seconds > 0:
+                tool_result = await asyncio.wait_for(
+                    tool_coroutine, timeout=timeout_seconds
+                )
+            else:
+                tool_result = await tool_coroutine
+        except asyncio.TimeoutError:
+            tool_result = (
+                f"ERROR: tool '{tool_function_name}' timed out after {timeout_seconds} seconds"
+            )
+            logger.warning(tool_result)
+            if action:
+                action.tool_results[tool_function_name] = tool_result
+            return tool_result
+        except Exception as tool_error:
+            tool_result = f"ERROR: tool '{tool_function_name}' failed: {tool_error}"
+            logger.error(tool_result)
+            if action:
+                action.tool_results[tool_function_name] = tool_result
+            return tool_result
+
+        tool_result_str = str(tool_result)
+
+        if action:
+            # If lightweight context is active and substitutions were used, truncate the result
+            if (
+                self.valves.ENABLE_TOOL_RESULT_TRUNCATION
+                and action.use_lightweight_context
+                and _params_contain_references(tool_function_params)
+                and len(tool_result_str) > 200
+            ):
+                # Truncate to first 100 and last 100 characters
+                truncated_result = (
+                    tool_result_str[:100]
+                    + "\n\n[TRUNCATED - Lightweight context mode with substitutions active]\n\n"
+                    + tool_result_str[-100:]
+                )
+                action.tool_results[tool_function_name] = truncated_result
+                logger.info(
+                    f"Truncated tool result for '{tool_function_name}' in action '{action.id}' due to lightweight context with substitutions"
+                )
+            else:
+                action.tool_results[tool_function_name] = tool_result_str
+
+        return tool_result_str
+
+    def _get_llm_cache(self) -> _LLMResponseCache | None:
+        """Return the response cache for the configured path, or None when disabled."""
+
+        if not self.valves.LLM_CACHE_ENABLED or _LLM_CACHE_BYPASS.get():
+            return None
+        path = self.valves.LLM_CACHE_PATH or "planner_llm_cache.sqlite3"
+        if self._llm_cache is None or self._llm_cache.path != path:
+            try:
+                self._llm_cache = _LLMResponseCache(path)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"LLM response cache unavailable at '{path}': {e}")
+                return None
+        return self._llm_cache
+
+    async def _generate_chat_completion(self, form_data: dict[str, Any]) -> Any:
+        """Call the backend, serving identical requests from the response cache when enabled.
+
+        Identical requests already in flight (from this run or a concurrent one of the
+        same user) share a single backend call when COALESCE_LLM_REQUESTS is on. Calls
+        inside _bypass_llm_cache, i.e. action execution, skip both the cache and
+        coalescing.
+        """
+
+        cache = self._get_llm_cache()
+        coalesce = self.valves.COALESCE_LLM_REQUESTS and not _LLM_CACHE_BYPASS.get()
+        if cache is None and not coalesce:
+            return await generate_chat_completion(
+                self.__request__,
+                form_data,
+                user=self.__user__,
+            )
+
+        key = _canonical_request_hash(form_data, self._current_user_id())
+        if cache is not None:
+            try:
+                cached = await asyncio.to_thread(
+                    cache.get, key, self.valves.LLM_CACHE_TTL_SECONDS
+                )
+            except sqlite3.Error as e:
+                logger.warning(f"LLM response cache read failed: {e}")
+                cached = None
+            if cached is not None:
+                logger.debug(f"LLM response cache hit for {form_data.get('model')}")
+                return cached
+
+        async def call_backend() -> Any:
+            response_payload = await generate_chat_completion(
+                self.__request__,
+                form_data,
+                user=self.__user__,
+            )
+            if cache is not None:
+                normalized = _ensure_dict(response_payload)
+                _, tool_calls, _ = parse_llm_response(copy.deepcopy(normalized))
+                if normalized and not tool_calls:
+                    try:
+                        await asyncio.to_thread(
+                            cache.put,
+                            key,
+                            normalized,
+                            self.valves.LLM_CACHE_MAX_ENTRIES,
+                        )
+                    except sqlite3.Error as e:
+                        logger.warning(f"LLM response cache write failed: {e}")
+            return response_payload
+
+        if not coalesce:
+            return await call_backend()
+        return await self._llm_single_flight.run(key, call_backend)
+
     async def get_completion(
         self,
         prompt: str | list[dict[str, Any]],
@@ -1256,7 +3230,8 @@ WORKING GUIDELINES:
         if not self.tool_integration_enabled:
             tools = {}
 
-        if model in [self.valves.WRITER_MODEL, self.valves.CODER_MODEL] and tools:
+        is_specialist = model in [self.valves.WRITER_MODEL, self.valves.CODER_MODEL]
+        if is_specialist and tools:
             __model = (
                 self.valves.ACTION_MODEL
                 if self.valves.ACTION_MODEL
@@ -1277,226 +3252,118 @@ WORKING GUIDELINES:
             else None
         )
 
-        try:
-            form_data: dict[str, Any] = {
-                "model": __model,
-                "messages": messages,
-            }
-            logger.debug(f"{_tools}")
-            if _tools is not None:
-                form_data["tools"] = _tools
-            if format and not tools:
-                form_data["response_format"] = format
-            response_payload = await generate_chat_completion(
-                self.__request__,
-                form_data,
-                user=self.__user__,
-            )
-            response_content, tool_calls, response = parse_llm_response(
-                response_payload
-            )
-            if not self.tool_integration_enabled:
-                return clean_thinking_tags(response_content)
-            logger.debug(f"{tool_calls}")
-            if not tool_calls:
-                if response_content == "\n":
-                    logger.debug(f"No tool calls: {response}")
-                return clean_thinking_tags(response_content)
-            for tool_call in tool_calls:
-                tool_function_name = tool_call["function"].get("name", None)
-
-                if action and tool_function_name:
-                    if tool_function_name not in action.tool_calls:
-                        action.tool_calls.append(tool_function_name)
-
-                if tool_function_name not in tools:
-                    tool_result = f"{tool_function_name} not in {tools}"
-                    if action:
-                        action.tool_results[tool_function_name] = (
-                            f"ERROR: {tool_result}"
-                        )
-                else:
-                    tool = tools[tool_function_name]
-                    spec = tool.get("spec", {})
-                    allowed_params = (
-                        spec.get("parameters", {}).get("properties", {}).keys()
-                    )
-                    tool_function_params = json.loads(
-                        tool_call["function"].get("arguments", {})
-                    )
-                    tool_function_params = {
-                        k: v
-                        for k, v in tool_function_params.items()
-                        if k in allowed_params
-                    }
+        max_turns = max(0, int(self.valves.MAX_TOOL_TURNS or 0))
+        char_budget = max(0, int(self.valves.TOOL_LOOP_CHAR_BUDGET or 0))
+        seen_calls: set[tuple[str, str]] = set()
+        stop_reason: str | None = None
+        turn = 0
+        semaphore = asyncio.Semaphore(
+            max(1, int(self.valves.MAX_PARALLEL_TOOL_CALLS or 1))
+        )
 
-                    def resolve_action_references(
-                        params: dict[str, Any],
-                    ) -> dict[str, Any]:
-                        """Recursively resolve @action_id references in tool parameters"""
-                        logger.info(
-                            f"resolve_action_references called with params: {params}"
-                        )
-                        logger.info(
-                            f"Available action_results keys: {list(action_results.keys())}"
-                        )
-                        resolved_params: dict[str, Any] = {}
-                        for key, value in params.items():
-                            if isinstance(value, str):
-                                logger.info(
-                                    f"Processing string parameter '{key}' with value: {value}"
-                                )
+        async def run_bounded(tool_call: dict[str, Any]) -> str:
+            async with semaphore:
+                return await self._execute_tool_call(
+                    tool_call, tools, action, action_results
+                )
 
-                                # Check if this is a pure @action_id reference (no other content)
-                                if value.startswith("@") and re.match(
-                                    r"^@[a-zA-Z0-9_-]+$", value
-                                ):
-                                    action_id = value[1:]
-                                    logger.info(
-                                        f"Found direct @action_id reference: {action_id}"
-                                    )
-                                    if action_id in action_results:
-                                        resolved_params[key] = action_results[
-                                            action_id
-                                        ].get("primary_output", "")
-                                        logger.info(
-                                            f"Resolved @{action_id} reference in parameter '{key}'"
-                                        )
-                                    else:
-                                        resolved_params[key] = value
-                                        logger.warning(
-                                            f"Action ID '{action_id}' not found for reference in parameter '{key}'"
-                                        )
-                                else:
-                                    # Look for embedded @action_id references in the string
-                                    pattern = r"@([a-zA-Z0-9_-]+)"
-                                    matches = re.findall(pattern, value)
-                                    logger.info(
-                                        f"Looking for embedded @action_id references in '{value}', found matches: {matches}"
-                                    )
-
-                                    if matches:
-                                        resolved_value = value
-                                        for match in matches:
-                                            action_id = match
-                                            if action_id in action_results:
-                                                replacement = action_results[
-                                                    action_id
-                                                ].get("primary_output", "")
-                                                resolved_value = resolved_value.replace(
-                                                    f"@{action_id}", replacement
-                                                )
-                                                logger.info(
-                                                    f"Resolved embedded @{action_id} reference in string parameter '{key}'"
-                                                )
-                                            else:
-                                                logger.warning(
-                                                    f"Embedded action ID '{action_id}' not found in string parameter '{key}'"
-                                                )
-                                        resolved_params[key] = resolved_value
-                                    else:
-                                        resolved_params[key] = value
-                            elif isinstance(value, dict):
-                                resolved_params[key] = resolve_action_references(value)  # type: ignore
-                            elif isinstance(value, list):
-                                resolved_list: list[Any] = []
-                                for item in value:
-                                    if isinstance(item, str) and item.startswith("@"):
-                                        action_id = item[1:]
-                                        if action_id in action_results:
-                                            resolved_list.append(
-                                                action_results[action_id].get(
-                                                    "primary_output", ""
-                                                )
-                                            )
-                                            logger.info(
-                                                f"Resolved @{action_id} reference in list parameter '{key}'"
-                                            )
-                                        else:
-                                            resolved_list.append(item)
-                                            logger.warning(
-                                                f"Action ID '{action_id}' not found for reference in list parameter '{key}'"
-                                            )
-                                    elif isinstance(item, dict):
-                                        resolved_list.append(
-                                            resolve_action_references(item)  # type: ignore
-                                        )
-                                    else:
-                                        resolved_list.append(item)
-                                resolved_params[key] = resolved_list
-                            else:
-                                resolved_params[key] = value
-                        return resolved_params
+        try:
+            while True:
+                form_data: dict[str, Any] = {
+                    "model": __model,
+                    "messages": messages,
+                }
+                logger.debug(f"{_tools}")
+                if _tools is not None and stop_reason is None:
+                    form_data["tools"] = _tools
+                if format and "tools" not in form_data:
+                    form_data["response_format"] = format
+                llm_started = time.perf_counter()
+                response_payload = await self._generate_chat_completion(form_data)
+                llm_seconds = time.perf_counter() - llm_started
+                response_content, tool_calls, response = parse_llm_response(
+                    response_payload
+                )
+                if not self.tool_integration_enabled:
+                    return clean_thinking_tags(response_content)
+                logger.debug(f"{tool_calls}")
+                if stop_reason is not None or not tool_calls:
+                    if response_content == "\n":
+                        logger.debug(f"No tool calls: {response}")
+                    if turn and action:
+                        action.tool_turns.append(
+                            {
+                                "turn": turn + 1,
+                                "tools": [],
+                                "llm_seconds": round(llm_seconds, 3),
+                                "tool_seconds": 0.0,
+                                "message_chars": _messages_char_count(messages),
+                                "stop_reason": stop_reason or "answered",
+                            }
+                        )
+                    return clean_thinking_tags(response_content)
 
-                    tool_function_params = resolve_action_references(
-                        tool_function_params
+                tool_function_names = [
+                    tool_call["function"].get("name", None) for tool_call in tool_calls
+                ]
+                call_signatures = [
+                    _tool_call_signature(tool_call) for tool_call in tool_calls
+                ]
+                if any(signature in seen_calls for signature in call_signatures):
+                    stop_reason = "repeated_tool_call"
+                    logger.warning(
+                        f"Stopping tool loop after {turn} turn(s): the model repeated a tool call with identical arguments ({', '.join(str(name) for name in tool_function_names)})"
                     )
+                    messages = messages + [
+                        {
+                            "role": "user",
+                            "content": "You already called this tool with the same arguments and its output is above. Do not call any more tools; answer now using the information already gathered.",
+                        }
+                    ]
+                    continue
+                seen_calls.update(call_signatures)
+                turn += 1
 
-                    tool_function = tool["callable"]
-                    logger.debug(f"{tool_call} , {tool_function_params}")
-                    tool_result = await tool_function(**tool_function_params)
-
-                    if action:
-                        # Check if this tool was called with substitutions and lightweight context is active
-                        tool_result_str = str(tool_result)
-
-                        # Check if any @action_id references were used in the tool parameters
-                        had_substitutions = False
-                        for param_value in tool_function_params.values():
-                            if isinstance(param_value, str) and "@" in param_value:
-                                had_substitutions = True
-                                break
-                            elif isinstance(param_value, dict):
-                                # Recursively check nested dictionaries
-                                def check_dict_for_substitutions(d):
-                                    for v in d.values():
-                                        if isinstance(v, str) and "@" in v:
-                                            return True
-                                        elif isinstance(v, dict):
-                                            if check_dict_for_substitutions(v):
-                                                return True
-                                    return False
-
-                                if check_dict_for_substitutions(param_value):
-                                    had_substitutions = True
-                                    break
-
-                        # If lightweight context is active and substitutions were used, truncate the result
+                if action:
+                    for tool_function_name in tool_function_names:
                         if (
-                            self.valves.ENABLE_TOOL_RESULT_TRUNCATION
-                            and action.use_lightweight_context
-                            and had_substitutions
-                            and len(tool_result_str) > 200
+                            tool_function_name
+                            and tool_function_name not in action.tool_calls
                         ):
-                            # Truncate to first 100 and last 100 characters
-                            truncated_result = (
-                                tool_result_str[:100]
-                                + "\n\n[TRUNCATED - Lightweight context mode with substitutions active]\n\n"
-                                + tool_result_str[-100:]
-                            )
-                            action.tool_results[tool_function_name] = truncated_result
-                            logger.info(
-                                f"Truncated tool result for '{tool_function_name}' in action '{action.id}' due to lightweight context with substitutions"
-                            )
-                        else:
-                            action.tool_results[tool_function_name] = tool_result_str
-                if action and isinstance(model, str):
+                            action.tool_calls.append(tool_function_name)
+
+                tools_started = time.perf_counter()
+                tool_outputs = await asyncio.gather(
+                    *(run_bounded(tool_call) for tool_call in tool_calls)
+                )
+                tool_seconds = time.perf_counter() - tools_started
+
+                if action and isinstance(model, str) and turn == 1:
                     messages[0]["content"] = self.get_system_prompt_for_model(
                         action, action.id, action_results, messages[0]["content"], model
                     )
-                messages: list[dict[str, Any]] = messages + [
-                    {"role": "assistant", "content": None, "tool_calls": [tool_call]},
-                    {
-                        "role": "assistant",
-                        "tool_call_id": tool_call["id"],
-                        "name": tool_function_name,
-                        "content": str(tool_result),
-                    },
+                executed_names = ", ".join(
+                    f"'{tool_function_name}'"
+                    for tool_function_name in tool_function_names
+                )
+                messages = messages + [
+                    {"role": "assistant", "content": None, "tool_calls": tool_calls},
+                    *[
+                        {
+                            "role": "assistant",
+                            "tool_call_id": tool_call.get("id"),
+                            "name": tool_function_name,
+                            "content": tool_output,
+                        }
+                        for tool_call, tool_function_name, tool_output in zip(
+                            tool_calls, tool_function_names, tool_outputs
+                        )
+                    ],
                     {
                         "role": "user",
                         "content": (
-                            f"The tool '{tool_function_name}' has been executed and returned the output above. "
-                            "Now, based on this output and the original task, provide the final, comprehensive answer for this step. "
+                            f"The tool call(s) {executed_names} have been executed and returned the output(s) above. "
+                            "Now, based on these outputs and the original task, provide the final, comprehensive answer for this step. "
                             "CRITICAL: Extract and present the COMPLETE, DETAILED content from the tool output. Do not oversimplify into brief summaries or title lists. "
                             "If the tool returned search results or research data, provide the FULL substantive content with detailed explanations, context, and comprehensive information. "
                             "Include specific details, examples, data points, and thorough explanations that give users the complete picture. "
@@ -1506,16 +3373,27 @@ WORKING GUIDELINES:
                         ),
                     },
                 ]
+                message_chars = _messages_char_count(messages)
+                if action:
+                    action.tool_turns.append(
+                        {
+                            "turn": turn,
+                            "tools": tool_function_names,
+                            "llm_seconds": round(llm_seconds, 3),
+                            "tool_seconds": round(tool_seconds, 3),
+                            "message_chars": message_chars,
+                        }
+                    )
+
+                if is_specialist:
+                    specialist_response = await self.get_completion(
+                        prompt=messages,
+                        model=model,
+                        action_results=action_results,
+                        format=format,
+                    )
+                    return specialist_response
 
-            if model in [self.valves.WRITER_MODEL, self.valves.CODER_MODEL]:
-                specialist_response = await self.get_completion(
-                    prompt=messages,
-                    model=model,
-                    action_results=action_results,
-                    format=format,
-                )
-                return specialist_response
-            else:
                 messages[-1][
                     "content"
                 ] += """                       
@@ -1540,15 +3418,15 @@ WORKING GUIDELINES:
                             Preserve the depth and richness of the tool output - better to include comprehensive details than to oversimplify
                             Tool outputs should be processed to include the COMPLETE DETAILED CONTENT/INFORMATION in "primary_output"
                             If tools produce files, images, or URLs, include them properly formatted in "primary_output" """
-                tool_response = await self.get_completion(
-                    prompt=messages,
-                    model=model,
-                    tools=tools,
-                    action_results=action_results,
-                    action=action,
-                    format=format,
-                )
-                return tool_response
+
+                if max_turns and turn >= max_turns:
+                    stop_reason = "max_turns"
+                elif char_budget and message_chars > char_budget:
+                    stop_reason = "char_budget"
+                if stop_reason is not None:
+                    logger.warning(
+                        f"Stopping tool loop after {turn} turn(s) ({stop_reason}); requesting a final answer without tools"
+                    )
         except Exception as e:
             logger.error(f"LLM Call Error: {e}")
             raise e
@@ -1563,6 +3441,8 @@ WORKING GUIDELINES:
             "completed": "✅",
             "failed": "❌",
             "warning": "⚠️",
+            "aborted": "⏹️",
+            "skipped": "⏭️",
         }
 
         def sanitize_action_id(id_str: str) -> str:
@@ -1584,6 +3464,8 @@ WORKING GUIDELINES:
                 styles.append(f"style {action_id} fill:#fffbe6")
             elif action.status == "failed":
                 styles.append(f"style {action_id} fill:#ffe6e6")
+            elif action.status == "skipped":
+                styles.append(f"style {action_id} fill:#eeeeee")
 
         entry_actions = [action for action in plan.actions if not action.dependencies]
         for action in entry_actions:
@@ -1652,17 +3534,204 @@ WORKING GUIDELINES:
             model=self._determine_final_synthesis_model(),
         )
 
+    def _get_available_tool_summaries(self) -> list[dict[str, Any]]:
+        """Describe the tools of the run's catalog for planning prompts."""
+
+        return [
+            {
+                "tool_id": tool.id,
+                "tool_name": tool.name,
+                "tool_description": tool.meta.description,
+            }
+            for tool in self.run_context.tool_registry.catalog()
+        ]
+
+    def _get_tool_index(self) -> _ToolRetrievalIndex:
+        """Return the retrieval index for the run's catalog, rebuilding it only when the catalog changed."""
+
+        catalog = self.run_context.tool_registry.catalog()
+        include_specs = bool(self.valves.TOOL_INDEX_INCLUDE_SPECS)
+        fingerprint = _ToolRetrievalIndex.catalog_fingerprint(catalog, include_specs)
+        if self._tool_index is None or self._tool_index.fingerprint != fingerprint:
+            self._tool_index = _ToolRetrievalIndex(catalog, include_specs)
+            logger.info(f"Built tool retrieval index over {len(catalog)} tools")
+        return self._tool_index
+
+    async def _load_tools(self, tool_ids: list[str]) -> dict[str, Any]:
+        """Resolve tool specs and callables for the current run through Open WebUI."""
+
+        extra_params: dict[str, Any] = {
+            "__event_emitter__": self.__current_event_emitter__,
+            "__user__": self.user,
+            "__request__": self.__request__,
+        }
+
+        return await get_tools(  # type: ignore
+            self.__request__,
+            tool_ids,
+            self.__user__,
+            extra_params,
+        )
+
+    def _assign_action_models(self, actions: list[dict[str, Any]]) -> None:
+        """Resolve model aliases (ACTION_MODEL, WRITER_MODEL, CODER_MODEL) and type-based defaults in place."""
+
+        model_mapping = {
+            "ACTION_MODEL": self.valves.ACTION_MODEL,
+            "WRITER_MODEL": self.valves.WRITER_MODEL,
+            "CODER_MODEL": self.valves.CODER_MODEL,
+        }
+
+        for action in actions:
+
+            if action.get("model") in model_mapping:
+                action["model"] = model_mapping[action["model"]]
+            elif "model" not in action or not action["model"]:
+
+                if action.get("type") in ["text", "documentation", "synthesis"]:
+                    action["model"] = self.valves.WRITER_MODEL
+                elif action.get("type") in ["code", "script"]:
+                    action["model"] = self.valves.CODER_MODEL
+                else:
+                    action["model"] = self.valves.ACTION_MODEL
+
+    def _get_plan_template_library(self) -> _PlanTemplateLibrary | None:
+        directory = self.valves.PLAN_TEMPLATES_DIR
+        if not directory:
+            return None
+        fingerprint = (directory, _PlanTemplateLibrary.fingerprint(directory))
+        if self._plan_templates is None or self._plan_templates[0] != fingerprint:
+            self._plan_templates = (fingerprint, _PlanTemplateLibrary.load(directory))
+        return self._plan_templates[1]
+
+    def _plan_from_template(self, goal: str) -> Plan | None:
+        """Build a plan from a matching template, or None when no template applies.
+
+        Raises ValueError when an explicit template request cannot be bound.
+        """
+
+        library = self._get_plan_template_library()
+        if library is None:
+            return None
+        matched = library.match(goal)
+        if matched is None:
+            return None
+        template, values = matched
+        template_goal, actions, params = template.bind(values)
+        self._assign_action_models(actions)
+        plan = Plan(
+            goal=template_goal or goal,
+            actions=[Action(**a) for a in actions],
+            metadata={"plan_template": template.name, "plan_template_params": params},
+        )
+        if not any(a.id == "final_synthesis" for a in plan.actions):
+            plan.actions.append(self._build_default_final_synthesis_action(plan))
+        return plan
+
+    def _plan_cache_context_key(self) -> str:
+        """Fingerprint of the tool catalog and planning valves a cached plan was built with."""
+
+        catalog = (
+            sorted(
+                (
+                    str(tool["tool_id"]),
+                    str(tool["tool_name"]),
+                    str(tool["tool_description"]),
+                )
+                for tool in self._get_available_tool_summaries()
+            )
+            if self.tool_integration_enabled
+            else []
+        )
+        valves = {
+            key: value
+            for key, value in self.valves.model_dump().items()
+            if key in _PLANNING_VALVES
+        }
+        return hashlib.sha256(
+            json.dumps(
+                {"catalog": catalog, "valves": valves}, sort_keys=True, default=str
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def _get_cached_plan(self, user_id: str, goal: str) -> Plan | None:
+        if not self.valves.PLAN_CACHE_ENABLED:
+            return None
+        hit = self._plan_cache.get(
+            user_id,
+            self._plan_cache_context_key(),
+            goal,
+            self.valves.PLAN_CACHE_TTL_SECONDS,
+            self.valves.PLAN_CACHE_SIMILARITY_THRESHOLD,
+        )
+        if hit is None:
+            return None
+        plan_data, similarity = hit
+        logger.info(f"Plan cache hit (similarity {similarity:.2f}) for goal: {goal}")
+        return Plan(
+            goal=goal,
+            actions=[Action(**a) for a in plan_data.get("actions", [])],
+            metadata={**(plan_data.get("metadata", {}) or {}), "plan_cache_similarity": similarity},
+        )
+
+    def _store_cached_plan(self, user_id: str, goal: str, plan: Plan) -> None:
+        if not self.valves.PLAN_CACHE_ENABLED:
+            return
+        self._plan_cache.put(
+            user_id,
+            self._plan_cache_context_key(),
+            goal,
+            plan.model_dump(),
+            self.valves.PLAN_CACHE_MAX_ENTRIES,
+        )
+
+    async def _prepare_plan(self, user_id: str, goal: str) -> Plan | None:
+        """Get a plan from a matching template, the plan cache or the planner, in that order.
+
+        Returns None (after emitting an error status) when no valid plan could be made.
+        """
+
+        try:
+            plan = self._plan_from_template(goal)
+        except ValueError as e:
+            await self.emit_status("error", f"Plan template error: {e}", True)
+            return None
+        if plan is not None:
+            await self.emit_status(
+                "info", f"Using plan template '{plan.metadata['plan_template']}'", False
+            )
+            return plan
+
+        plan = self._get_cached_plan(user_id, goal)
+        if plan is not None:
+            await self.emit_status(
+                "info",
+                f"Reusing cached plan (goal similarity {plan.metadata['plan_cache_similarity']:.2f})",
+                False,
+            )
+            return plan
+
+        await self.emit_status("info", "Creating execution plan...", False)
+        try:
+            plan = await self.create_plan(goal)
+        except Exception as e:
+            await self.emit_status("error", f"Failed to create a valid plan: {e}", True)
+            return None
+        self._store_cached_plan(user_id, goal, plan)
+        return plan
+
     async def create_plan(self, goal: str) -> Plan:
         available_tools: list[dict[str, Any]] = []
+        prompt_tools: list[dict[str, Any]] = []
         if self.tool_integration_enabled:
-            available_tools = [
-                {
-                    "tool_id": tool.id,
-                    "tool_name": tool.name,
-                    "tool_description": tool.meta.description,
-                }
-                for tool in Tools.get_tools()
-            ]
+            available_tools = self._get_available_tool_summaries()
+            prompt_tools = available_tools
+            top_k = int(self.valves.TOOL_CATALOG_TOP_K or 0)
+            if 0 < top_k < len(available_tools):
+                prompt_tools = self._get_tool_index().query(goal, top_k)
+                logger.info(
+                    f"Planning with {top_k} of {len(available_tools)} tools: {[t['tool_id'] for t in prompt_tools]}"
+                )
         """Create an execution plan for the given goal"""
 
         section_idx = 1
@@ -1680,7 +3749,7 @@ WORKING GUIDELINES:
                     f"""**{section_idx}. Available Tools**
                     Here is a list of tools you can use. Use the exact `tool_id` in the `tool_ids` field for any action that requires a tool.
                     ```json
-                    {json.dumps(available_tools, indent=2)}
+                    {_encode_tool_catalog(prompt_tools, self.valves.TOOL_DESCRIPTION_TOKEN_BUDGET)}
                     ```"""
                 ).strip()
             )
@@ -1943,24 +4012,7 @@ WORKING GUIDELINES:
 
                 actions = plan_dict.get("actions", [])
 
-                model_mapping = {
-                    "ACTION_MODEL": self.valves.ACTION_MODEL,
-                    "WRITER_MODEL": self.valves.WRITER_MODEL,
-                    "CODER_MODEL": self.valves.CODER_MODEL,
-                }
-
-                for action in actions:
-
-                    if action.get("model") in model_mapping:
-                        action["model"] = model_mapping[action["model"]]
-                    elif "model" not in action or not action["model"]:
-
-                        if action.get("type") in ["text", "documentation", "synthesis"]:
-                            action["model"] = self.valves.WRITER_MODEL
-                        elif action.get("type") in ["code", "script"]:
-                            action["model"] = self.valves.CODER_MODEL
-                        else:
-                            action["model"] = self.valves.ACTION_MODEL
+                self._assign_action_models(actions)
 
                 plan = Plan(
                     goal=plan_dict.get("goal", goal),
@@ -1980,150 +4032,30 @@ WORKING GUIDELINES:
                         self._build_default_final_synthesis_action(plan)
                     )
 
-                final_synthesis = next(
-                    (a for a in plan.actions if a.id == "final_synthesis"), None
-                )
-                if final_synthesis:
-                    template = final_synthesis.description
-
-                    placeholder_pattern = r"\{([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+)*)\}"
-                    all_placeholders = re.findall(placeholder_pattern, template)
-
-                    invalid_placeholders = [p for p in all_placeholders if "." in p]
-                    if invalid_placeholders:
-                        msg = (
-                            f"Template contains invalid nested placeholders: {invalid_placeholders}. "
-                            f"Use simple {{action_id}} format only, not {{action_id.field}} or {{action_id.output.field}}."
-                        )
-                        messages += [
-                            {
-                                "role": "assistant",
-                                "content": f"previous attempt: {clean_result}",
-                            },
-                            {"role": "user", "content": f"error:: {msg}"},
-                        ]
-                        raise ValueError(msg)
-
-                    code_patterns = [
-                        (r"<[a-zA-Z][^>]*>", "HTML tags"),
-                        (r"def\s+\w+\s*\(", "Python function definitions"),
-                        (r"class\s+\w+\s*[:\(]", "Python class definitions"),
-                        (r"import\s+\w+", "Python imports"),
-                        (r"function\s+\w+\s*\(", "JavaScript functions"),
-                        (r"<!DOCTYPE", "HTML DOCTYPE declarations"),
-                        (r"<\?xml", "XML declarations"),
-                    ]
-
-                    for pattern, description in code_patterns:
-                        if re.search(pattern, template):
-                            msg = (
-                                f"Template contains {description}. Templates should not contain code. "
-                                f"Create a separate action to generate code and reference it with {{action_id}}."
-                            )
-                            messages += [
-                                {
-                                    "role": "assistant",
-                                    "content": f"previous attempt: {clean_result}",
-                                },
-                                {"role": "user", "content": f"error:: {msg}"},
-                            ]
-                            raise ValueError(msg)
-
-                    simple_placeholders = [p for p in all_placeholders if "." not in p]
-                    action_ids = {a.id for a in plan.actions}
-                    missing_actions = [
-                        p for p in simple_placeholders if p not in action_ids
-                    ]
-                    if missing_actions:
-                        msg = (
-                            f"Template references non-existent actions: {missing_actions}. "
-                            f"All placeholders must reference valid action IDs."
-                        )
-                        messages += [
-                            {
-                                "role": "assistant",
-                                "content": f"previous attempt: {clean_result}",
-                            },
-                            {"role": "user", "content": f"error:: {msg}"},
-                        ]
-                        raise ValueError(msg)
-
-                final_synthesis_index = next(
-                    (
-                        i
-                        for i, a in enumerate(plan.actions)
-                        if a.id == "final_synthesis"
-                    ),
-                    None,
-                )
-                if final_synthesis_index is not None:
-                    if final_synthesis_index != len(plan.actions) - 1:
-                        msg = (
-                            f"The 'final_synthesis' action must be the last action in the plan. "
-                            f"Currently it's at position {final_synthesis_index + 1} out of {len(plan.actions)} actions."
-                        )
-                        messages += [
-                            {
-                                "role": "assistant",
-                                "content": f"previous attempt: {clean_result}",
-                            },
-                            {"role": "user", "content": f"error:: {msg}"},
-                        ]
-                        raise ValueError(msg)
-
-                    actions_depending_on_final = [
-                        a.id
-                        for a in plan.actions
-                        if "final_synthesis" in a.dependencies
-                    ]
-                    if actions_depending_on_final:
-                        msg = (
-                            f"No actions can depend on 'final_synthesis'. "
-                            f"Found actions depending on it: {actions_depending_on_final}. "
-                            f"The 'final_synthesis' action must be the absolute final step."
-                        )
-                        messages += [
-                            {
-                                "role": "assistant",
-                                "content": f"previous attempt: {clean_result}",
-                            },
-                            {"role": "user", "content": f"error:: {msg}"},
-                        ]
-                        raise ValueError(msg)
-
-                if self.tool_integration_enabled:
-                    try:
-                        await self.validate_and_fix_tool_actions(plan)
-                    except Exception as validation_error:
-                        await self.emit_status(
-                            "warning",
-                            f"Tool validation failed but continuing with plan: {str(validation_error)}",
-                            False,
-                        )
-                        logger.warning(f"Tool validation error: {validation_error}")
-
-                try:
-                    await self.validate_and_enhance_template(plan)
-                except Exception as template_error:
-                    await self.emit_status(
-                        "warning",
-                        f"Template validation failed but continuing with plan: {str(template_error)}",
-                        False,
-                    )
-                    logger.warning(f"Template validation error: {template_error}")
-
-                try:
-                    if self.valves.ENABLE_LIGHTWEIGHT_CONTEXT_OPTIMIZATION:
-                        await self.validate_and_flag_lightweight_context(plan)
-                except Exception as lightweight_error:
+                known_tool_ids = {tool["tool_id"] for tool in available_tools}
+                errors, repairs = _validate_plan_structure(plan, known_tool_ids)
+                for repair in repairs:
+                    logger.info(f"Plan auto-repair: {repair}")
+                if repairs:
                     await self.emit_status(
-                        "warning",
-                        f"Lightweight context validation failed but continuing with plan: {str(lightweight_error)}",
+                        "info",
+                        f"Auto-repaired {len(repairs)} structural issue(s) in the plan.",
                         False,
                     )
-                    logger.warning(
-                        f"Lightweight context validation error: {lightweight_error}"
+                if errors:
+                    msg = "The plan has structural problems; fix all of them:\n" + "\n".join(
+                        f"{index}. {error}" for index, error in enumerate(errors, 1)
                     )
+                    messages += [
+                        {
+                            "role": "assistant",
+                            "content": f"previous attempt: {clean_result}",
+                        },
+                        {"role": "user", "content": f"error:: {msg}"},
+                    ]
+                    raise ValueError(msg)
+
+                await self._run_plan_validation_passes(plan)
 
                 logger.debug(f"Plan: {plan.model_dump_json()}")
                 return plan
@@ -2140,6 +4072,70 @@ WORKING GUIDELINES:
             f"Failed to create plan after {self.valves.MAX_RETRIES} attempts"
         )
 
+    async def _run_plan_validation_passes(self, plan: Plan) -> None:
+        """Run the post-parse validation passes, concurrently where they are independent.
+
+        Lightweight classification reads the tool_ids set by tool validation, so it waits
+        for it; template enhancement only touches final_synthesis and runs alongside.
+        Per-action LLM checks inside the passes share one concurrency cap.
+        """
+
+        passes: dict[str, tuple[list[str], bool, Callable[[Plan], Awaitable[Any]], str]] = {
+            "tools": (
+                [],
+                self.tool_integration_enabled,
+                self.validate_and_fix_tool_actions,
+                "Tool",
+            ),
+            "template": ([], True, self.validate_and_enhance_template, "Template"),
+            "lightweight": (
+                ["tools"],
+                bool(self.valves.ENABLE_LIGHTWEIGHT_CONTEXT_OPTIMIZATION),
+                self.validate_and_flag_lightweight_context,
+                "Lightweight context",
+            ),
+        }
+        tasks: dict[str, asyncio.Future[None]] = {}
+
+        async def run_pass(pass_name: str) -> None:
+            dependencies, enabled, validator, label = passes[pass_name]
+            for dependency in dependencies:
+                await tasks[dependency]
+            if not enabled:
+                return
+            try:
+                await validator(plan)
+            except Exception as validation_error:
+                await self.emit_status(
+                    "warning",
+                    f"{label} validation failed but continuing with plan: {str(validation_error)}",
+                    False,
+                )
+                logger.warning(f"{label} validation error: {validation_error}")
+
+        run_context = self.run_context
+        run_context.validation_semaphore = asyncio.Semaphore(
+            max(1, int(self.valves.PLAN_VALIDATION_CONCURRENCY or 1))
+        )
+        try:
+            for pass_name in passes:
+                tasks[pass_name] = asyncio.ensure_future(run_pass(pass_name))
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            run_context.validation_semaphore = None
+
+    def _validation_semaphore(self) -> asyncio.Semaphore:
+        """Concurrency cap shared by per-action validation calls of the current run."""
+
+        semaphore = self.run_context.validation_semaphore
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(
+                max(1, int(self.valves.PLAN_VALIDATION_CONCURRENCY or 1))
+            )
+        return semaphore
+
     async def enhance_requirements(self, plan: Plan, action: Action):
         dependencies_str = (
             json.dumps(action.dependencies) if action.dependencies else "None"
@@ -2218,14 +4214,7 @@ WORKING GUIDELINES:
             "info", "Starting tool validation for plan actions...", False
         )
 
-        tools: list[dict[str, Any]] = [
-            {
-                "tool_id": tool.id,
-                "tool_name": tool.name,
-                "tool_description": tool.meta.description,
-            }
-            for tool in Tools.get_tools()
-        ]
+        tools: list[dict[str, Any]] = self._get_available_tool_summaries()
 
         actions_needing_tools = [
             action
@@ -2245,11 +4234,77 @@ WORKING GUIDELINES:
             False,
         )
 
-        for action in actions_needing_tools:
-            await self.emit_status(
-                "info", f"Identifying tools for action: {action.id}", False
+        semaphore = self._validation_semaphore()
+        available_tool_ids = {tool["tool_id"] for tool in tools}
+        shortlists: dict[str, list[dict[str, Any]]] = {}
+        top_k = int(self.valves.TOOL_CATALOG_TOP_K or 0)
+        if 0 < top_k < len(tools):
+            tool_index = self._get_tool_index()
+            for action in actions_needing_tools:
+                shortlists[action.id] = tool_index.query(
+                    f"{action.description} {json.dumps(action.params or {})}", top_k
+                )
+
+        def tool_catalog_for(actions: list[Action]) -> str:
+            """Encode the tools shown for these actions: their shortlists, or the whole catalog."""
+
+            if not shortlists:
+                return _encode_tool_catalog(
+                    tools, self.valves.TOOL_DESCRIPTION_TOKEN_BUDGET
+                )
+            candidates: dict[str, dict[str, Any]] = {}
+            for action in actions:
+                for tool in shortlists[action.id]:
+                    candidates.setdefault(tool["tool_id"], tool)
+            return _encode_tool_catalog(
+                list(candidates.values()), self.valves.TOOL_DESCRIPTION_TOKEN_BUDGET
             )
+        tool_format: dict[str, Any] = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "tool_selection",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "tool_ids": {"type": "array", "items": {"type": "string"}}
+                    },
+                    "required": ["tool_ids"],
+                    "additionalProperties": False,
+                },
+            },
+        }
+        batch_format: dict[str, Any] = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "batch_tool_selection",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "selections": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "action_id": {"type": "string"},
+                                    "tool_ids": {
+                                        "type": "array",
+                                        "items": {"type": "string"},
+                                    },
+                                },
+                                "required": ["action_id", "tool_ids"],
+                                "additionalProperties": False,
+                            },
+                        }
+                    },
+                    "required": ["selections"],
+                    "additionalProperties": False,
+                },
+            },
+        }
 
+        async def select_tools(action: Action) -> list[str]:
             tool_selection_prompt = f"""
 You are a tool selection expert. Given an action description, select the most appropriate tool(s) from the available list.
 
@@ -2259,41 +4314,16 @@ ACTION TO ANALYZE:
 - Dependencies: {action.dependencies}
 
 AVAILABLE TOOLS:
-{json.dumps(tools, indent=2)}
-
-INSTRUCTIONS:
-1. Analyze the action description to understand what needs to be accomplished
-2. Select the most appropriate tool(s) from the available list
-3. Return ONLY the tool_id(s) that best match the action requirements
-4. If multiple tools are needed, list all relevant tool_ids
-5. Focus on tools that directly accomplish the action's objective
-
-SPECIFIC TOOL MAPPING GUIDELINES:
-- Research actions (search, find information, gather data): Use search tools (arxiv_search_tool, wiki_search_tool, perplexica_search)
-- Image generation actions: Use image generation tools (native_image_gen, create_image_hf, pexels_image_search_tool)
-- File operations (save, write): Use appropriate file/save tools
-- API integrations: Use specific API tools as needed
+{tool_catalog_for([action])}
 
-CRITICAL: If the action requires external capabilities (search, file operations, API calls), you MUST select appropriate tools. Do not return an empty array unless the action truly doesn't need any external tools.
+{_TOOL_SELECTION_GUIDELINES}
 
 OUTPUT FORMAT:
-Return a JSON array of tool_ids, for example: ["tool_id_1", "tool_id_2"]
-If no suitable tools are found, return an empty array: []
+Return a JSON object with the selected tool_ids, for example: {{"tool_ids": ["tool_id_1", "tool_id_2"]}}
+If no suitable tools are found, return an empty list: {{"tool_ids": []}}
 """
 
-            try:
-                tool_format: dict[str, Any] = {
-                    "type": "json_schema",
-                    "json_schema": {
-                        "name": "tool_selection",
-                        "strict": True,
-                        "schema": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                        },
-                    },
-                }
-
+            async with semaphore:
                 result = await self.get_completion(
                     prompt=tool_selection_prompt,
                     model="",
@@ -2302,39 +4332,137 @@ If no suitable tools are found, return an empty array: []
                     action=None,
                 )
 
-                clean_result = clean_json_response(result)
-                selected_tools = json.loads(clean_result)
+            selected_tools = _parse_tool_id_list(result)
+            if selected_tools is None:
+                raise ValueError(f"Unexpected tool selection response: {result[:200]}")
+
+            logger.info(f"Tool selection result for {action.id}: {selected_tools}")
+
+            return [
+                tool_id for tool_id in selected_tools if tool_id in available_tool_ids
+            ]
+
+        async def select_tools_batch(actions: list[Action]) -> dict[str, list[str]]:
+            """Select tools for every action in one call; returns only entries that validate."""
+
+            pending_actions = [
+                {
+                    "action_id": action.id,
+                    "description": action.description,
+                    "params": action.params,
+                    "dependencies": action.dependencies,
+                }
+                for action in actions
+            ]
+            batch_prompt = f"""
+You are a tool selection expert. For EACH action below, select the most appropriate tool(s) from the available list.
+
+ACTIONS TO ANALYZE:
+{json.dumps(pending_actions, indent=2)}
+
+AVAILABLE TOOLS:
+{tool_catalog_for(actions)}
+
+{_TOOL_SELECTION_GUIDELINES}
+
+OUTPUT FORMAT:
+Return a JSON object with one entry per action, using the exact action_id values above, for example:
+{{"selections": [{{"action_id": "action_1", "tool_ids": ["tool_id_1"]}}, {{"action_id": "action_2", "tool_ids": []}}]}}
+Use an empty tool_ids list only for actions that need no tool.
+"""
+
+            async with semaphore:
+                result = await self.get_completion(
+                    prompt=batch_prompt,
+                    model="",
+                    format=batch_format,
+                    action_results={},
+                    action=None,
+                )
 
-                logger.info(f"Tool selection result for {action.id}: {selected_tools}")
+            entries = json.loads(clean_json_response(result)).get("selections", [])
+            logger.info(f"Batched tool selection result: {entries}")
 
-                available_tool_ids = {tool["tool_id"] for tool in tools}
+            requested_ids = {action.id for action in actions}
+            validated: dict[str, list[str]] = {}
+            for entry in entries if isinstance(entries, list) else []:
+                if not isinstance(entry, dict):
+                    continue
+                action_id = entry.get("action_id")
+                tool_ids = entry.get("tool_ids")
+                if action_id not in requested_ids or not isinstance(tool_ids, list):
+                    continue
                 valid_tools = [
-                    tool_id
-                    for tool_id in selected_tools
-                    if tool_id in available_tool_ids
+                    tool_id for tool_id in tool_ids if tool_id in available_tool_ids
                 ]
+                # Ids that are all unknown are treated as a failed entry, not "no tool".
+                if tool_ids and not valid_tools:
+                    continue
+                validated[action_id] = valid_tools
+            return validated
 
-                logger.info(f"Available tool IDs: {available_tool_ids}")
-                logger.info(f"Valid tools for {action.id}: {valid_tools}")
-
-                if valid_tools:
-                    action.tool_ids = valid_tools
-                    await self.emit_status(
-                        "success",
-                        f"Added tools to {action.id}: {', '.join(valid_tools)}",
-                        False,
-                    )
-                else:
-                    await self.emit_status(
-                        "warning",
-                        f"No suitable tools found for action {action.id}. Action may need manual review.",
-                        False,
-                    )
+        selections: dict[str, list[str] | BaseException] = {}
+        fallback_actions = list(actions_needing_tools)
 
+        if self.valves.BATCH_TOOL_SELECTION and len(actions_needing_tools) > 1:
+            await self.emit_status(
+                "info",
+                f"Identifying tools for {len(actions_needing_tools)} actions in one request",
+                False,
+            )
+            try:
+                selections.update(await select_tools_batch(actions_needing_tools))
             except Exception as e:
+                logger.warning(f"Batched tool selection failed: {e}")
+            fallback_actions = [
+                action for action in actions_needing_tools if action.id not in selections
+            ]
+            if fallback_actions:
+                logger.info(
+                    f"Falling back to per-action tool selection for: {[a.id for a in fallback_actions]}"
+                )
+
+        for action in fallback_actions:
+            await self.emit_status(
+                "info", f"Identifying tools for action: {action.id}", False
+            )
+
+        fallback_results = await asyncio.gather(
+            *(select_tools(action) for action in fallback_actions),
+            return_exceptions=True,
+        )
+        selections.update(
+            (action.id, result)
+            for action, result in zip(fallback_actions, fallback_results)
+        )
+
+        # Apply in plan order so the resulting plan does not depend on call timing.
+        for action in actions_needing_tools:
+            selection = selections[action.id]
+            if isinstance(selection, BaseException):
+                if isinstance(selection, asyncio.CancelledError):
+                    raise selection
+                await self.emit_status(
+                    "warning",
+                    f"Failed to auto-select tools for {action.id}: {str(selection)}",
+                    False,
+                )
+                continue
+
+            logger.info(f"Available tool IDs: {available_tool_ids}")
+            logger.info(f"Valid tools for {action.id}: {selection}")
+
+            if selection:
+                action.tool_ids = selection
+                await self.emit_status(
+                    "success",
+                    f"Added tools to {action.id}: {', '.join(selection)}",
+                    False,
+                )
+            else:
                 await self.emit_status(
                     "warning",
-                    f"Failed to auto-select tools for {action.id}: {str(e)}",
+                    f"No suitable tools found for action {action.id}. Action may need manual review.",
                     False,
                 )
 
@@ -2492,11 +4620,12 @@ Return ONLY the enhanced template description. Do not include explanations, comm
 """
 
         try:
-            enhanced_template = await self.get_completion(
-                prompt=template_enhancement_prompt,
-                action_results={},
-                action=None,
-            )
+            async with self._validation_semaphore():
+                enhanced_template = await self.get_completion(
+                    prompt=template_enhancement_prompt,
+                    action_results={},
+                    action=None,
+                )
 
             final_synthesis.description = enhanced_template.strip()
 
@@ -2518,6 +4647,61 @@ Return ONLY the enhanced template description. Do not include explanations, comm
                 "warning", f"Failed to enhance template: {str(e)}", False
             )
 
+    def _log_lightweight_decision(
+        self,
+        decisions_log: dict[str, dict[str, Any]],
+        action: Action,
+        source: str,
+        use_lightweight: bool,
+        score: float,
+        features: dict[str, Any],
+        reason: str = "",
+    ) -> None:
+        """Record a lightweight context decision in the plan and as a JSON log line for threshold tuning."""
+
+        decision = {
+            "use_lightweight_context": use_lightweight,
+            "source": source,
+            "score": score,
+            "features": features,
+        }
+        if reason:
+            decision["reason"] = reason
+        decisions_log[action.id] = decision
+        logger.info(
+            json.dumps(
+                {"event": "lightweight_context_decision", "action_id": action.id, **decision},
+                ensure_ascii=False,
+            )
+        )
+
+    def _maybe_promote_lightweight_context(
+        self, plan: Plan, action: Action, context: dict[str, dict[str, Any]]
+    ) -> None:
+        """Re-score a candidate once its dependency outputs exist and promote it if clear-cut.
+
+        Only actions the planner did not send to the LLM are re-scored, so an explicit
+        model verdict is never overridden.
+        """
+
+        if (
+            not self.valves.ENABLE_LIGHTWEIGHT_CONTEXT_OPTIMIZATION
+            or not self.tool_integration_enabled
+            or action.use_lightweight_context
+            or not _is_lightweight_candidate(action)
+        ):
+            return
+        decisions_log = plan.metadata.setdefault("lightweight_context_decisions", {})
+        if decisions_log.get(action.id, {}).get("source") == "llm":
+            return
+        features = _lightweight_context_features(action, context)
+        score = _score_lightweight_context(features)
+        if score >= self.valves.LIGHTWEIGHT_ACCEPT_THRESHOLD:
+            action.use_lightweight_context = True
+            self._log_lightweight_decision(
+                decisions_log, action, "execution", True, score, features
+            )
+
     async def validate_and_flag_lightweight_context(self, plan: Plan):
         """Analyze the plan and flag appropriate actions for lightweight context mode using LLM categorization."""
         if not self.tool_integration_enabled:
@@ -2532,88 +4716,66 @@ Return ONLY the enhanced template description. Do not include explanations, comm
             "info", "Analyzing plan for lightweight context optimization...", False
         )
 
-        lightweight_candidates: list[Action] = []
-
-        for action in plan.actions:
-
-            if action.id == "final_synthesis":
-                continue
-            if not action.dependencies:
-                continue
-
-            if len(action.dependencies) == 1:
-                continue
-
-            has_file_operations = any(
-                keyword in action.description.lower()
-                for keyword in [
-                    "save",
-                    "organize",
-                    "file",
-                    "folder",
-                    "archive",
-                    "store",
-                    "obsidian",
-                    "vault",
-                ]
-            )
-
-            has_many_dependencies = len(action.dependencies) > 3
-
-            has_tools = bool(action.tool_ids)
-
-            is_candidate = has_file_operations or (has_tools and has_many_dependencies)
+        decisions_log: dict[str, dict[str, Any]] = plan.metadata.setdefault(
+            "lightweight_context_decisions", {}
+        )
+        accept_threshold = self.valves.LIGHTWEIGHT_ACCEPT_THRESHOLD
+        reject_threshold = self.valves.LIGHTWEIGHT_REJECT_THRESHOLD
+        completed_outputs = {
+            a.id: a.output for a in plan.actions if a.output is not None
+        }
 
-            if is_candidate:
+        lightweight_candidates: list[Action] = []
+        locally_decided = 0
+
+        for action in [a for a in plan.actions if _is_lightweight_candidate(a)]:
+            features = _lightweight_context_features(action, completed_outputs)
+            score = _score_lightweight_context(features)
+            if score >= accept_threshold or score <= reject_threshold:
+                use_lightweight = score >= accept_threshold
+                # A reject is only logged, like an LLM "NO": it never clears a flag
+                # the planner set in the plan JSON.
+                if use_lightweight:
+                    action.use_lightweight_context = True
+                locally_decided += 1
+                self._log_lightweight_decision(
+                    decisions_log, action, "local", use_lightweight, score, features
+                )
+                if use_lightweight:
+                    await self.emit_status(
+                        "info",
+                        f"Flagged action '{action.id}' for lightweight context mode (local score {score}).",
+                        False,
+                    )
+            else:
+                decisions_log[action.id] = {"score": score, "features": features}
                 lightweight_candidates.append(action)
 
         if not lightweight_candidates:
             await self.emit_status(
                 "info",
-                "No actions identified for lightweight context optimization.",
+                (
+                    f"Lightweight context decided locally for {locally_decided} action(s); no LLM review needed."
+                    if locally_decided
+                    else "No actions identified for lightweight context optimization."
+                ),
                 False,
             )
             return
 
         await self.emit_status(
             "info",
-            f"Found {len(lightweight_candidates)} candidate action(s) for lightweight context analysis.",
-            False,
-        )
-
-        for action in lightweight_candidates:
-            categorization_prompt = f"""
-You are an expert at analyzing whether an action should use lightweight context mode.
-
-CRITICAL UNDERSTANDING - LIGHTWEIGHT CONTEXT MODE:
-- Lightweight context = Action receives only METADATA about dependencies (content type, length, brief description)
-- Full context = Action receives complete primary_output content from dependencies
-- @action_id references in tool parameters work in BOTH modes (they auto-resolve to full content)
-- The key difference: Can the action work effectively with just @action_id references, or does it need to read/analyze the full content in its reasoning?
-
-WHEN TO USE LIGHTWEIGHT CONTEXT:
-✅ SHOULD USE (action works with @action_id references in tools):
-- File operations that save/organize content: uses @action_id in file paths/content parameters
-- Obsidian/note operations: uses @action_id to reference content to save
-- Data compilation: uses @action_id to gather content into tools
-- Archive/backup operations: uses @action_id to specify what to archive
-- Organization tasks: uses @action_id to reference what to organize
-- Actions that primarily MOVE, SAVE, or ORGANIZE existing content
-
-❌ SHOULD NOT USE (action needs full content for reasoning/analysis):
-- Content analysis: needs to READ and analyze actual content for decision-making
-- Image generation based on content: needs full text to understand what image to create
-- Content creation that builds upon previous content: needs full context for coherent writing
-- Summarization: needs full content to create accurate summaries
-- Translation: needs full source text for accurate translation
-- Quality assessment: needs full content to evaluate
-- Actions that need to read, understand, or analyze content for their reasoning
+            f"Found {len(lightweight_candidates)} candidate action(s) for lightweight context analysis.",
+            False,
+        )
 
-KEY INSIGHT - @action_id vs CONTENT ANALYSIS:
-- Actions that use @action_id in tool parameters to pass content → YES lightweight
-- Actions that need to read/understand content for decision-making → NO lightweight
-- File saving with @chapter_content works with lightweight (just passes reference)
-- Image generation needs full chapter content for reasoning (needs to understand what to illustrate)
+        semaphore = self._validation_semaphore()
+
+        async def categorize(action: Action) -> bool:
+            categorization_prompt = f"""
+You are an expert at analyzing whether an action should use lightweight context mode.
+
+{_LIGHTWEIGHT_CONTEXT_RUBRIC}
 
 ACTION TO ANALYZE:
 - ID: {action.id}
@@ -2623,50 +4785,160 @@ ACTION TO ANALYZE:
 - Dependencies: {action.dependencies}
 - Dependencies count: {len(action.dependencies)}
 
-ANALYSIS LOGIC:
-1. Does this action need to READ/analyze the actual content of dependencies? → NO lightweight
-2. Does this action work by saving/organizing content using references? → YES lightweight  
-3. Is this image generation that needs source content for context? → NO lightweight
-4. Is this file/note organization that works with content IDs? → YES lightweight
-
-EXAMPLES WITH REASONING:
-- "Generate illustration for chapter" → NO (needs to understand chapter content to decide what to illustrate)
-- "Save chapters to Obsidian vault" → YES (uses @chapter_id to save, doesn't need to analyze content)
-- "Organize all content into folder structure" → YES (uses @action_id references to organize by reference)
-- "Create summary based on research" → NO (needs to read and analyze research content for summarization)
-- "Compile all reports into ZIP file" → YES (uses @report_id references, doesn't analyze content)
-- "Write conclusion based on analysis" → NO (needs to read analysis content for reasoning)
+{_LIGHTWEIGHT_CONTEXT_EXAMPLES}
 
 Return ONLY "YES" if the action should use lightweight context, or "NO" if it should not.
 """
 
-            try:
+            async with semaphore:
                 categorization_result = await self.get_completion(
                     prompt=categorization_prompt,
                     action_results={},
                     action=None,
                 )
+            return categorization_result.strip().upper() == "YES"
 
-                should_use_lightweight = categorization_result.strip().upper() == "YES"
+        async def categorize_batch(actions: list[Action]) -> dict[str, dict[str, Any]]:
+            """Classify every candidate in one call; returns only well-formed entries."""
 
-                if should_use_lightweight:
-                    action.use_lightweight_context = True
-                    logger.info(
-                        f"LLM flagged action '{action.id}' for lightweight context mode"
-                    )
-                    await self.emit_status(
-                        "info",
-                        f"LLM flagged action '{action.id}' for lightweight context mode.",
-                        False,
-                    )
-                else:
-                    logger.info(
-                        f"LLM determined action '{action.id}' should not use lightweight context"
-                    )
+            candidates = [
+                {
+                    "action_id": action.id,
+                    "description": action.description,
+                    "type": action.type,
+                    "tool_ids": action.tool_ids or [],
+                    "dependencies": action.dependencies,
+                }
+                for action in actions
+            ]
+            batch_prompt = f"""
+You are an expert at analyzing whether actions should use lightweight context mode.
+
+{_LIGHTWEIGHT_CONTEXT_RUBRIC}
+
+ACTIONS TO ANALYZE:
+{json.dumps(candidates, indent=2)}
+
+{_LIGHTWEIGHT_CONTEXT_EXAMPLES}
+
+OUTPUT FORMAT:
+Return a JSON object with one classification per action, using the exact action_id values above:
+{{"classifications": [{{"action_id": "...", "use_lightweight_context": true, "reason": "one short sentence"}}]}}
+"""
+            batch_format: dict[str, Any] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "lightweight_context_classification",
+                    "strict": True,
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "classifications": {
+                                "type": "array",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "action_id": {"type": "string"},
+                                        "use_lightweight_context": {"type": "boolean"},
+                                        "reason": {"type": "string"},
+                                    },
+                                    "required": [
+                                        "action_id",
+                                        "use_lightweight_context",
+                                        "reason",
+                                    ],
+                                    "additionalProperties": False,
+                                },
+                            }
+                        },
+                        "required": ["classifications"],
+                        "additionalProperties": False,
+                    },
+                },
+            }
+
+            async with semaphore:
+                result = await self.get_completion(
+                    prompt=batch_prompt,
+                    format=batch_format,
+                    action_results={},
+                    action=None,
+                )
+
+            entries = json.loads(clean_json_response(result)).get("classifications", [])
+            requested_ids = {action.id for action in actions}
+            classified: dict[str, dict[str, Any]] = {}
+            for entry in entries if isinstance(entries, list) else []:
+                if not isinstance(entry, dict):
+                    continue
+                action_id = entry.get("action_id")
+                flag = entry.get("use_lightweight_context")
+                if action_id in requested_ids and isinstance(flag, bool):
+                    classified[action_id] = {
+                        "use_lightweight_context": flag,
+                        "reason": str(entry.get("reason", "")),
+                    }
+            return classified
+
+        decisions: dict[str, bool | BaseException] = {}
+        fallback_candidates = list(lightweight_candidates)
 
+        if self.valves.BATCH_LIGHTWEIGHT_CLASSIFICATION and len(lightweight_candidates) > 1:
+            try:
+                classified = await categorize_batch(lightweight_candidates)
             except Exception as e:
-                logger.warning(f"Failed to categorize action '{action.id}': {str(e)}")
+                logger.warning(f"Batched lightweight classification failed: {e}")
+                classified = {}
+            for action_id, classification in classified.items():
+                decisions[action_id] = classification["use_lightweight_context"]
+                decisions_log[action_id]["reason"] = classification["reason"]
+            fallback_candidates = [
+                action for action in lightweight_candidates if action.id not in decisions
+            ]
+
+        fallback_results = await asyncio.gather(
+            *(categorize(action) for action in fallback_candidates),
+            return_exceptions=True,
+        )
+        decisions.update(
+            (action.id, result)
+            for action, result in zip(fallback_candidates, fallback_results)
+        )
+
+        for action in lightweight_candidates:
+            decision = decisions[action.id]
+            if isinstance(decision, BaseException):
+                if isinstance(decision, asyncio.CancelledError):
+                    raise decision
+                logger.warning(
+                    f"Failed to categorize action '{action.id}': {str(decision)}"
+                )
                 continue
+            entry = decisions_log[action.id]
+            self._log_lightweight_decision(
+                decisions_log,
+                action,
+                "llm",
+                bool(decision),
+                entry["score"],
+                entry["features"],
+                entry.get("reason", ""),
+            )
+
+            if decision:
+                action.use_lightweight_context = True
+                logger.info(
+                    f"LLM flagged action '{action.id}' for lightweight context mode"
+                )
+                await self.emit_status(
+                    "info",
+                    f"LLM flagged action '{action.id}' for lightweight context mode.",
+                    False,
+                )
+            else:
+                logger.info(
+                    f"LLM determined action '{action.id}' should not use lightweight context"
+                )
 
         flagged_count = len(
             [a for a in lightweight_candidates if a.use_lightweight_context]
@@ -2821,6 +5093,7 @@ Return ONLY "YES" if the action should use lightweight context, or "NO" if it sh
 
                     action.tool_calls.clear()
                     action.tool_results.clear()
+                    action.tool_turns.clear()
 
                 if current_attempt == 0:
                     await self.emit_status(
@@ -2832,17 +5105,8 @@ Return ONLY "YES" if the action should use lightweight context, or "NO" if it sh
                 try:
                     tools: dict[str, dict[Any, Any]] = {}
                     if self.tool_integration_enabled and action.tool_ids:
-                        extra_params: dict[str, Any] = {
-                            "__event_emitter__": self.__current_event_emitter__,
-                            "__user__": self.user,
-                            "__request__": self.__request__,
-                        }
-
-                        tools = await get_tools(  # type: ignore
-                            self.__request__,
-                            action.tool_ids,
-                            self.__user__,
-                            extra_params,
+                        tools = await self.run_context.tool_registry.resolve(
+                            action.tool_ids, self._load_tools
                         )
 
                     execution_model = (
@@ -2876,17 +5140,18 @@ Return ONLY "YES" if the action should use lightweight context, or "NO" if it sh
                         },
                     }
 
-                    response = await self.get_completion(
-                        prompt=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": attempt_prompt},
-                        ],
-                        model=execution_model,
-                        tools=tools,
-                        format=action_format,
-                        action_results=context,
-                        action=action,
-                    )
+                    with _bypass_llm_cache():
+                        response = await self.get_completion(
+                            prompt=[
+                                {"role": "system", "content": system_prompt},
+                                {"role": "user", "content": attempt_prompt},
+                            ],
+                            model=execution_model,
+                            tools=tools,
+                            format=action_format,
+                            action_results=context,
+                            action=action,
+                        )
 
                     logger.info(f"response complete  : {response}")
 
@@ -2933,17 +5198,21 @@ Return ONLY "YES" if the action should use lightweight context, or "NO" if it sh
                         )
                         raise api_error
 
-                await self.emit_status(
-                    "info",
-                    "Analyzing output ...",
-                    False,
-                )
+                current_reflection = self._pre_evaluate_output(action, response)
+                if current_reflection is None:
+                    report_provisional = _PROVISIONAL_OUTPUT_CALLBACK.get()
+                    if report_provisional is not None:
+                        report_provisional(action, current_output)
 
-                current_reflection = await self.analyze_output(
-                    plan=plan,
-                    action=action,
-                    output=response,
-                )
+                    await self.emit_status(
+                        "info",
+                        "Analyzing output ...",
+                        False,
+                    )
+
+                    current_reflection = await self._judge_output(
+                        plan, action, response
+                    )
 
                 quality_status = self._format_quality_status(current_reflection)
                 await self.emit_status(
@@ -2997,11 +5266,14 @@ Return ONLY "YES" if the action should use lightweight context, or "NO" if it sh
                         action, str(e)
                     )
                     if user_decision == "retry":
+                        if action.tool_ids:
+                            self.run_context.tool_registry.invalidate(action.tool_ids)
                         action.status = "pending"
                         action.start_time = None
                         action.end_time = None
                         action.tool_calls.clear()
                         action.tool_results.clear()
+                        action.tool_turns.clear()
                         return await self.execute_action(
                             plan, action, context, step_number
                         )
@@ -3026,6 +5298,7 @@ Return ONLY "YES" if the action should use lightweight context, or "NO" if it sh
                 action.end_time = None
                 action.tool_calls.clear()
                 action.tool_results.clear()
+                action.tool_turns.clear()
                 return await self.execute_action(plan, action, context, step_number)
             else:
                 raise UserAbortedException(
@@ -3056,6 +5329,7 @@ Return ONLY "YES" if the action should use lightweight context, or "NO" if it sh
                 action.end_time = None
                 action.tool_calls.clear()
                 action.tool_results.clear()
+                action.tool_turns.clear()
                 return await self.execute_action(plan, action, context, step_number)
             else:
                 if action.params and "user_guidance" in action.params:
@@ -3077,30 +5351,456 @@ Return ONLY "YES" if the action should use lightweight context, or "NO" if it sh
 
         return best_output
 
-    async def analyze_output(
-        self,
-        plan: Plan,
-        action: Action,
-        output: str,
+    def _pre_evaluate_output(
+        self, action: Action, output: str
+    ) -> ReflectionResult | None:
+        """Decide mechanically checkable verdicts locally, before the LLM judge.
+
+        Returns a ReflectionResult for clearly broken outputs (non-JSON, empty or
+        deferring primary_output, content placed in supporting_details, expected
+        tools never called) and, when PRE_EVALUATION_FAST_ACCEPT_MIN_CHARS is set,
+        for large well-formed outputs of non-critical steps. Returns None when the
+        output needs the LLM judge.
+        """
+
+        if not self.valves.ENABLE_LOCAL_PRE_EVALUATION:
+            return None
+
+        def reject(score: float, issue: str, suggestion: str) -> ReflectionResult:
+            logger.info(f"Pre-evaluation rejected {action.id}: {issue}")
+            return ReflectionResult(
+                is_successful=False,
+                quality_score=score,
+                issues=[issue],
+                suggestions=[suggestion],
+            )
+
+        try:
+            parsed = json.loads(clean_json_response(output))
+        except (json.JSONDecodeError, TypeError):
+            parsed = None
+        if not isinstance(parsed, dict) or "primary_output" not in parsed:
+            return reject(
+                0.3,
+                "The output is not a JSON object with primary_output and supporting_details fields.",
+                'Return a single JSON object: {"primary_output": "...", "supporting_details": "..."}.',
+            )
+
+        primary = str(parsed.get("primary_output") or "").strip()
+        supporting = str(parsed.get("supporting_details") or "").strip()
+        if not primary:
+            return reject(
+                0.1,
+                "primary_output is empty.",
+                "Put the complete deliverable in primary_output.",
+            )
+        # Only a short primary_output can be nothing but a pointer; long ones that
+        # open with "See the table below." carry the deliverable themselves.
+        if len(primary) < 200 and re.match(
+            r"^(please\s+)?(see|refer\s+to|check)\b.{0,40}\b(supporting[\s_]+details|below)\b",
+            primary,
+            re.IGNORECASE,
+        ):
+            return reject(
+                0.1,
+                "primary_output only points to supporting_details instead of containing the deliverable.",
+                "Move the main content into primary_output; keep supporting_details for context only.",
+            )
+        if len(primary) < 200 and len(supporting) > max(500, 4 * len(primary)):
+            return reject(
+                0.1,
+                "The main content is in supporting_details while primary_output holds only a brief summary.",
+                "Move the main content into primary_output; keep supporting_details for context only.",
+            )
+        if self.tool_integration_enabled and action.tool_ids and not action.tool_calls:
+            return reject(
+                0.2,
+                f"The action was expected to use tools {action.tool_ids} but no tools were called.",
+                f"Call the required tool(s) {action.tool_ids} and build the output from their results.",
+            )
+
+        min_chars = int(self.valves.PRE_EVALUATION_FAST_ACCEPT_MIN_CHARS or 0)
+        critical = (
+            action.id == "final_synthesis"
+            or action.type in ("tool", "code")
+            or bool(action.tool_ids)
+        )
+        if min_chars > 0 and not critical and len(primary) >= min_chars:
+            logger.info(f"Pre-evaluation fast-accepted {action.id} ({len(primary)} chars)")
+            return ReflectionResult(
+                is_successful=True, quality_score=0.8, issues=[], suggestions=[]
+            )
+
+        return None
+
+    def _reflection_cache_key(self, plan: Plan, action: Action, output: str) -> str | None:
+        if int(self.valves.REFLECTION_CACHE_MAX_ENTRIES or 0) <= 0:
+            return None
+        return _ReflectionCache.key(
+            plan.goal,
+            action.description,
+            list(action.tool_ids or []),
+            list(action.tool_calls),
+            dict(action.tool_results),
+            output,
+            self.tool_integration_enabled,
+            [self.valves.JUDGE_MODEL, self.valves.JUDGE_ESCALATION_MODEL],
+        )
+
+    def _cached_reflection(self, key: str | None) -> ReflectionResult | None:
+        if key is None:
+            return None
+        cached = self._reflection_cache.get(key)
+        if cached is None:
+            return None
+        logger.info("Reusing cached evaluation for an identical output")
+        return ReflectionResult(**cached)
+
+    def _store_reflection(self, key: str | None, reflection: ReflectionResult) -> None:
+        if key is not None:
+            self._reflection_cache.put(
+                key,
+                reflection.model_dump(),
+                int(self.valves.REFLECTION_CACHE_MAX_ENTRIES or 0),
+            )
+
+    def _reflection_batcher(self) -> _ReflectionBatcher | None:
+        """Return the run's evaluation batcher, or None when batching is disabled."""
+
+        window = float(self.valves.REFLECTION_BATCH_WINDOW_SECONDS or 0)
+        if window <= 0 or int(self.valves.REFLECTION_BATCH_MAX_ITEMS or 0) <= 1:
+            return None
+        run_context = self.run_context
+        if run_context.reflection_batcher is None:
+            run_context.reflection_batcher = _ReflectionBatcher(
+                self._judge_reflection_batch,
+                window,
+                int(self.valves.REFLECTION_BATCH_MAX_ITEMS),
+                int(self.valves.REFLECTION_BATCH_CHAR_BUDGET or 0),
+            )
+        return run_context.reflection_batcher
+
+    async def _judge_output(
+        self, plan: Plan, action: Action, output: str
     ) -> ReflectionResult:
+        """Evaluate an action output, batched with concurrent evaluations when enabled."""
+
+        batcher = self._reflection_batcher()
+        if batcher is None:
+            return await self.analyze_output(plan=plan, action=action, output=output)
+        cached = self._cached_reflection(self._reflection_cache_key(plan, action, output))
+        if cached is not None:
+            return cached
+        return await batcher.submit((plan, action, output), len(output))
+
+    async def _judge_reflection_batch(
+        self, items: list[tuple[Plan, Action, str]]
+    ) -> list[ReflectionResult]:
+        """Evaluate several outputs in one structured call; unanswered items are judged alone."""
+
+        if len(items) == 1:
+            plan, action, output = items[0]
+            return [await self.analyze_output(plan=plan, action=action, output=output)]
+
+        goals = {plan.goal for plan, _, _ in items}
+        prompt_lines = [
+            "You are an expert evaluator for a generalist agent.",
+            "Analyze the output of EACH action below based on the project goal and the action's description. Judge every item independently.",
+            "",
+        ]
+        if len(goals) == 1:
+            prompt_lines.extend([f"Overall Goal: {next(iter(goals))}", ""])
+        # A speculative run and the real rerun of one action can share a batch, so
+        # repeated ids get a per-item suffix and every verdict maps to one item.
+        id_counts = collections.Counter(action.id for _, action, _ in items)
+        seen: collections.Counter[str] = collections.Counter()
+        item_keys: list[str] = []
+        for _, action, _ in items:
+            seen[action.id] += 1
+            item_keys.append(
+                action.id if id_counts[action.id] == 1 else f"{action.id}#{seen[action.id]}"
+            )
+        for index, ((plan, action, output), item_key) in enumerate(
+            zip(items, item_keys), start=1
+        ):
+            prompt_lines.append(f"### Item {index} - action_id: {item_key}")
+            if len(goals) > 1:
+                prompt_lines.append(f"Overall Goal: {plan.goal}")
+            prompt_lines.extend(self._reflection_item_lines(action, output))
 
-        expected_tools = action.tool_ids if action.tool_ids else []
-        actual_tool_calls = action.tool_calls
-        tool_results_summary = {
-            tool: result[:200] + "..." if len(result) > 200 else result
-            for tool, result in action.tool_results.items()
+        rubric_lines, scoring_lines = self._reflection_rubric_lines(None)
+        response_schema_block = textwrap.dedent("""
+            Your response MUST be a single, valid JSON object with one evaluation per item, using the exact action_id values above. Do not add any text before or after the JSON object.
+            {
+                "evaluations": [
+                    {
+                        "action_id": "<action_id>",
+                        "is_successful": <boolean>,
+                        "quality_score": <float, 0.0-1.0>,
+                        "issues": ["<A list of specific, concise issues found in the output>"],
+                        "suggestions": ["<A list of actionable suggestions to fix the issues>"]
+                    }
+                ]
+            }
+        """).strip()
+        batch_prompt = "\n".join(
+            prompt_lines + rubric_lines + [response_schema_block] + scoring_lines
+        )
+
+        batch_format: dict[str, Any] = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "batch_reflection_analysis",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "evaluations": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "action_id": {"type": "string"},
+                                    "is_successful": {"type": "boolean"},
+                                    "quality_score": {
+                                        "type": "number",
+                                        "minimum": 0.0,
+                                        "maximum": 1.0,
+                                    },
+                                    "issues": {
+                                        "type": "array",
+                                        "items": {"type": "string"},
+                                    },
+                                    "suggestions": {
+                                        "type": "array",
+                                        "items": {"type": "string"},
+                                    },
+                                },
+                                "required": [
+                                    "action_id",
+                                    "is_successful",
+                                    "quality_score",
+                                    "issues",
+                                    "suggestions",
+                                ],
+                                "additionalProperties": False,
+                            },
+                        }
+                    },
+                    "required": ["evaluations"],
+                    "additionalProperties": False,
+                },
+            },
+        }
+
+        evaluations: dict[str, ReflectionResult] = {}
+        batch_plan = items[0][0]
+        try:
+            started = time.monotonic()
+            result = await self.get_completion(
+                prompt=batch_prompt,
+                model=self.valves.JUDGE_MODEL,
+                format=batch_format,
+                action_results={},
+                action=None,
+            )
+            self._record_judge_call(
+                batch_plan, self.valves.JUDGE_MODEL, time.monotonic() - started
+            )
+            entries = json.loads(clean_json_response(result)).get("evaluations", [])
+            entries = entries if isinstance(entries, list) else []
+            answered = collections.Counter(
+                str(entry.get("action_id")) for entry in entries if isinstance(entry, dict)
+            )
+            for entry in entries:
+                if not isinstance(entry, dict) or not isinstance(
+                    entry.get("is_successful"), bool
+                ):
+                    continue
+                try:
+                    score = float(entry.get("quality_score"))
+                except (TypeError, ValueError):
+                    continue
+                entry_key = str(entry.get("action_id"))
+                if answered[entry_key] > 1:
+                    # Ambiguous answer; the affected items are judged on their own.
+                    continue
+                evaluations[entry_key] = ReflectionResult(
+                    is_successful=entry["is_successful"],
+                    quality_score=score,
+                    issues=[str(i) for i in entry.get("issues") or []],
+                    suggestions=[str(i) for i in entry.get("suggestions") or []],
+                )
+        except Exception as e:
+            logger.warning(f"Batched output analysis failed: {e}")
+        evaluations = {
+            item_key: evaluations[item_key]
+            for item_key in item_keys
+            if item_key in evaluations
         }
+        answered_items = [
+            (item_key, item)
+            for item_key, item in zip(item_keys, items)
+            if item_key in evaluations
+        ]
+        # Uncertain verdicts are escalated together so the batch keeps its latency.
+        escalated = await asyncio.gather(
+            *(
+                self._escalate_uncertain_judgement(
+                    plan,
+                    self._build_analysis_prompt(plan, action, output),
+                    evaluations[item_key],
+                )
+                for item_key, (plan, action, output) in answered_items
+            )
+        )
+        for (item_key, (plan, action, output)), reflection in zip(
+            answered_items, escalated
+        ):
+            evaluations[item_key] = reflection
+            self._store_reflection(
+                self._reflection_cache_key(plan, action, output), reflection
+            )
+
+        logger.info(
+            f"Batched output analysis answered {len(evaluations)}/{len(items)} items"
+        )
+        missing = [
+            (item_key, item)
+            for item_key, item in zip(item_keys, items)
+            if item_key not in evaluations
+        ]
+        fallback = await asyncio.gather(
+            *(
+                self.analyze_output(plan=plan, action=action, output=output)
+                for _, (plan, action, output) in missing
+            )
+        )
+        evaluations.update(
+            {item_key: reflection for (item_key, _), reflection in zip(missing, fallback)}
+        )
+        return [evaluations[item_key] for item_key in item_keys]
+
+    def _judge_model_label(self, model: str) -> str:
+        return model or self.valves.ACTION_MODEL or self.valves.MODEL or "default"
+
+    def _update_judge_stats(self, plan: Plan, model: str, **changes: float) -> None:
+        """Add ``changes`` to the judge statistics of ``model`` for the Pipe and the plan."""
+
+        label = self._judge_model_label(model)
+        for stats in (self._judge_stats, plan.metadata.setdefault("judge_stats", {})):
+            entry = stats.setdefault(
+                label,
+                {
+                    "calls": 0,
+                    "total_seconds": 0.0,
+                    "mean_seconds": 0.0,
+                    "escalations": 0,
+                    "agreements": 0,
+                    "disagreements": 0,
+                },
+            )
+            for key, value in changes.items():
+                entry[key] += value
+            if entry["calls"]:
+                entry["mean_seconds"] = round(entry["total_seconds"] / entry["calls"], 3)
+
+    def _record_judge_call(self, plan: Plan, model: str, seconds: float) -> None:
+        self._update_judge_stats(plan, model, calls=1, total_seconds=seconds)
+
+    def _judgement_is_uncertain(self, reflection: ReflectionResult) -> bool:
+        """True when the score is near the pass threshold or contradicts the verdict."""
+
+        threshold = float(self.valves.JUDGE_PASS_THRESHOLD)
+        margin = float(self.valves.JUDGE_ESCALATION_MARGIN)
+        score = float(reflection.quality_score)
+        if abs(score - threshold) <= margin:
+            return True
+        return bool(reflection.is_successful) != (score >= threshold)
+
+    async def _escalate_uncertain_judgement(
+        self, plan: Plan, analysis_prompt: str, reflection: ReflectionResult
+    ) -> ReflectionResult:
+        """Re-judge an uncertain verdict with JUDGE_ESCALATION_MODEL; its verdict wins."""
+
+        judge_model = self.valves.JUDGE_MODEL
+        escalation_model = self.valves.JUDGE_ESCALATION_MODEL
+        if (
+            not escalation_model
+            or self._judge_model_label(escalation_model)
+            == self._judge_model_label(judge_model)
+            or not self._judgement_is_uncertain(reflection)
+        ):
+            return reflection
+
+        self._update_judge_stats(plan, judge_model, escalations=1)
+        started = time.monotonic()
+        try:
+            response = await self.get_completion(
+                prompt=analysis_prompt,
+                model=escalation_model,
+                format=_REFLECTION_ANALYSIS_FORMAT,
+                action_results={},
+                action=None,
+            )
+            escalated = ReflectionResult(**json.loads(clean_json_response(response)))
+        except Exception as e:
+            logger.warning(f"Judge escalation to {escalation_model} failed: {e}")
+            return reflection
+        finally:
+            self._record_judge_call(plan, escalation_model, time.monotonic() - started)
+
+        agreed = bool(escalated.is_successful) == bool(reflection.is_successful)
+        self._update_judge_stats(
+            plan,
+            escalation_model,
+            agreements=1 if agreed else 0,
+            disagreements=0 if agreed else 1,
+        )
+        logger.info(
+            f"Escalated judgement to {escalation_model}: {reflection.quality_score:.2f} -> {escalated.quality_score:.2f} ({'agreed' if agreed else 'disagreed'})"
+        )
+        return escalated
+
+    def _build_analysis_prompt(self, plan: Plan, action: Action, output: str) -> str:
+        """Build the single-output evaluation prompt used by analyze_output."""
 
         header_lines = [
             "You are an expert evaluator for a generalist agent.",
             "Analyze the output of an action based on the project goal and the action's description.",
             "",
             f"Overall Goal: {plan.goal}",
-            f"Action Description: {action.description}",
-        ]
+        ] + self._reflection_item_lines(action, output)
+        rubric_lines, scoring_lines = self._reflection_rubric_lines(action)
+
+        response_schema_block = textwrap.dedent("""
+            Your response MUST be a single, valid JSON object with the following structure. Do not add any text before or after the JSON object.
+            {
+                "is_successful": <boolean>,
+                "quality_score": <float, 0.0-1.0>,
+                "issues": ["<A list of specific, concise issues found in the output>"],
+                "suggestions": ["<A list of actionable suggestions to fix the issues>"]
+            }
+        """).strip()
+
+        return "\n".join(
+            header_lines + rubric_lines + [response_schema_block] + scoring_lines
+        )
+
+    def _reflection_item_lines(self, action: Action, output: str) -> list[str]:
+        """Describe one action output to evaluate: description, tool usage and the output itself."""
+
+        expected_tools = action.tool_ids if action.tool_ids else []
+        actual_tool_calls = action.tool_calls
+        tool_results_summary = {
+            tool: result[:200] + "..." if len(result) > 200 else result
+            for tool, result in action.tool_results.items()
+        }
+
+        lines = [f"Action Description: {action.description}"]
 
         if self.tool_integration_enabled:
-            header_lines.extend(
+            lines.extend(
                 [
                     f"Expected Tool(s): {expected_tools}",
                     f"Actually Called Tool(s): {actual_tool_calls}",
@@ -3109,7 +5809,7 @@ Return ONLY "YES" if the action should use lightweight context, or "NO" if it sh
                 ]
             )
         else:
-            header_lines.extend(
+            lines.extend(
                 [
                     "Tool integration is disabled for this evaluation; assess the output solely on the provided context and content.",
                     "Do not penalize the output for missing tool calls; tools are unavailable in this mode.",
@@ -3117,28 +5817,38 @@ Return ONLY "YES" if the action should use lightweight context, or "NO" if it sh
                 ]
             )
 
-        header_lines.extend(
-            [
-                "Action Output to Analyze:",
-                "---",
-                output,
-                "---",
-                "",
-                "CRITICAL FIELD USAGE VERIFICATION - AUTOMATIC FAILURE CONDITIONS:",
-                "- PRIMARY_OUTPUT must contain the MAIN DELIVERABLE content (the actual result users need)",
-                "- SUPPORTING_DETAILS must contain only ADDITIONAL CONTEXT, metadata, or explanatory information",
-                "- If the main content/deliverable is in supporting_details instead of primary_output: AUTOMATIC quality_score = 0.1",
-                "- If primary_output contains only brief summaries while actual content is in supporting_details: AUTOMATIC quality_score = 0.1",
-                '- If primary_output is empty or just says "See supporting details": AUTOMATIC quality_score = 0.1',
-                "",
-            ]
-        )
+        lines.extend(["Action Output to Analyze:", "---", output, "---", ""])
+        return lines
+
+    def _reflection_rubric_lines(
+        self, action: Action | None
+    ) -> tuple[list[str], list[str]]:
+        """Return the evaluation rubric split around the response schema.
+
+        With ``action`` the tool verification names its expected and called tools;
+        without it (batched evaluation) the rubric refers to each item's own fields.
+        """
+
+        header_lines = [
+            "CRITICAL FIELD USAGE VERIFICATION - AUTOMATIC FAILURE CONDITIONS:",
+            "- PRIMARY_OUTPUT must contain the MAIN DELIVERABLE content (the actual result users need)",
+            "- SUPPORTING_DETAILS must contain only ADDITIONAL CONTEXT, metadata, or explanatory information",
+            "- If the main content/deliverable is in supporting_details instead of primary_output: AUTOMATIC quality_score = 0.1",
+            "- If primary_output contains only brief summaries while actual content is in supporting_details: AUTOMATIC quality_score = 0.1",
+            '- If primary_output is empty or just says "See supporting details": AUTOMATIC quality_score = 0.1',
+            "",
+        ]
 
         if self.tool_integration_enabled:
+            missing_tools_line = (
+                f"- If the action was expected to use tools ({action.tool_ids or []}) but no tools were called ({action.tool_calls}), this is a MAJOR failure"
+                if action is not None
+                else "- If an action was expected to use tools (Expected Tool(s)) but no tools were called (Actually Called Tool(s)), this is a MAJOR failure"
+            )
             header_lines.extend(
                 [
                     "CRITICAL TOOL VERIFICATION:",
-                    f"- If the action was expected to use tools ({expected_tools}) but no tools were called ({actual_tool_calls}), this is a MAJOR failure",
+                    missing_tools_line,
                     "- If tools were called, verify that the output actually incorporates their results meaningfully",
                     "- If the output claims tools were used but no actual tool calls occurred, this is FALSE and should be heavily penalized",
                     "- Tool results should be properly processed and integrated into the final output",
@@ -3207,17 +5917,7 @@ Google's Gemini Advancements..."}
 
 Google's Gemini Advancements..."}
 
-            Remember: PRIMARY_OUTPUT = Main content that users need. SUPPORTING_DETAILS = Extra context only.
-        """).strip()
-
-        response_schema_block = textwrap.dedent("""
-            Your response MUST be a single, valid JSON object with the following structure. Do not add any text before or after the JSON object.
-            {
-                "is_successful": <boolean>,
-                "quality_score": <float, 0.0-1.0>,
-                "issues": ["<A list of specific, concise issues found in the output>"],
-                "suggestions": ["<A list of actionable suggestions to fix the issues>"]
-            }
+            Remember: PRIMARY_OUTPUT = Main content that users need. SUPPORTING_DETAILS = Extra context only.
         """).strip()
 
         scoring_lines = [
@@ -3247,74 +5947,55 @@ Google's Gemini Advancements..."}
             else "Be brutally honest. A high `quality_score` should only be given to high-quality outputs that follow the correct format and fully address the action."
         )
 
-        analysis_prompt = "\n".join(
-            header_lines
-            + [
-                "Instructions:",
-                "Critically evaluate the output based on the following criteria:",
-                instructions_block,
-                "",
-                examples_block,
-                "",
-                response_schema_block,
-                "",
-                "Scoring Guide:",
-                scoring_block,
-                "",
-                closing_line,
-            ]
-        )
+        rubric_lines = header_lines + [
+            "Instructions:",
+            "Critically evaluate the output based on the following criteria:",
+            instructions_block,
+            "",
+            examples_block,
+            "",
+        ]
+        scoring_tail = ["", "Scoring Guide:", scoring_block, "", closing_line]
+        return rubric_lines, scoring_tail
+
+    async def analyze_output(
+        self,
+        plan: Plan,
+        action: Action,
+        output: str,
+    ) -> ReflectionResult:
+
+        cache_key = self._reflection_cache_key(plan, action, output)
+        cached = self._cached_reflection(cache_key)
+        if cached is not None:
+            return cached
+
+        analysis_prompt = self._build_analysis_prompt(plan, action, output)
+        judge_model = self.valves.JUDGE_MODEL
 
         # Retry loop for analysis
         attempts_remaining = self.valves.MAX_RETRIES
         while attempts_remaining >= 0:
             analysis_response = ""
             try:
-                reflection_format: dict[str, Any] = {
-                    "type": "json_schema",
-                    "json_schema": {
-                        "name": "reflection_analysis",
-                        "strict": True,
-                        "schema": {
-                            "type": "object",
-                            "properties": {
-                                "is_successful": {"type": "boolean"},
-                                "quality_score": {
-                                    "type": "number",
-                                    "minimum": 0.0,
-                                    "maximum": 1.0,
-                                },
-                                "issues": {
-                                    "type": "array",
-                                    "items": {"type": "string"},
-                                },
-                                "suggestions": {
-                                    "type": "array",
-                                    "items": {"type": "string"},
-                                },
-                            },
-                            "required": [
-                                "is_successful",
-                                "quality_score",
-                                "issues",
-                                "suggestions",
-                            ],
-                            "additionalProperties": False,
-                        },
-                    },
-                }
-
+                started = time.monotonic()
                 analysis_response = await self.get_completion(
                     prompt=analysis_prompt,
-                    format=reflection_format,
+                    model=judge_model,
+                    format=_REFLECTION_ANALYSIS_FORMAT,
                     action_results={},
                     action=None,
                 )
+                self._record_judge_call(plan, judge_model, time.monotonic() - started)
 
                 clean_response = clean_json_response(analysis_response)
                 analysis_data = json.loads(clean_response)
 
-                return ReflectionResult(**analysis_data)
+                reflection = await self._escalate_uncertain_judgement(
+                    plan, analysis_prompt, ReflectionResult(**analysis_data)
+                )
+                self._store_reflection(cache_key, reflection)
+                return reflection
 
             except (json.JSONDecodeError, TypeError, KeyError) as e:
                 logger.error(
@@ -3731,201 +6412,668 @@ Google's Gemini Advancements..."}
         }
 
 
-    async def execute_plan(self, plan: Plan) -> None:
-        """
-        Execute the complete plan based on dependencies.
-        Handles a special 'final_synthesis' action for templating.
+    def _restore_plan_from_journal(self, events: list[dict[str, Any]]) -> Plan | None:
+        """Rebuild a plan and its completed actions from journal events, or None if not resumable."""
+
+        plan_event = next((e for e in events if e.get("event") == "plan"), None)
+        if plan_event is None or any(e.get("event") == "complete" for e in events):
+            return None
+        ttl = self.valves.RUN_JOURNAL_TTL_SECONDS
+        if ttl and ttl > 0:
+            created_at = plan_event.get("created_at")
+            if (
+                not isinstance(created_at, (int, float))
+                or time.time() - created_at > ttl
+            ):
+                logger.info(
+                    "Run journal is older than RUN_JOURNAL_TTL_SECONDS; starting fresh"
+                )
+                return None
+
+        plan_data = plan_event.get("plan", {})
+        plan = Plan(
+            goal=plan_data.get("goal", ""),
+            actions=[Action(**a) for a in plan_data.get("actions", [])],
+            metadata=plan_data.get("metadata", {}) or {},
+        )
+        actions_by_id = {action.id: action for action in plan.actions}
+
+        for event in events:
+            if event.get("event") != "action":
+                continue
+            action_data = event.get("action", {})
+            action = actions_by_id.get(action_data.get("id"))
+            if action is None:
+                continue
+            for key, value in action_data.items():
+                setattr(action, key, value)
+            for metadata_key, event_key in (
+                ("raw_action_outputs", "raw_output"),
+                ("action_quality", "quality"),
+                ("action_timings", "seconds"),
+            ):
+                if event.get(event_key) is not None:
+                    plan.metadata.setdefault(metadata_key, {})[action.id] = event[
+                        event_key
+                    ]
+        return plan
+
+    async def _append_journal_event(self, event: dict[str, Any], start: bool = False):
+        journal = self.run_context.journal
+        if journal is None:
+            return
+        try:
+            await asyncio.to_thread(journal.start if start else journal.append, event)
+        except OSError as e:
+            logger.warning(f"Failed to write run journal {journal.path}: {e}")
+
+    async def _journal_completed_action(
+        self, plan: Plan, action: Action, step_number: int
+    ) -> None:
+        if self.run_context.journal is None:
+            return
+        await self._append_journal_event(
+            {
+                "event": "action",
+                "step": step_number,
+                "action": action.model_dump(),
+                "raw_output": plan.metadata.get("raw_action_outputs", {}).get(action.id),
+                "quality": plan.metadata.get("action_quality", {}).get(action.id),
+                "seconds": plan.metadata.get("action_timings", {}).get(action.id),
+                "recorded_at": datetime.now().isoformat(),
+            }
+        )
+
+    def _estimate_action_latency(self, action: Action) -> float:
+        """Estimate how long an action takes, preferring observed timings for its type."""
+
+        if action.id == "final_synthesis":
+            return 0.0
+        action_type = (action.type or "").lower()
+        if action_type in self._action_latency_history:
+            return self._action_latency_history[action_type]
+        return _DEFAULT_ACTION_LATENCY_ESTIMATES.get(
+            action_type, _FALLBACK_ACTION_LATENCY_ESTIMATE
+        )
+
+    def _record_action_latency(
+        self, plan: Plan, action: Action, duration_seconds: float
+    ) -> None:
+        """Store an action duration and fold it into the per-type latency history.
+
+        Only completed actions feed the history; failed, aborted or warning runs
+        would skew the critical-path estimates.
         """
-        self._emitted_messages = []
-        completed_results: dict[str, dict[str, str]] = {}
-        in_progress: set[str] = set()
-        completed: set[str] = set()
-        step_counter = 1
-        all_outputs: list[dict[str, int | str]] = []
-        completed_summaries: list[str] = []
 
-        async def can_execute(action: Action) -> bool:
-            return all(dep in completed for dep in action.dependencies)
+        plan.metadata.setdefault("action_timings", {})[action.id] = round(
+            duration_seconds, 3
+        )
+        if action.status != "completed":
+            return
+        action_type = (action.type or "").lower()
+        previous = self._action_latency_history.get(action_type)
+        self._action_latency_history[action_type] = (
+            duration_seconds
+            if previous is None
+            else 0.7 * previous + 0.3 * duration_seconds
+        )
 
-        while len(completed) < len(plan.actions):
-            await self.emit_full_state(plan, completed_summaries)
+    def _compute_action_priorities(self, plan: Plan) -> dict[str, float]:
+        """Compute dispatch priorities according to the SCHEDULING_POLICY valve."""
 
-            available = [
-                action
-                for action in plan.actions
-                if action.id not in completed
-                and action.id not in in_progress
-                and await can_execute(action)
-            ]
+        if self.valves.SCHEDULING_POLICY != "critical_path":
+            return {}
 
-            if not available:
-                if not in_progress:
-                    failed_actions = [a for a in plan.actions if a.status == "failed"]
-                    if failed_actions or len(completed) < len(plan.actions):
-                        logger.error(
-                            "Execution stalled. Not all actions could be completed."
-                        )
-                    break
-                await asyncio.sleep(0.1)
-                continue
+        weights = {
+            action.id: self._estimate_action_latency(action) for action in plan.actions
+        }
+        return _compute_critical_path_lengths(plan.actions, weights)
 
-            synthesis_action = next(
-                (a for a in available if a.id == "final_synthesis"), None
-            )
-            if synthesis_action:
-                action = synthesis_action
-                available.remove(action)
-            elif available and len(in_progress) < self.valves.CONCURRENT_ACTIONS:
-                action = available.pop(0)
-            else:
-                await asyncio.sleep(0.1)
-                continue
+    async def _skip_unexecutable_actions(self, plan: Plan) -> set[str]:
+        """Analyse the dependency graph up front and skip what can never run.
 
+        Cycles are broken or skipped according to CYCLE_BREAKING_POLICY; actions with
+        dependencies on unknown ids and everything downstream are skipped.
+        final_synthesis always runs and loses its dependencies on skipped actions.
+        """
+
+        broken_edges: list[tuple[str, str]] = []
+        if self.valves.CYCLE_BREAKING_POLICY == "break":
+            broken_edges = _break_dependency_cycles(plan.actions)
+        analysis = _analyze_dependency_graph(plan.actions)
+
+        skipped = set(analysis["blocked"]) - {"final_synthesis"}
+        for action in plan.actions:
             if action.id == "final_synthesis":
-                await self.emit_status(
-                    "info", "Assembling final deliverable from template...", False
-                )
-                action.status = "in_progress"
-                action.start_time = datetime.now().strftime("%H:%M:%S")
-                await self.emit_full_state(plan, completed_summaries)
+                action.dependencies = [
+                    dep
+                    for dep in action.dependencies
+                    if dep not in skipped and dep not in analysis["missing"].get(action.id, [])
+                ]
+            elif action.id in skipped:
+                action.status = "skipped"
 
-                final_output_template = action.description
+        if not (skipped or broken_edges or analysis["missing"]):
+            return skipped
 
-                placeholder_ids = re.findall(
-                    r"\{([a-zA-Z0-9_]+)\}", final_output_template
-                )
+        plan.metadata["dependency_analysis"] = {
+            "cycles": analysis["cycles"],
+            "missing_dependencies": analysis["missing"],
+            "broken_edges": [list(edge) for edge in broken_edges],
+            "skipped": sorted(skipped),
+        }
+        details: list[str] = []
+        if broken_edges:
+            details.append(
+                "broke cycles by dropping "
+                + ", ".join(f"{a} -> {d}" for a, d in broken_edges)
+            )
+        if analysis["cycles"]:
+            details.append(
+                "cycles "
+                + "; ".join(" -> ".join(reversed(c)) for c in analysis["cycles"])
+            )
+        if analysis["missing"]:
+            details.append(
+                "unknown dependencies "
+                + ", ".join(f"{a}: {deps}" for a, deps in analysis["missing"].items())
+            )
+        if skipped:
+            details.append(f"skipping {sorted(skipped)}")
+        message = "Dependency graph issues: " + "; ".join(details)
+        logger.warning(message)
+        await self.emit_status("warning", message, False)
+        return skipped
+
+    async def _run_final_synthesis(
+        self,
+        plan: Plan,
+        action: Action,
+        completed: set[str],
+        completed_results: dict[str, dict[str, str]],
+        completed_summaries: list[str],
+    ) -> None:
+        """Assemble the final deliverable from the template and completed outputs."""
 
-                final_output = final_output_template
-                for action_id in placeholder_ids:
-                    single_placeholder = f"{{{action_id}}}"
-                    double_placeholder = f"{{{{{action_id}}}}}"
+        await self.emit_status(
+            "info", "Assembling final deliverable from template...", False
+        )
+        action.status = "in_progress"
+        action.start_time = datetime.now().strftime("%H:%M:%S")
+        await self.emit_full_state(plan, completed_summaries)
 
-                    if action_id in completed_results:
-                        dependency_output = completed_results[action_id].get(
-                            "primary_output", ""
-                        )
+        final_output_template = action.description
 
-                        final_output = final_output.replace(
-                            double_placeholder, dependency_output
-                        )
-                        final_output = final_output.replace(
-                            single_placeholder, dependency_output
-                        )
-                    else:
-                        if single_placeholder in final_output or double_placeholder in final_output:
-                            logger.warning(
-                                f"Could not find output for placeholder '{single_placeholder}'. It may have failed or was not executed. It will be left in the final output."
-                            )
+        placeholder_ids = re.findall(r"\{([a-zA-Z0-9_]+)\}", final_output_template)
 
-                final_metadata = plan.metadata.setdefault("final_synthesis", {})
-                final_metadata["assembled_template"] = final_output
+        final_output = final_output_template
+        for action_id in placeholder_ids:
+            single_placeholder = f"{{{action_id}}}"
+            double_placeholder = f"{{{{{action_id}}}}}"
 
-                stepwise_summary = self._build_stepwise_execution_summary(
-                    plan, completed_results
+            if action_id in completed_results:
+                dependency_output = completed_results[action_id].get(
+                    "primary_output", ""
                 )
-                final_metadata["raw_stepwise_summary"] = stepwise_summary
 
-                action.output = await self.review_final_deliverable(
-                    plan,
-                    stepwise_summary,
-                    default_supporting_details="Final synthesis completed",
+                final_output = final_output.replace(
+                    double_placeholder, dependency_output
                 )
-                final_metadata["stepwise_summary"] = action.output.get(
-                    "primary_output", stepwise_summary
+                final_output = final_output.replace(
+                    single_placeholder, dependency_output
                 )
-                action.status = "completed"
-                action.end_time = datetime.now().strftime("%H:%M:%S")
-                completed.add(action.id)
-                completed_results[action.id] = action.output
+            else:
+                if single_placeholder in final_output or double_placeholder in final_output:
+                    logger.warning(
+                        f"Could not find output for placeholder '{single_placeholder}'. It may have failed or was not executed. It will be left in the final output."
+                    )
 
-                await self.emit_status(
-                    "success",
-                    "Final deliverable assembled. This is the complete result that will be presented to the user.",
-                    True,
-                )
+        final_metadata = plan.metadata.setdefault("final_synthesis", {})
+        final_metadata["assembled_template"] = final_output
 
-                remaining_actions = [a for a in plan.actions if a.id not in completed]
-                if not remaining_actions:
-                    formatted_output = self.format_action_output(
-                        action, action.output, is_final_result=True
-                    )
-                    await self.emit_message(formatted_output)
-                else:
-                    summary = self.generate_action_summary(action, plan)
-                    if summary:
-                        completed_summaries.append(summary)
+        stepwise_summary = self._build_stepwise_execution_summary(
+            plan, completed_results
+        )
+        final_metadata["raw_stepwise_summary"] = stepwise_summary
 
-                continue  #
+        action.output = await self.review_final_deliverable(
+            plan,
+            stepwise_summary,
+            default_supporting_details="Final synthesis completed",
+        )
+        final_metadata["stepwise_summary"] = action.output.get(
+            "primary_output", stepwise_summary
+        )
+        action.status = "completed"
+        action.end_time = datetime.now().strftime("%H:%M:%S")
+        completed.add(action.id)
+        completed_results[action.id] = action.output
 
-            in_progress.add(action.id)
-            action.status = "in_progress"
-            action.start_time = datetime.now().strftime("%H:%M:%S")
-            await self.emit_full_state(plan, completed_summaries)
+        await self.emit_status(
+            "success",
+            "Final deliverable assembled. This is the complete result that will be presented to the user.",
+            True,
+        )
 
-            try:
-                context: dict[Any, Any] = {
-                    dep: completed_results.get(dep, {}) for dep in action.dependencies
-                }
+        remaining_actions = [a for a in plan.actions if a.id not in completed]
+        if not remaining_actions:
+            formatted_output = self.format_action_output(
+                action, action.output, is_final_result=True
+            )
+            await self.emit_message(formatted_output)
+        else:
+            summary = self.generate_action_summary(action, plan)
+            if summary:
+                completed_summaries.append(summary)
 
-                result = await self.execute_action(plan, action, context, step_counter)
+    async def execute_plan(self, plan: Plan) -> None:
+        """
+        Execute the complete plan based on dependencies.
+        Independent actions run as concurrent tasks, bounded by CONCURRENT_ACTIONS.
+        Handles a special 'final_synthesis' action for templating.
+        """
+        self._emitted_messages = []
+        completed_results: dict[str, dict[str, str]] = {}
+        completed: set[str] = set()
+        running: dict[asyncio.Task[dict[str, Any]], Action] = {}
+        step_numbers: dict[str, int] = {}
+        step_counter = 1
+        all_outputs: list[dict[str, int | str]] = []
+        completed_summaries: list[str] = []
+        max_concurrent = max(1, int(self.valves.CONCURRENT_ACTIONS or 1))
 
-                completed_results[action.id] = result
-                completed.add(action.id)
+        # Cycles and dangling dependencies would otherwise only show up as a stall.
+        completed.update(await self._skip_unexecutable_actions(plan))
 
+        # Actions restored from a run journal already carry their output.
+        for action in plan.actions:
+            if (
+                action.id != "final_synthesis"
+                and action.status in ("completed", "warning")
+                and action.output
+            ):
+                completed_results[action.id] = action.output
+                completed.add(action.id)
+                step_numbers[action.id] = step_counter
+                step_counter += 1
                 summary = self.generate_action_summary(action, plan)
                 if summary:
                     completed_summaries.append(summary)
-
-                await self.emit_full_state(plan, completed_summaries)
-
                 all_outputs.append(
                     {
-                        "step": step_counter,
+                        "step": step_numbers[action.id],
                         "id": action.id,
-                        "output": result.get("primary_output", ""),
+                        "output": action.output.get("primary_output", ""),
                         "status": action.status,
                     }
                 )
-                step_counter += 1
-
-            except UserAbortedException as e:
-                step_counter += 1
-                logger.info(f"Action {action.id} aborted by user: {e}")
 
-                await self.emit_status(
-                    "warning",
-                    f"Plan execution stopped by user at action: {action.id}",
-                    True,
+        ready = _ReadyQueue(
+            plan.actions, self._compute_action_priorities(plan), completed
+        )
+        synthesis_action: Action | None = None
+        dispatch_times: dict[str, float] = {}
+
+        # Speculative continuation: dependents may start on an output that is still
+        # being judged; they are committed once every parent finishes with exactly
+        # the output they ran against, and cancelled and rerun otherwise.
+        speculation_depth = max(0, int(self.valves.SPECULATIVE_EXECUTION_DEPTH or 0))
+        actions_by_id = {action.id: action for action in plan.actions}
+        dependents: dict[str, list[str]] = {action.id: [] for action in plan.actions}
+        for action in plan.actions:
+            for dep in dict.fromkeys(action.dependencies):
+                if dep in dependents:
+                    dependents[dep].append(action.id)
+        provisional: dict[str, dict[str, Any]] = {}
+        speculative: dict[str, dict[str, Any]] = {}
+        speculative_tasks: dict[asyncio.Task[dict[str, Any]], Action] = {}
+        deferred: set[str] = set()
+        # Children whose speculative run failed wait for their parents' committed output.
+        no_speculation: set[str] = set()
+        discarded: list[asyncio.Task[dict[str, Any]]] = []
+        user_wait: dict[str, list[float]] = {}
+        wake = asyncio.Event()
+
+        def on_provisional_output(action: Action, output: dict[str, Any]) -> None:
+            provisional[action.id] = dict(output)
+            wake.set()
+
+        async def run_action(
+            action: Action, step_number: int, messages: list[str] | None = None
+        ) -> dict[str, Any]:
+            if speculation_depth:
+                _PROVISIONAL_OUTPUT_CALLBACK.set(on_provisional_output)
+            if messages is not None:
+                _SPECULATIVE_MESSAGES.set(messages)
+            user_wait[action.id] = [0.0]
+            _USER_WAIT_SECONDS.set(user_wait[action.id])
+            context: dict[Any, Any] = {
+                dep: completed_results.get(dep, provisional.get(dep, {}))
+                for dep in action.dependencies
+            }
+            self._maybe_promote_lightweight_context(plan, action, context)
+            return await self.execute_action(plan, action, context, step_number)
+
+        def reset_action(action: Action) -> None:
+            action.status = "pending"
+            action.start_time = None
+            action.end_time = None
+            action.output = None
+            action.tool_calls.clear()
+            action.tool_results.clear()
+            action.tool_turns.clear()
+
+        async def cancel_running() -> None:
+            for task in list(running) + list(speculative_tasks):
+                task.cancel()
+            await asyncio.gather(
+                *running, *speculative_tasks, *discarded, return_exceptions=True
+            )
+            for pending_action in list(running.values()) + list(
+                speculative_tasks.values()
+            ):
+                pending_action.status = "pending"
+                pending_action.start_time = None
+                pending_action.end_time = None
+            running.clear()
+            speculative_tasks.clear()
+            speculative.clear()
+
+        def basis_holds(state: dict[str, Any]) -> bool:
+            for parent_id, output in state["basis"].items():
+                current = (
+                    completed_results.get(parent_id)
+                    if parent_id in completed
+                    else provisional.get(parent_id)
                 )
+                if current != output:
+                    return False
+            return True
+
+        def discard_speculation(action_id: str) -> None:
+            state = speculative.pop(action_id, None)
+            if state is None:
+                return
+            task = state.get("task")
+            if task is not None and not task.done():
+                task.cancel()
+                discarded.append(task)
+            if task is not None:
+                speculative_tasks.pop(task, None)
+            provisional.pop(action_id, None)
+            reset_action(actions_by_id[action_id])
+            logger.info(f"Discarded speculative run of {action_id}")
+            if action_id in deferred:
+                deferred.discard(action_id)
+                ready.requeue(action_id)
+            for child_id in dependents[action_id]:
+                discard_speculation(child_id)
+
+        async def record_success(action: Action, result: dict[str, Any]) -> None:
+            completed_results[action.id] = result
+            completed.add(action.id)
+            provisional.pop(action.id, None)
+            ready.mark_done(action.id)
+            await self._journal_completed_action(
+                plan, action, step_numbers[action.id]
+            )
 
-                action.status = "aborted"
-                action.end_time = datetime.now().strftime("%H:%M:%S")
-                completed.add(action.id)
-                await self.emit_full_state(plan, completed_summaries)
-
-                await self.emit_message(
-                    f"## ⚠️ Plan Execution Stopped\n\n"
-                    f"Execution was stopped by user at action: **{action.description}**\n\n"
-                    f"Action ID: `{action.id}`\n\n"
-                    f"Status: **{action.status}**\n\n"
-                    f"Execution Summary:\n\n"
-                    f"- Total Steps: {len(plan.actions)}\n"
-                    f"- Completed Steps: {len([a for a in plan.actions if a.status == 'completed'])}\n"
-                    f"- Failed Steps: {len([a for a in plan.actions if a.status == 'failed'])}\n"
+            summary = self.generate_action_summary(action, plan)
+            if summary:
+                completed_summaries.append(summary)
+
+            await self.emit_full_state(plan, completed_summaries)
+
+            all_outputs.append(
+                {
+                    "step": step_numbers[action.id],
+                    "id": action.id,
+                    "output": result.get("primary_output", ""),
+                    "status": action.status,
+                }
+            )
+
+        async def settle_speculation(parent_id: str) -> None:
+            """Commit or discard the speculative dependents of a finished action."""
+
+            for child_id in dependents[parent_id]:
+                state = speculative.get(child_id)
+                if state is None or parent_id not in state["basis"]:
+                    continue
+                if not basis_holds(state):
+                    discard_speculation(child_id)
+                    continue
+                if "result" in state and all(p in completed for p in state["basis"]):
+                    await commit_speculation(child_id)
+
+        async def commit_speculation(action_id: str) -> None:
+            state = speculative.pop(action_id)
+            deferred.discard(action_id)
+            action = actions_by_id[action_id]
+            self._record_action_latency(
+                plan, action, state["finished_at"] - dispatch_times[action_id]
+            )
+            for message in state["messages"]:
+                await self.emit_message(message)
+            await record_success(action, state["result"])
+            await settle_speculation(action_id)
+
+        def speculate() -> bool:
+            """Start dependents of provisional outputs that are otherwise ready."""
+
+            nonlocal step_counter
+            for action_id, state in list(speculative.items()):
+                if action_id in speculative and not basis_holds(state):
+                    discard_speculation(action_id)
+
+            started = False
+            for parent_id in list(provisional):
+                for child_id in dependents.get(parent_id, []):
+                    child = actions_by_id[child_id]
+                    if (
+                        child_id == "final_synthesis"
+                        or child_id in completed
+                        or child_id in speculative
+                        or child_id in no_speculation
+                        or child.status != "pending"
+                    ):
+                        continue
+                    if not self.valves.SPECULATE_TOOL_ACTIONS and (
+                        child.type == "tool" or child.tool_ids
+                    ):
+                        continue
+                    basis: dict[str, dict[str, Any]] = {}
+                    depth = 0
+                    for dep in dict.fromkeys(child.dependencies):
+                        if dep in completed:
+                            continue
+                        if dep not in provisional:
+                            break
+                        basis[dep] = provisional[dep]
+                        depth = max(depth, speculative.get(dep, {}).get("depth", 0) + 1)
+                    else:
+                        if not basis or depth > speculation_depth:
+                            continue
+                        child.status = "in_progress"
+                        child.start_time = datetime.now().strftime("%H:%M:%S")
+                        if child_id not in step_numbers:
+                            step_numbers[child_id] = step_counter
+                            step_counter += 1
+                        dispatch_times[child_id] = time.monotonic()
+                        messages: list[str] = []
+                        task = asyncio.create_task(
+                            run_action(child, step_numbers[child_id], messages)
+                        )
+                        speculative_tasks[task] = child
+                        speculative[child_id] = {
+                            "task": task,
+                            "messages": messages,
+                            "basis": basis,
+                            "depth": depth,
+                        }
+                        logger.info(
+                            f"Speculatively started {child_id} on provisional output of {list(basis)}"
+                        )
+                        started = True
+            return started
+
+        try:
+            while len(completed) < len(plan.actions):
+                dispatched = False
+                while len(running) < max_concurrent:
+                    action = ready.pop()
+                    if action is None:
+                        break
+                    if action.id in speculative:
+                        deferred.add(action.id)
+                        continue
+                    if action.id in completed:
+                        continue
+                    if action.id == "final_synthesis":
+                        synthesis_action = action
+                        continue
+                    action.status = "in_progress"
+                    action.start_time = datetime.now().strftime("%H:%M:%S")
+                    if action.id not in step_numbers:
+                        step_numbers[action.id] = step_counter
+                        step_counter += 1
+                    dispatch_times[action.id] = time.monotonic()
+                    task = asyncio.create_task(
+                        run_action(action, step_numbers[action.id])
+                    )
+                    running[task] = action
+                    dispatched = True
+
+                wake.clear()
+                if speculation_depth and speculate():
+                    dispatched = True
+
+                if dispatched:
+                    await self.emit_full_state(plan, completed_summaries)
+
+                if (
+                    synthesis_action is not None
+                    and not running
+                    and not speculative_tasks
+                ):
+                    await self._run_final_synthesis(
+                        plan,
+                        synthesis_action,
+                        completed,
+                        completed_results,
+                        completed_summaries,
+                    )
+                    ready.mark_done(synthesis_action.id)
+                    synthesis_action = None
+                    continue
+
+                if not running and not speculative_tasks:
+                    logger.error(
+                        "Execution stalled. Not all actions could be completed."
+                    )
+                    break
+
+                waiters: set[asyncio.Future[Any]] = set(running) | set(
+                    speculative_tasks
                 )
+                wake_waiter: asyncio.Task[Any] | None = None
+                if speculation_depth:
+                    wake_waiter = asyncio.create_task(wake.wait())
+                    waiters.add(wake_waiter)
+                done, _ = await asyncio.wait(
+                    waiters, return_when=asyncio.FIRST_COMPLETED
+                )
+                if wake_waiter is not None and not wake_waiter.done():
+                    wake_waiter.cancel()
+
+                aborted_action: Action | None = None
+                for task in done:
+                    if task in speculative_tasks:
+                        action = speculative_tasks.pop(task)
+                        state = speculative.get(action.id)
+                        if state is None:
+                            continue
+                        try:
+                            state["result"] = task.result()
+                            state["finished_at"] = time.monotonic()
+                        except UserAbortedException as e:
+                            logger.info(f"Action {action.id} aborted by user: {e}")
+                            speculative.pop(action.id, None)
+                            action.status = "aborted"
+                            action.end_time = datetime.now().strftime("%H:%M:%S")
+                            completed.add(action.id)
+                            aborted_action = aborted_action or action
+                            continue
+                        except Exception as e:
+                            logger.info(f"Speculative run of {action.id} failed: {e}")
+                            discard_speculation(action.id)
+                            no_speculation.add(action.id)
+                            continue
+                        if all(p in completed for p in state["basis"]):
+                            if basis_holds(state):
+                                await commit_speculation(action.id)
+                            else:
+                                discard_speculation(action.id)
+                        continue
 
-                break
+                    if task not in running:
+                        continue
+                    action = running.pop(task)
+                    self._record_action_latency(
+                        plan,
+                        action,
+                        time.monotonic()
+                        - dispatch_times[action.id]
+                        - user_wait.get(action.id, [0.0])[0],
+                    )
+                    try:
+                        result = task.result()
+                    except UserAbortedException as e:
+                        logger.info(f"Action {action.id} aborted by user: {e}")
+                        action.status = "aborted"
+                        action.end_time = datetime.now().strftime("%H:%M:%S")
+                        completed.add(action.id)
+                        aborted_action = aborted_action or action
+                        continue
+                    except Exception as e:
+                        logger.error(f"Action {action.id} failed: {e}")
+                        action.status = "failed"
+                        completed.add(action.id)
+                        provisional.pop(action.id, None)
+                        ready.mark_done(action.id)
+                        await settle_speculation(action.id)
+                        await self.emit_full_state(plan, completed_summaries)
+                        continue
 
-            except Exception as e:
-                step_counter += 1
-                logger.error(f"Action {action.id} failed: {e}")
-                action.status = "failed"
-                completed.add(action.id)
+                    await record_success(action, result)
+                    await settle_speculation(action.id)
 
-                await self.emit_full_state(plan, completed_summaries)
-            finally:
-                if action.id in in_progress:
-                    in_progress.remove(action.id)
+                if aborted_action is not None:
+                    await cancel_running()
+
+                    await self.emit_status(
+                        "warning",
+                        f"Plan execution stopped by user at action: {aborted_action.id}",
+                        True,
+                    )
+                    await self.emit_full_state(plan, completed_summaries)
+
+                    await self.emit_message(
+                        f"## ⚠️ Plan Execution Stopped\n\n"
+                        f"Execution was stopped by user at action: **{aborted_action.description}**\n\n"
+                        f"Action ID: `{aborted_action.id}`\n\n"
+                        f"Status: **{aborted_action.status}**\n\n"
+                        f"Execution Summary:\n\n"
+                        f"- Total Steps: {len(plan.actions)}\n"
+                        f"- Completed Steps: {len([a for a in plan.actions if a.status == 'completed'])}\n"
+                        f"- Failed Steps: {len([a for a in plan.actions if a.status == 'failed'])}\n"
+                    )
+                    break
+        finally:
+            if running or speculative_tasks:
+                await cancel_running()
+            if discarded:
+                await asyncio.gather(*discarded, return_exceptions=True)
 
         result_message = await self.emit_full_state(plan, completed_summaries)
 
@@ -3956,6 +7104,7 @@ Google's Gemini Advancements..."}
                 [a for a in plan.actions if a.status == "completed"]
             ),
             "failed_steps": len([a for a in plan.actions if a.status == "failed"]),
+            "skipped_steps": len([a for a in plan.actions if a.status == "skipped"]),
             "execution_time": {
                 "start": plan.actions[0].start_time if plan.actions else None,
                 "end": datetime.now().strftime("%H:%M:%S"),
@@ -3972,6 +7121,10 @@ Google's Gemini Advancements..."}
         await self.emit_replace(f"\n\n```mermaid\n{mermaid}\n```\n")
 
     async def emit_message(self, message: str):
+        buffered = _SPECULATIVE_MESSAGES.get()
+        if buffered is not None:
+            buffered.append(message)
+            return
         cleaned = message if isinstance(message, str) else str(message)
         self._emitted_messages.append(cleaned)
         await self.__current_event_emitter__(
@@ -3987,9 +7140,13 @@ Google's Gemini Advancements..."}
         self, event_data: dict[str, Any], timeout_seconds: int | None = None
     ) -> str | None:
         """Get user response with timeout handling"""
+        if _SPECULATIVE_MESSAGES.get() is not None:
+            # Nothing a speculative run asks may reach the user; the committed run asks.
+            raise _SpeculationNeedsUser(event_data.get("data", {}).get("title", ""))
         if timeout_seconds is None:
             timeout_seconds = self.valves.USER_RESPONSE_TIMEOUT
 
+        started = time.monotonic()
         try:
             response = await asyncio.wait_for(
                 self.__current_event_call__(event_data), timeout=timeout_seconds
@@ -4005,6 +7162,10 @@ Google's Gemini Advancements..."}
         except Exception as e:
             logger.error(f"Error getting user response: {e}")
             return None
+        finally:
+            waited = _USER_WAIT_SECONDS.get()
+            if waited is not None:
+                waited[0] += time.monotonic() - started
 
     async def emit_status(self, level: str, message: str, done: bool):
         await self.__current_event_emitter__(
@@ -4439,39 +7600,78 @@ Google's Gemini Advancements..."}
         user: dict[str, Any] | None = None,
     ) -> None | str:
         model = self.valves.MODEL
-        self.__user__ = Users.get_user_by_id(__user__["id"])
-        self.__request__ = __request__
-        self.user = __user__
-        if __task__ and __task__ != TASKS.DEFAULT:
-            response_payload = await generate_chat_completion(  # type: ignore
-                self.__request__,
-                {"model": model, "messages": body.get("messages"), "stream": False},
-                user=self.__user__,
-            )
-            response_content, _, _ = parse_llm_response(response_payload)
-            return f"{name}: {response_content}"
+        run_context = RunContext(
+            user=Users.get_user_by_id(__user__["id"]),
+            request=__request__,
+            user_info=__user__,
+            event_emitter=__event_emitter__,
+            event_call=__event_call__,
+            model=model,
+        )
+        token = _CURRENT_RUN_CONTEXT.set(run_context)
+        try:
+            if __task__ and __task__ != TASKS.DEFAULT:
+                response_payload = await generate_chat_completion(  # type: ignore
+                    self.__request__,
+                    {"model": model, "messages": body.get("messages"), "stream": False},
+                    user=self.__user__,
+                )
+                response_content, _, _ = parse_llm_response(response_payload)
+                return f"{name}: {response_content}"
 
-        self.__current_event_emitter__ = __event_emitter__  # type: ignore
-        self.__current_event_call__ = __event_call__  # type: ignore
-        self.__model__ = model
+            goal = body.get("messages", [])[-1].get("content", "").strip()
 
-        goal = body.get("messages", [])[-1].get("content", "").strip()
+            plan: Plan | None = None
+            if self.valves.RUN_JOURNAL_DIR:
+                run_context.journal = _RunJournal.for_goal(
+                    self.valves.RUN_JOURNAL_DIR, str(__user__["id"]), goal
+                )
+                if self.valves.RESUME_FROM_JOURNAL:
+                    try:
+                        events = await asyncio.to_thread(run_context.journal.read)
+                        plan = self._restore_plan_from_journal(events)
+                    except Exception as e:
+                        logger.warning(f"Could not resume from run journal: {e}")
+                        plan = None
+
+            if plan is not None:
+                restored = len(
+                    [a for a in plan.actions if a.status in ("completed", "warning")]
+                )
+                await self.emit_status(
+                    "info",
+                    f"Resuming previous run: {restored}/{len(plan.actions)} actions restored from journal",
+                    False,
+                )
+            else:
+                plan = await self._prepare_plan(str(__user__["id"]), goal)
+                if plan is None:
+                    return
+                await self._append_journal_event(
+                    {
+                        "event": "plan",
+                        "plan": plan.model_dump(),
+                        "created_at": time.time(),
+                    },
+                    start=True,
+                )
 
-        await self.emit_status("info", "Creating execution plan...", False)
-        try:
-            plan = await self.create_plan(goal)
-        except Exception as e:
-            await self.emit_status("error", f"Failed to create a valid plan: {e}", True)
-            return
+            await self.emit_full_state(plan, [])
 
-        await self.emit_full_state(plan, [])
+            await self.emit_status("info", "Executing plan...", False)
+            result = await self.execute_plan(plan)
 
-        await self.emit_status("info", "Executing plan...", False)
-        result = await self.execute_plan(plan)
+            if any(
+                a.id == "final_synthesis" and a.status == "completed"
+                for a in plan.actions
+            ):
+                await self._append_journal_event({"event": "complete"})
 
-        await self.emit_status("success", "Plan execution completed.", True)
+            await self.emit_status("success", "Plan execution completed.", True)
 
-        return result
+            return result
+        finally:
+            _CURRENT_RUN_CONTEXT.reset(token)
 
 
 if __name__ == "__main__":  # pragma: no cover - manual regression checks
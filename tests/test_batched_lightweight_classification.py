@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan  # noqa: E402
+
+
+class ClassifyingPipe(Pipe):
+    def __init__(self, batch_answer: dict[str, object] | str) -> None:
+        super().__init__()
+        self.valves.ENABLE_TOOL_INTEGRATION = True
+        self.batch_answer = batch_answer
+        # Send every candidate to the LLM instead of deciding clear cases locally.
+        self.valves.LIGHTWEIGHT_ACCEPT_THRESHOLD = 1.1
+        self.valves.LIGHTWEIGHT_REJECT_THRESHOLD = -0.1
+        self.prompts: list[str] = []
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools=None,
+        format=None,
+        action_results=None,
+        action=None,
+    ) -> str:
+        self.prompts.append(prompt)
+        if format is not None:
+            if isinstance(self.batch_answer, str):
+                return self.batch_answer
+            return json.dumps(self.batch_answer)
+        return "YES"
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+
+def _plan() -> Plan:
+    sources = [Action(id=f"chapter_{i}", type="text", description=f"Chapter {i}") for i in range(3)]
+    return Plan(
+        goal="Book",
+        actions=[
+            *sources,
+            Action(
+                id="save_chapters",
+                type="tool",
+                description="Save chapters to the Obsidian vault",
+                tool_ids=["obsidian"],
+                dependencies=["chapter_0", "chapter_1"],
+            ),
+            Action(
+                id="archive",
+                type="tool",
+                description="Archive every chapter into a folder",
+                tool_ids=["files"],
+                dependencies=["chapter_1", "chapter_2"],
+            ),
+            Action(
+                id="illustrate",
+                type="text",
+                description="Illustrate the book cover",
+                dependencies=["chapter_0", "chapter_2"],
+            ),
+            Action(id="final_synthesis", type="text", description="{{chapter_0}}"),
+        ],
+    )
+
+
+def test_candidates_classified_in_one_call_with_reasons() -> None:
+    pipe = ClassifyingPipe(
+        {
+            "classifications": [
+                {"action_id": "archive", "use_lightweight_context": False, "reason": "Needs content"},
+                {"action_id": "save_chapters", "use_lightweight_context": True, "reason": "Saves by reference"},
+            ]
+        }
+    )
+    plan = _plan()
+
+    asyncio.run(pipe.validate_and_flag_lightweight_context(plan))
+
+    # The keyword prefilter still excludes "illustrate".
+    assert len(pipe.prompts) == 1
+    assert '"action_id": "illustrate"' not in pipe.prompts[0]
+    flags = {a.id: a.use_lightweight_context for a in plan.actions}
+    assert flags["save_chapters"] is True
+    assert flags["archive"] is False
+    assert plan.metadata["lightweight_context_decisions"]["save_chapters"]["reason"] == "Saves by reference"
+
+
+def test_missing_entries_are_classified_individually() -> None:
+    pipe = ClassifyingPipe(
+        {"classifications": [{"action_id": "archive", "use_lightweight_context": False, "reason": ""}]}
+    )
+    plan = _plan()
+
+    asyncio.run(pipe.validate_and_flag_lightweight_context(plan))
+
+    assert len(pipe.prompts) == 2
+    assert "- ID: save_chapters" in pipe.prompts[1]
+    flags = {a.id: a.use_lightweight_context for a in plan.actions}
+    assert flags["save_chapters"] is True
+    assert flags["archive"] is False
+
+
+def test_batching_can_be_disabled() -> None:
+    pipe = ClassifyingPipe("unused")
+    pipe.valves.BATCH_LIGHTWEIGHT_CLASSIFICATION = False
+    plan = _plan()
+
+    asyncio.run(pipe.validate_and_flag_lightweight_context(plan))
+
+    assert len(pipe.prompts) == 2
+    assert all(a.use_lightweight_context for a in plan.actions if a.id in {"save_chapters", "archive"})
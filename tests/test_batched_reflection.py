@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+from typing import Any
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan, _ReflectionBatcher  # noqa: E402
+
+
+def _verdict(action_id: str | None = None, passed: bool = True) -> dict[str, Any]:
+    verdict: dict[str, Any] = {
+        "is_successful": passed,
+        "quality_score": 0.9 if passed else 0.2,
+        "issues": [] if passed else ["Thin"],
+        "suggestions": [],
+    }
+    if action_id is not None:
+        verdict["action_id"] = action_id
+    return verdict
+
+
+class BatchJudgePipe(Pipe):
+    def __init__(self, answered: list[str] | None = None) -> None:
+        super().__init__()
+        self.valves.CONCURRENT_ACTIONS = 3
+        self.valves.SHOW_ACTION_SUMMARIES = False
+        self.valves.REFLECTION_BATCH_WINDOW_SECONDS = 0.05
+        self.answered = answered
+        self.batch_prompts: list[str] = []
+        self.single_judged: list[str] = []
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools: dict[str, dict[object, object]] | None = None,
+        format: dict[str, object] | None = None,
+        action_results: dict[str, dict[str, str]] | None = None,
+        action=None,
+    ) -> str:
+        if action is not None:
+            return json.dumps(
+                {"primary_output": f"Output of {action.id}", "supporting_details": ""}
+            )
+        name = format["json_schema"]["name"]
+        if name == "batch_reflection_analysis":
+            self.batch_prompts.append(prompt)
+            ids = self.answered if self.answered is not None else ["a", "b", "c"]
+            return json.dumps({"evaluations": [_verdict(i) for i in ids]})
+        self.single_judged.append(prompt.split("Action Description: ")[1].split("\n")[0])
+        return json.dumps(_verdict())
+
+    async def review_final_deliverable(  # type: ignore[override]
+        self, plan: Plan, assembled_output: str, default_supporting_details: str = ""
+    ) -> dict[str, str]:
+        return {"primary_output": assembled_output, "supporting_details": ""}
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_message(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_full_state(self, *_args, **_kwargs) -> str:  # type: ignore[override]
+        return ""
+
+
+def _sibling_plan() -> Plan:
+    return Plan(
+        goal="Goal",
+        actions=[
+            Action(id="a", type="text", description="Write A"),
+            Action(id="b", type="text", description="Write B"),
+            Action(id="c", type="text", description="Write C"),
+            Action(
+                id="final_synthesis",
+                type="text",
+                description="{a} {b} {c}",
+                dependencies=["a", "b", "c"],
+            ),
+        ],
+    )
+
+
+def test_sibling_outputs_are_judged_in_one_call() -> None:
+    pipe = BatchJudgePipe()
+    plan = _sibling_plan()
+
+    asyncio.run(pipe.execute_plan(plan))
+
+    assert len(pipe.batch_prompts) == 1
+    assert pipe.single_judged == []
+    prompt = pipe.batch_prompts[0]
+    assert prompt.count("CRITICAL FIELD USAGE VERIFICATION") == 1
+    assert all(f"action_id: {i}" in prompt for i in ("a", "b", "c"))
+    assert all(a.status == "completed" for a in plan.actions)
+
+
+def test_items_missing_from_the_batch_answer_are_judged_alone() -> None:
+    pipe = BatchJudgePipe(answered=["a", "c"])
+    plan = _sibling_plan()
+
+    asyncio.run(pipe.execute_plan(plan))
+
+    assert len(pipe.batch_prompts) == 1
+    assert pipe.single_judged == ["Write B"]
+    assert all(a.status == "completed" for a in plan.actions)
+
+
+def test_batcher_flushes_on_item_and_size_limits() -> None:
+    batches: list[list[str]] = []
+
+    async def judge(items: list[str]) -> list[str]:
+        batches.append(list(items))
+        return [item.upper() for item in items]
+
+    async def scenario() -> list[str]:
+        by_count = _ReflectionBatcher(judge, 10, max_items=2, char_budget=0)
+        first = await asyncio.gather(by_count.submit("a", 1), by_count.submit("b", 1))
+        by_size = _ReflectionBatcher(judge, 0.05, max_items=10, char_budget=5)
+        second = await asyncio.gather(by_size.submit("c", 3), by_size.submit("d", 3))
+        return list(first) + list(second)
+
+    results = asyncio.run(asyncio.wait_for(scenario(), timeout=1))
+
+    assert results == ["A", "B", "C", "D"]
+    assert batches == [["a", "b"], ["c"], ["d"]]
+
+
+class ScriptedBatchPipe(BatchJudgePipe):
+    def __init__(self, evaluations: list[dict[str, Any]]) -> None:
+        super().__init__()
+        self.evaluations = evaluations
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools: dict[str, dict[object, object]] | None = None,
+        format: dict[str, object] | None = None,
+        action_results: dict[str, dict[str, str]] | None = None,
+        action=None,
+    ) -> str:
+        if format["json_schema"]["name"] == "batch_reflection_analysis":
+            self.batch_prompts.append(prompt)
+            return json.dumps({"evaluations": self.evaluations})
+        self.single_judged.append(prompt.split("Action Description: ")[1].split("\n")[0])
+        return json.dumps(_verdict())
+
+
+def _same_action_twice() -> tuple[Plan, list[tuple[Plan, Action, str]]]:
+    action = Action(id="a", type="text", description="Write A")
+    plan = Plan(goal="Goal", actions=[action])
+    outputs = [
+        json.dumps({"primary_output": f"draft {n}", "supporting_details": ""})
+        for n in (1, 2)
+    ]
+    return plan, [(plan, action, output) for output in outputs]
+
+
+def test_repeated_action_ids_get_separate_verdicts() -> None:
+    pipe = ScriptedBatchPipe([_verdict("a#1", passed=False), _verdict("a#2")])
+    _, items = _same_action_twice()
+
+    results = asyncio.run(pipe._judge_reflection_batch(items))
+
+    assert "action_id: a#1" in pipe.batch_prompts[0]
+    assert "action_id: a#2" in pipe.batch_prompts[0]
+    assert [r.is_successful for r in results] == [False, True]
+    assert pipe.single_judged == []
+
+
+def test_duplicate_ids_in_the_answer_are_judged_alone() -> None:
+    pipe = ScriptedBatchPipe([_verdict("a", passed=False), _verdict("a"), _verdict("b")])
+    plan = Plan(goal="Goal", actions=[])
+    items = [
+        (
+            plan,
+            Action(id=action_id, type="text", description=f"Write {action_id}"),
+            json.dumps({"primary_output": action_id, "supporting_details": ""}),
+        )
+        for action_id in ("a", "b")
+    ]
+
+    results = asyncio.run(pipe._judge_reflection_batch(items))
+
+    assert pipe.single_judged == ["Write a"]
+    assert all(r.is_successful for r in results)
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan, _parse_tool_id_list  # noqa: E402
+
+
+CATALOG = [
+    SimpleNamespace(id=tool_id, name=tool_id, meta=SimpleNamespace(description=tool_id))
+    for tool_id in ("web_search", "image_gen", "obsidian")
+]
+
+
+class BatchSelectionPipe(Pipe):
+    def __init__(self, batch_answer: dict[str, object] | str) -> None:
+        super().__init__()
+        self.valves.ENABLE_TOOL_INTEGRATION = True
+        self.batch_answer = batch_answer
+        self.prompts: list[str] = []
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools=None,
+        format=None,
+        action_results=None,
+        action=None,
+    ) -> str:
+        self.prompts.append(prompt)
+        if format["json_schema"]["name"] == "batch_tool_selection":
+            if isinstance(self.batch_answer, str):
+                return self.batch_answer
+            return json.dumps(self.batch_answer)
+        return json.dumps({"tool_ids": ["image_gen"]})
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+
+def _plan() -> Plan:
+    return Plan(
+        goal="Illustrated research",
+        actions=[
+            Action(id="search", type="tool", description="Search the web"),
+            Action(id="picture", type="tool", description="Draw a picture"),
+            Action(id="notes", type="tool", description="Save to vault"),
+            Action(id="final_synthesis", type="text", description="{{search}}"),
+        ],
+    )
+
+
+@pytest.fixture(autouse=True)
+def _catalog(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("planner.Tools.get_tools", staticmethod(lambda: CATALOG))
+
+
+def test_all_actions_selected_in_one_call() -> None:
+    pipe = BatchSelectionPipe(
+        {
+            "selections": [
+                {"action_id": "notes", "tool_ids": ["obsidian"]},
+                {"action_id": "search", "tool_ids": ["web_search"]},
+                {"action_id": "picture", "tool_ids": ["image_gen", "nonexistent"]},
+            ]
+        }
+    )
+    plan = _plan()
+
+    asyncio.run(pipe.validate_and_fix_tool_actions(plan))
+
+    assert len(pipe.prompts) == 1
+    assert pipe.prompts[0].count('"tool_id":"web_search"') == 1
+    assert [a.tool_ids for a in plan.actions[:3]] == [
+        ["web_search"],
+        ["image_gen"],
+        ["obsidian"],
+    ]
+
+
+def test_invalid_or_missing_entries_fall_back_per_action() -> None:
+    pipe = BatchSelectionPipe(
+        {
+            "selections": [
+                {"action_id": "search", "tool_ids": ["web_search"]},
+                {"action_id": "picture", "tool_ids": ["made_up_tool"]},
+            ]
+        }
+    )
+    plan = _plan()
+
+    asyncio.run(pipe.validate_and_fix_tool_actions(plan))
+
+    assert len(pipe.prompts) == 3
+    assert "Draw a picture" in pipe.prompts[1] + pipe.prompts[2]
+    assert "Save to vault" in pipe.prompts[1] + pipe.prompts[2]
+    assert [a.tool_ids for a in plan.actions[:3]] == [
+        ["web_search"],
+        ["image_gen"],
+        ["image_gen"],
+    ]
+
+
+def test_unparseable_batch_answer_falls_back_for_every_action() -> None:
+    pipe = BatchSelectionPipe("not json at all")
+    plan = _plan()
+
+    asyncio.run(pipe.validate_and_fix_tool_actions(plan))
+
+    assert len(pipe.prompts) == 4
+    assert all(a.tool_ids == ["image_gen"] for a in plan.actions[:3])
+
+
+def test_tool_id_list_parser_accepts_object_and_array() -> None:
+    assert _parse_tool_id_list('{"tool_ids": ["a", "b"]}') == ["a", "b"]
+    assert _parse_tool_id_list('["a"]') == ["a"]
+    assert _parse_tool_id_list("no tools") is None
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import sys
+from typing import Any
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan, UserAbortedException  # noqa: E402
+
+
+class ConcurrencyTrackingPipe(Pipe):
+    def __init__(self, concurrent_actions: int) -> None:
+        super().__init__()
+        self.valves.CONCURRENT_ACTIONS = concurrent_actions
+        self.valves.SHOW_ACTION_SUMMARIES = False
+        self.active = 0
+        self.max_active = 0
+        self.started: list[str] = []
+        self.abort_ids: set[str] = set()
+
+    async def execute_action(  # type: ignore[override]
+        self,
+        plan: Plan,
+        action: Action,
+        context: dict[str, Any],
+        step_number: int,
+    ) -> dict[str, str]:
+        self.started.append(action.id)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            if action.id in self.abort_ids:
+                raise UserAbortedException(action.id)
+            missing = [dep for dep in action.dependencies if dep not in context]
+            assert not missing, f"context missing dependencies {missing}"
+            result = {
+                "primary_output": f"output of {action.id}",
+                "supporting_details": "",
+            }
+            action.output = result
+            action.status = "completed"
+            return result
+        finally:
+            self.active -= 1
+
+    async def review_final_deliverable(  # type: ignore[override]
+        self, plan: Plan, assembled_output: str, default_supporting_details: str = ""
+    ) -> dict[str, str]:
+        return {"primary_output": assembled_output, "supporting_details": ""}
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_message(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_full_state(self, *_args, **_kwargs) -> str:  # type: ignore[override]
+        return ""
+
+
+def _wide_plan(width: int) -> Plan:
+    leaves = [
+        Action(id=f"search_{index}", type="tool", description=f"Search {index}")
+        for index in range(width)
+    ]
+    final = Action(
+        id="final_synthesis",
+        type="text",
+        description="\n".join(f"{{{{{leaf.id}}}}}" for leaf in leaves),
+        dependencies=[leaf.id for leaf in leaves],
+    )
+    return Plan(goal="Wide research", actions=[*leaves, final])
+
+
+def test_independent_actions_run_concurrently() -> None:
+    pipe = ConcurrencyTrackingPipe(concurrent_actions=3)
+    plan = _wide_plan(6)
+
+    asyncio.run(pipe.execute_plan(plan))
+
+    assert pipe.max_active == 3
+    assert all(action.status == "completed" for action in plan.actions)
+    assert "output of search_5" in plan.metadata["final_synthesis"]["assembled_template"]
+    steps = sorted(entry["step"] for entry in plan.metadata["execution_outputs"])
+    assert steps == [1, 2, 3, 4, 5, 6]
+
+
+def test_single_slot_keeps_sequential_execution() -> None:
+    pipe = ConcurrencyTrackingPipe(concurrent_actions=1)
+    plan = _wide_plan(4)
+
+    asyncio.run(pipe.execute_plan(plan))
+
+    assert pipe.max_active == 1
+    assert pipe.started == ["search_0", "search_1", "search_2", "search_3"]
+
+
+def test_dependents_wait_for_their_dependencies() -> None:
+    pipe = ConcurrencyTrackingPipe(concurrent_actions=4)
+    plan = Plan(
+        goal="Chain",
+        actions=[
+            Action(id="outline", type="text", description="Outline"),
+            Action(id="part_1", type="text", description="Part 1", dependencies=["outline"]),
+            Action(id="part_2", type="text", description="Part 2", dependencies=["outline"]),
+            Action(
+                id="final_synthesis",
+                type="text",
+                description="{{part_1}}\n{{part_2}}",
+                dependencies=["part_1", "part_2"],
+            ),
+        ],
+    )
+
+    asyncio.run(pipe.execute_plan(plan))
+
+    assert pipe.started[0] == "outline"
+    assert set(pipe.started[1:]) == {"part_1", "part_2"}
+    assert plan.actions[-1].status == "completed"
+
+
+def test_user_abort_cancels_in_flight_siblings() -> None:
+    pipe = ConcurrencyTrackingPipe(concurrent_actions=2)
+    pipe.abort_ids = {"search_0"}
+    plan = _wide_plan(3)
+
+    asyncio.run(pipe.execute_plan(plan))
+
+    statuses = {action.id: action.status for action in plan.actions}
+    assert statuses["search_0"] == "aborted"
+    assert statuses["final_synthesis"] == "pending"
+    assert pipe.active == 0
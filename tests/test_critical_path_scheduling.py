@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import sys
+from typing import Any
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan, _compute_critical_path_lengths  # noqa: E402
+
+
+class OrderTrackingPipe(Pipe):
+    def __init__(self) -> None:
+        super().__init__()
+        self.valves.CONCURRENT_ACTIONS = 1
+        self.valves.SHOW_ACTION_SUMMARIES = False
+        self.started: list[str] = []
+
+    async def execute_action(  # type: ignore[override]
+        self,
+        plan: Plan,
+        action: Action,
+        context: dict[str, Any],
+        step_number: int,
+    ) -> dict[str, str]:
+        self.started.append(action.id)
+        result = {"primary_output": action.id, "supporting_details": ""}
+        action.output = result
+        action.status = "completed"
+        return result
+
+    async def review_final_deliverable(  # type: ignore[override]
+        self, plan: Plan, assembled_output: str, default_supporting_details: str = ""
+    ) -> dict[str, str]:
+        return {"primary_output": assembled_output, "supporting_details": ""}
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_message(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_full_state(self, *_args, **_kwargs) -> str:  # type: ignore[override]
+        return ""
+
+
+def _deep_chain_plan() -> Plan:
+    return Plan(
+        goal="Deep chain beside shallow leaves",
+        actions=[
+            Action(id="leaf_1", type="tool", description="Leaf 1"),
+            Action(id="leaf_2", type="tool", description="Leaf 2"),
+            Action(id="chain_1", type="tool", description="Chain 1"),
+            Action(id="chain_2", type="text", description="Chain 2", dependencies=["chain_1"]),
+            Action(id="chain_3", type="code", description="Chain 3", dependencies=["chain_2"]),
+            Action(
+                id="final_synthesis",
+                type="text",
+                description="{{leaf_1}} {{leaf_2}} {{chain_3}}",
+                dependencies=["leaf_1", "leaf_2", "chain_3"],
+            ),
+        ],
+    )
+
+
+def test_critical_path_lengths_follow_longest_chain() -> None:
+    plan = _deep_chain_plan()
+    weights = {action.id: 1.0 for action in plan.actions}
+
+    lengths = _compute_critical_path_lengths(plan.actions, weights)
+
+    assert lengths["final_synthesis"] == 1.0
+    assert lengths["leaf_1"] == 2.0
+    assert lengths["chain_1"] == 4.0
+
+
+def test_critical_path_lengths_tolerate_cycles() -> None:
+    actions = [
+        Action(id="a", type="text", description="A", dependencies=["b"]),
+        Action(id="b", type="text", description="B", dependencies=["a"]),
+    ]
+
+    lengths = _compute_critical_path_lengths(actions, {"a": 1.0, "b": 1.0})
+
+    assert set(lengths) == {"a", "b"}
+
+
+def test_longest_chain_is_dispatched_first() -> None:
+    pipe = OrderTrackingPipe()
+    plan = _deep_chain_plan()
+
+    asyncio.run(pipe.execute_plan(plan))
+
+    assert pipe.started[0] == "chain_1"
+    assert set(plan.metadata["action_timings"]) == {
+        "leaf_1",
+        "leaf_2",
+        "chain_1",
+        "chain_2",
+        "chain_3",
+    }
+
+
+def test_plan_order_policy_keeps_declaration_order() -> None:
+    pipe = OrderTrackingPipe()
+    pipe.valves.SCHEDULING_POLICY = "plan_order"
+    plan = _deep_chain_plan()
+
+    asyncio.run(pipe.execute_plan(plan))
+
+    assert pipe.started[:3] == ["leaf_1", "leaf_2", "chain_1"]
+
+
+def test_observed_timings_override_type_estimates() -> None:
+    pipe = Pipe()
+    plan = Plan(goal="g", actions=[])
+    action = Action(id="search", type="tool", description="Search", status="completed")
+
+    pipe._record_action_latency(plan, action, 4.0)
+    pipe._record_action_latency(plan, action, 8.0)
+
+    assert pipe._estimate_action_latency(action) == 0.7 * 4.0 + 0.3 * 8.0
+    assert plan.metadata["action_timings"]["search"] == 8.0
+
+
+def test_only_completed_actions_feed_the_latency_history() -> None:
+    pipe = Pipe()
+    plan = Plan(goal="g", actions=[])
+
+    for status in ("failed", "aborted", "warning"):
+        action = Action(id=status, type="tool", description="Search", status=status)
+        pipe._record_action_latency(plan, action, 60.0)
+
+    assert "tool" not in pipe._action_latency_history
+    assert plan.metadata["action_timings"]["failed"] == 60.0
+
+
+class DialogPipe(OrderTrackingPipe):
+    async def execute_action(  # type: ignore[override]
+        self,
+        plan: Plan,
+        action: Action,
+        context: dict[str, Any],
+        step_number: int,
+    ) -> dict[str, str]:
+        if action.id == "chain_1":
+            await self.get_user_response_with_timeout({"type": "input", "data": {}})
+        return await super().execute_action(plan, action, context, step_number)
+
+
+def test_time_waiting_for_the_user_is_not_counted_as_latency() -> None:
+    pipe = DialogPipe()
+
+    async def slow_user(_event: dict[str, Any]) -> str:
+        await asyncio.sleep(0.2)
+        return "approve"
+
+    pipe.__current_event_call__ = slow_user  # type: ignore[assignment]
+    plan = _deep_chain_plan()
+
+    asyncio.run(pipe.execute_plan(plan))
+
+    assert plan.metadata["action_timings"]["chain_1"] < 0.1
+    assert pipe._action_latency_history["tool"] < 0.1
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import sys
+from typing import Any
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan, _analyze_dependency_graph  # noqa: E402
+
+
+def _action(action_id: str, dependencies: list[str] | None = None) -> Action:
+    return Action(
+        id=action_id, type="text", description=action_id, dependencies=dependencies or []
+    )
+
+
+def _plan_with_problems() -> Plan:
+    return Plan(
+        goal="Goal",
+        actions=[
+            _action("research"),
+            _action("outline", ["research", "review"]),
+            _action("review", ["outline"]),
+            _action("publish", ["review"]),
+            _action("cite", ["ghost"]),
+            _action("final_synthesis", ["research", "publish", "cite"]),
+        ],
+    )
+
+
+def test_kahn_analysis_reports_cycles_orphans_and_blocked_actions() -> None:
+    analysis = _analyze_dependency_graph(_plan_with_problems().actions)
+
+    assert analysis["order"] == ["research"]
+    assert analysis["missing"] == {"cite": ["ghost"]}
+    assert len(analysis["cycles"]) == 1
+    assert set(analysis["cycles"][0]) == {"outline", "review"}
+    assert analysis["blocked"] == [
+        "outline",
+        "review",
+        "publish",
+        "cite",
+        "final_synthesis",
+    ]
+
+
+class InstantPipe(Pipe):
+    def __init__(self) -> None:
+        super().__init__()
+        self.valves.SHOW_ACTION_SUMMARIES = False
+        self.executed: list[str] = []
+        self.statuses: list[tuple[str, str]] = []
+
+    async def execute_action(  # type: ignore[override]
+        self,
+        plan: Plan,
+        action: Action,
+        context: dict[str, Any],
+        step_number: int,
+    ) -> dict[str, str]:
+        self.executed.append(action.id)
+        result = {"primary_output": action.id, "supporting_details": ""}
+        action.output = result
+        action.status = "completed"
+        return result
+
+    async def review_final_deliverable(  # type: ignore[override]
+        self, plan: Plan, assembled_output: str, default_supporting_details: str = ""
+    ) -> dict[str, str]:
+        return {"primary_output": assembled_output, "supporting_details": ""}
+
+    async def emit_status(self, level: str, message: str, *_args, **_kwargs) -> None:  # type: ignore[override]
+        self.statuses.append((level, message))
+
+    async def emit_message(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_full_state(self, *_args, **_kwargs) -> str:  # type: ignore[override]
+        return ""
+
+
+def test_unexecutable_subgraphs_are_skipped_up_front() -> None:
+    plan = _plan_with_problems()
+    pipe = InstantPipe()
+
+    asyncio.run(asyncio.wait_for(pipe.execute_plan(plan), timeout=2))
+
+    statuses = {action.id: action.status for action in plan.actions}
+    assert statuses == {
+        "research": "completed",
+        "outline": "skipped",
+        "review": "skipped",
+        "publish": "skipped",
+        "cite": "skipped",
+        "final_synthesis": "completed",
+    }
+    assert plan.actions[-1].dependencies == ["research"]
+    assert plan.execution_summary["skipped_steps"] == 4
+    assert plan.metadata["dependency_analysis"]["missing_dependencies"] == {
+        "cite": ["ghost"]
+    }
+    assert any(
+        level == "warning" and "cycles" in message for level, message in pipe.statuses
+    )
+
+
+def test_break_policy_drops_forward_edge_and_runs_the_cycle() -> None:
+    plan = _plan_with_problems()
+    pipe = InstantPipe()
+    pipe.valves.CYCLE_BREAKING_POLICY = "break"
+
+    asyncio.run(asyncio.wait_for(pipe.execute_plan(plan), timeout=2))
+
+    assert plan.actions[1].dependencies == ["research"]
+    assert plan.metadata["dependency_analysis"]["broken_edges"] == [
+        ["outline", "review"]
+    ]
+    assert pipe.executed == ["research", "outline", "review", "publish"]
+    assert plan.actions[4].status == "skipped"
+    assert plan.actions[-1].status == "completed"
+
+
+def test_clean_plan_records_no_analysis() -> None:
+    plan = Plan(
+        goal="Goal",
+        actions=[_action("a"), _action("final_synthesis", ["a"])],
+    )
+    pipe = InstantPipe()
+
+    asyncio.run(pipe.execute_plan(plan))
+
+    assert "dependency_analysis" not in plan.metadata
+    assert not any(level == "warning" for level, _ in pipe.statuses)
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+import time
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan  # noqa: E402
+
+
+class RoutingPipe(Pipe):
+    def __init__(self, verdicts: dict[str, tuple[bool, float]]) -> None:
+        super().__init__()
+        self.valves.ENABLE_TOOL_INTEGRATION = False
+        self.valves.ACTION_MODEL = "action-model"
+        self.valves.JUDGE_MODEL = "small-judge"
+        self.valves.JUDGE_ESCALATION_MODEL = "large-judge"
+        self.verdicts = verdicts
+        self.models: list[str] = []
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools: dict[str, dict[object, object]] | None = None,
+        format: dict[str, object] | None = None,
+        action_results: dict[str, dict[str, str]] | None = None,
+        action=None,
+    ) -> str:
+        self.models.append(str(model))
+        successful, score = self.verdicts[str(model)]
+        return json.dumps(
+            {
+                "is_successful": successful,
+                "quality_score": score,
+                "issues": [],
+                "suggestions": [],
+            }
+        )
+
+
+def _judge(pipe: Pipe) -> tuple[Plan, float, bool]:
+    action = Action(id="draft", type="text", description="Draft the summary")
+    plan = Plan(goal="Summarize", actions=[action])
+    output = json.dumps({"primary_output": "A short summary.", "supporting_details": ""})
+    reflection = asyncio.run(pipe.analyze_output(plan, action, output))
+    return plan, reflection.quality_score, reflection.is_successful
+
+
+def test_clear_verdict_stays_with_the_judge_model() -> None:
+    pipe = RoutingPipe({"small-judge": (True, 0.95), "large-judge": (False, 0.2)})
+
+    plan, score, successful = _judge(pipe)
+
+    assert pipe.models == ["small-judge"]
+    assert (score, successful) == (0.95, True)
+    stats = plan.metadata["judge_stats"]
+    assert stats["small-judge"]["calls"] == 1
+    assert stats["small-judge"]["escalations"] == 0
+    assert "large-judge" not in stats
+
+
+def test_borderline_score_escalates_and_takes_the_stronger_verdict() -> None:
+    pipe = RoutingPipe({"small-judge": (True, 0.72), "large-judge": (False, 0.4)})
+
+    plan, score, successful = _judge(pipe)
+
+    assert pipe.models == ["small-judge", "large-judge"]
+    assert (score, successful) == (0.4, False)
+    stats = plan.metadata["judge_stats"]
+    assert stats["small-judge"]["escalations"] == 1
+    assert stats["large-judge"]["calls"] == 1
+    assert stats["large-judge"]["disagreements"] == 1
+    assert pipe._judge_stats["large-judge"]["calls"] == 1
+
+
+def test_verdict_that_contradicts_its_score_escalates() -> None:
+    pipe = RoutingPipe({"small-judge": (False, 0.95), "large-judge": (True, 0.9)})
+
+    plan, _score, successful = _judge(pipe)
+
+    assert pipe.models == ["small-judge", "large-judge"]
+    assert successful is True
+    assert plan.metadata["judge_stats"]["large-judge"]["disagreements"] == 1
+
+
+def test_no_escalation_without_a_distinct_escalation_model() -> None:
+    pipe = RoutingPipe({"small-judge": (True, 0.7)})
+    pipe.valves.JUDGE_ESCALATION_MODEL = "small-judge"
+
+    _judge(pipe)
+
+    assert pipe.models == ["small-judge"]
+
+
+class SlowEscalationPipe(RoutingPipe):
+    ESCALATION_SECONDS = 0.1
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools: dict[str, dict[object, object]] | None = None,
+        format: dict[str, object] | None = None,
+        action_results: dict[str, dict[str, str]] | None = None,
+        action=None,
+    ) -> str:
+        if format["json_schema"]["name"] == "batch_reflection_analysis":
+            self.models.append(str(model))
+            evaluations = [
+                {
+                    "action_id": f"step_{index}",
+                    "is_successful": True,
+                    "quality_score": 0.72,
+                    "issues": [],
+                    "suggestions": [],
+                }
+                for index in range(4)
+            ]
+            return json.dumps({"evaluations": evaluations})
+        await asyncio.sleep(self.ESCALATION_SECONDS)
+        return await super().get_completion(
+            prompt, model, tools, format, action_results, action
+        )
+
+
+def test_uncertain_batch_items_are_escalated_concurrently() -> None:
+    pipe = SlowEscalationPipe({"large-judge": (True, 0.9)})
+    plan = Plan(goal="Summarize", actions=[])
+    items = [
+        (
+            plan,
+            Action(id=f"step_{index}", type="text", description=f"Step {index}"),
+            json.dumps({"primary_output": f"Output {index}", "supporting_details": ""}),
+        )
+        for index in range(4)
+    ]
+
+    started = time.perf_counter()
+    results = asyncio.run(pipe._judge_reflection_batch(items))
+    elapsed = time.perf_counter() - started
+
+    assert pipe.models == ["small-judge"] + ["large-judge"] * 4
+    assert [r.quality_score for r in results] == [0.9] * 4
+    assert elapsed < 2 * SlowEscalationPipe.ESCALATION_SECONDS
+    assert plan.metadata["judge_stats"]["small-judge"]["escalations"] == 4
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import (  # noqa: E402
+    Action,
+    Pipe,
+    Plan,
+    _lightweight_context_features,
+    _score_lightweight_context,
+)
+
+
+class CountingPipe(Pipe):
+    def __init__(self) -> None:
+        super().__init__()
+        self.valves.ENABLE_TOOL_INTEGRATION = True
+        self.prompts: list[str] = []
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools=None,
+        format=None,
+        action_results=None,
+        action=None,
+    ) -> str:
+        self.prompts.append(prompt)
+        return "NO"
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+
+def _sources(count: int) -> list[Action]:
+    return [Action(id=f"src_{i}", type="text", description=f"Source {i}") for i in range(count)]
+
+
+def test_clear_cases_are_decided_without_the_llm(caplog: pytest.LogCaptureFixture) -> None:
+    plan = Plan(
+        goal="Notes",
+        actions=[
+            *_sources(2),
+            Action(
+                id="save",
+                type="tool",
+                description="Save chapters to the Obsidian vault",
+                tool_ids=["obsidian"],
+                dependencies=["src_0", "src_1"],
+            ),
+            Action(
+                id="compare",
+                type="text",
+                description="Write an analysis comparing the files",
+                dependencies=["src_0", "src_1"],
+            ),
+            Action(
+                id="summarize_and_save",
+                type="tool",
+                description="Summarize the sources and save the summary",
+                tool_ids=["obsidian"],
+                dependencies=["src_0", "src_1"],
+            ),
+        ],
+    )
+    pipe = CountingPipe()
+
+    with caplog.at_level(logging.INFO, logger="Planner"):
+        asyncio.run(pipe.validate_and_flag_lightweight_context(plan))
+
+    assert len(pipe.prompts) == 1
+    assert "- ID: summarize_and_save" in pipe.prompts[0]
+
+    decisions = plan.metadata["lightweight_context_decisions"]
+    assert decisions["save"]["source"] == "local"
+    assert decisions["save"]["use_lightweight_context"] is True
+    assert decisions["compare"]["source"] == "local"
+    assert decisions["compare"]["use_lightweight_context"] is False
+    assert decisions["summarize_and_save"]["source"] == "llm"
+    assert [a.use_lightweight_context for a in plan.actions[2:]] == [True, False, False]
+
+    logged = [
+        json.loads(record.getMessage())
+        for record in caplog.records
+        if "lightweight_context_decision" in record.getMessage()
+    ]
+    assert {entry["action_id"] for entry in logged} == {"save", "compare", "summarize_and_save"}
+    assert all("score" in entry and "features" in entry for entry in logged)
+
+
+def test_local_reject_keeps_a_planner_set_flag() -> None:
+    plan = Plan(
+        goal="Notes",
+        actions=[
+            *_sources(2),
+            Action(
+                id="save",
+                type="text",
+                description="Save the written summary of chapters to the Obsidian vault",
+                dependencies=["src_0", "src_1"],
+                use_lightweight_context=True,
+            ),
+        ],
+    )
+    pipe = CountingPipe()
+
+    asyncio.run(pipe.validate_and_flag_lightweight_context(plan))
+
+    decision = plan.metadata["lightweight_context_decisions"]["save"]
+    assert decision["source"] == "local"
+    assert decision["use_lightweight_context"] is False
+    assert plan.actions[2].use_lightweight_context is True
+    assert pipe.prompts == []
+
+
+def test_score_uses_fan_in_output_size_tools_and_verbs() -> None:
+    action = Action(
+        id="process",
+        type="tool",
+        description="Process the results",
+        tool_ids=["api"],
+        dependencies=["a", "b", "c", "d"],
+    )
+
+    planning = _lightweight_context_features(action)
+    assert planning["fan_in"] == 4 and planning["dependency_bytes"] == 0
+    large = _lightweight_context_features(
+        action, {dep: {"primary_output": "x" * 8000} for dep in action.dependencies}
+    )
+    assert large["dependency_bytes"] == 32000
+    assert _score_lightweight_context(large) > _score_lightweight_context(planning)
+
+    no_tools = {**planning, "has_tools": False}
+    assert _score_lightweight_context(no_tools) < _score_lightweight_context(planning)
+
+
+def test_large_dependency_outputs_promote_at_execution_time() -> None:
+    pipe = CountingPipe()
+    action = Action(
+        id="process",
+        type="tool",
+        description="Process the results",
+        tool_ids=["api"],
+        dependencies=["a", "b", "c", "d"],
+    )
+    plan = Plan(goal="g", actions=[action])
+    context = {dep: {"primary_output": "x" * 8000} for dep in action.dependencies}
+
+    pipe._maybe_promote_lightweight_context(plan, action, {})
+    assert action.use_lightweight_context is False
+
+    pipe._maybe_promote_lightweight_context(plan, action, context)
+    assert action.use_lightweight_context is True
+    assert plan.metadata["lightweight_context_decisions"]["process"]["source"] == "execution"
+
+
+def test_llm_verdict_is_not_overridden_at_execution_time() -> None:
+    pipe = CountingPipe()
+    action = Action(
+        id="process",
+        type="tool",
+        description="Process the results",
+        tool_ids=["api"],
+        dependencies=["a", "b", "c", "d"],
+    )
+    plan = Plan(
+        goal="g",
+        actions=[action],
+        metadata={"lightweight_context_decisions": {"process": {"source": "llm"}}},
+    )
+
+    pipe._maybe_promote_lightweight_context(
+        plan, action, {dep: {"primary_output": "x" * 8000} for dep in action.dependencies}
+    )
+
+    assert action.use_lightweight_context is False
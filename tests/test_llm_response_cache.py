@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import sys
+from typing import Any
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import (  # noqa: E402
+    Pipe,
+    _bypass_llm_cache,
+    _canonical_request_hash,
+    _LLMResponseCache,
+)
+
+
+class _CountingBackend:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def __call__(self, _request, form_data, user=None) -> dict[str, Any]:
+        self.calls += 1
+        return {"choices": [{"message": {"content": f"answer {self.calls}"}}]}
+
+
+def _cached_pipe(tmp_path: Path) -> Pipe:
+    pipe = Pipe()
+    pipe.valves.LLM_CACHE_ENABLED = True
+    pipe.valves.LLM_CACHE_PATH = str(tmp_path / "cache.sqlite3")
+    return pipe
+
+
+def test_identical_requests_are_served_from_cache(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    backend = _CountingBackend()
+    monkeypatch.setattr("planner.generate_chat_completion", backend)
+    pipe = _cached_pipe(tmp_path)
+
+    async def scenario() -> list[str]:
+        return [
+            await pipe.get_completion("Classify this", model="m"),
+            await pipe.get_completion("Classify this", model="m"),
+            await pipe.get_completion("Classify that", model="m"),
+        ]
+
+    assert asyncio.run(scenario()) == ["answer 1", "answer 1", "answer 2"]
+    assert backend.calls == 2
+
+    # A new Pipe instance reads the same on-disk cache.
+    assert asyncio.run(_cached_pipe(tmp_path).get_completion("Classify this", model="m")) == "answer 1"
+    assert backend.calls == 2
+
+
+def test_bypass_and_disabled_cache_always_call_backend(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    backend = _CountingBackend()
+    monkeypatch.setattr("planner.generate_chat_completion", backend)
+    pipe = _cached_pipe(tmp_path)
+
+    async def scenario() -> None:
+        with _bypass_llm_cache():
+            await pipe.get_completion("Write a poem", model="m")
+            await pipe.get_completion("Write a poem", model="m")
+        pipe.valves.LLM_CACHE_ENABLED = False
+        await pipe.get_completion("Write a poem", model="m")
+
+    asyncio.run(scenario())
+
+    assert backend.calls == 3
+    assert len(_LLMResponseCache(str(tmp_path / "cache.sqlite3"))) == 0
+
+
+def test_cache_expires_and_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache = _LLMResponseCache(str(tmp_path / "cache.sqlite3"))
+
+    cache.put("a", {"value": "a"}, max_entries=2)
+    cache.put("b", {"value": "b"}, max_entries=2)
+    assert cache.get("a") == {"value": "a"}
+    cache.put("c", {"value": "c"}, max_entries=2)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"value": "a"}
+    assert cache.get("c", ttl_seconds=-1) == {"value": "c"}
+    assert cache.get("c", ttl_seconds=1e-9) is None
+
+
+def test_request_hash_ignores_key_order_but_not_content() -> None:
+    first = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+    reordered = {"messages": [{"content": "hi", "role": "user"}], "model": "m"}
+    with_format = {**first, "response_format": {"type": "json_object"}}
+
+    assert _canonical_request_hash(first) == _canonical_request_hash(reordered)
+    assert _canonical_request_hash(first) != _canonical_request_hash(with_format)
+    assert _canonical_request_hash(first, "user-a") != _canonical_request_hash(first, "user-b")
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan  # noqa: E402
+
+
+def _output(primary: str, supporting: str = "") -> str:
+    return json.dumps({"primary_output": primary, "supporting_details": supporting})
+
+
+@pytest.mark.parametrize(
+    ("output", "score", "issue"),
+    [
+        ("Just some prose without JSON", 0.3, "not a JSON object"),
+        (_output("   "), 0.1, "primary_output is empty"),
+        (_output("See supporting details for the report."), 0.1, "only points to"),
+        (_output("AI News Report", "# Report\n" + "details " * 200), 0.1, "main content"),
+    ],
+)
+def test_broken_outputs_are_rejected_locally(output: str, score: float, issue: str) -> None:
+    pipe = Pipe()
+    action = Action(id="write", type="text", description="Write")
+
+    reflection = pipe._pre_evaluate_output(action, output)
+
+    assert reflection is not None
+    assert not reflection.is_successful
+    assert reflection.quality_score == score
+    assert issue in reflection.issues[0]
+
+
+def test_long_output_opening_with_a_pointer_goes_to_the_judge() -> None:
+    pipe = Pipe()
+    action = Action(id="compare", type="text", description="Compare")
+    table = "| Option | Cost | Latency |\n|---|---|---|\n" + "| A | 1 | 2 |\n" * 80
+
+    output = _output("See the comparison table below.\n\n" + table)
+
+    assert len(table) > 1000
+    assert pipe._pre_evaluate_output(action, output) is None
+
+
+def test_missing_tool_calls_are_rejected_only_with_tool_integration() -> None:
+    pipe = Pipe()
+    pipe.valves.ENABLE_TOOL_INTEGRATION = False
+    action = Action(id="search", type="tool", description="Search", tool_ids=["web_search"])
+
+    assert pipe._pre_evaluate_output(action, _output("Results")) is None
+
+    pipe.valves.ENABLE_TOOL_INTEGRATION = True
+    reflection = pipe._pre_evaluate_output(action, _output("Results"))
+    assert reflection is not None and "no tools were called" in reflection.issues[0]
+
+    action.tool_calls.append("web_search")
+    assert pipe._pre_evaluate_output(action, _output("Results")) is None
+
+
+def test_fast_accept_applies_to_large_non_critical_outputs() -> None:
+    pipe = Pipe()
+    pipe.valves.PRE_EVALUATION_FAST_ACCEPT_MIN_CHARS = 100
+    long_text = "A thorough answer. " * 10
+
+    text_action = Action(id="write", type="text", description="Write")
+    code_action = Action(id="code", type="code", description="Code")
+
+    accepted = pipe._pre_evaluate_output(text_action, _output(long_text))
+    assert accepted is not None and accepted.is_successful
+    assert pipe._pre_evaluate_output(text_action, _output("Short")) is None
+    assert pipe._pre_evaluate_output(code_action, _output(long_text)) is None
+
+
+class CountingPipe(Pipe):
+    def __init__(self, responses: list[str]) -> None:
+        super().__init__()
+        self.valves.MAX_RETRIES = 2
+        self.responses = responses
+        self.judge_calls = 0
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools: dict[str, dict[object, object]] | None = None,
+        format: dict[str, object] | None = None,
+        action_results: dict[str, dict[str, str]] | None = None,
+        action=None,
+    ) -> str:
+        if action is not None:
+            return self.responses.pop(0)
+        self.judge_calls += 1
+        return json.dumps(
+            {"is_successful": True, "quality_score": 0.9, "issues": [], "suggestions": []}
+        )
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_message(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+
+def test_execute_action_retries_without_calling_the_judge() -> None:
+    pipe = CountingPipe([_output(""), _output("See supporting details"), _output("Real content")])
+    action = Action(id="write", type="text", description="Write")
+
+    result = asyncio.run(pipe.execute_action(Plan(goal="Goal", actions=[action]), action, {}, 1))
+
+    assert result["primary_output"] == "Real content"
+    assert pipe.judge_calls == 1
+    assert action.status == "completed"
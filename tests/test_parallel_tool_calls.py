@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+import time
+from typing import Any
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe  # noqa: E402
+
+
+def _tool_call(call_id: str, name: str, arguments: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "id": call_id,
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(arguments)},
+    }
+
+
+def _sleeping_tool(name: str, delay: float, tracker: dict[str, int]) -> dict[str, Any]:
+    async def _call(query: str) -> str:
+        tracker["active"] += 1
+        tracker["max_active"] = max(tracker["max_active"], tracker["active"])
+        try:
+            await asyncio.sleep(delay)
+            return f"{name} result for {query}"
+        finally:
+            tracker["active"] -= 1
+
+    return {
+        "spec": {
+            "name": name,
+            "parameters": {"properties": {"query": {"type": "string"}}},
+        },
+        "callable": _call,
+    }
+
+
+class _ScriptedCompletions:
+    def __init__(self, tool_calls: list[dict[str, Any]]) -> None:
+        self.tool_calls = tool_calls
+        self.requests: list[dict[str, Any]] = []
+
+    async def __call__(self, _request, form_data, user=None) -> dict[str, Any]:
+        self.requests.append(json.loads(json.dumps(form_data, default=str)))
+        if len(self.requests) == 1:
+            return {
+                "choices": [
+                    {"message": {"content": "", "tool_calls": self.tool_calls}}
+                ]
+            }
+        return {
+            "choices": [
+                {
+                    "message": {
+                        "content": json.dumps(
+                            {"primary_output": "done", "supporting_details": ""}
+                        )
+                    }
+                }
+            ]
+        }
+
+
+def _tool_pipe() -> Pipe:
+    pipe = Pipe()
+    pipe.valves.ENABLE_TOOL_INTEGRATION = True
+    pipe.valves.ACTION_MODEL = "action-model"
+    return pipe
+
+
+def test_tool_calls_from_one_turn_run_concurrently(monkeypatch: pytest.MonkeyPatch) -> None:
+    tracker = {"active": 0, "max_active": 0}
+    tools = {
+        name: _sleeping_tool(name, 0.2, tracker)
+        for name in ("search_a", "search_b", "search_c")
+    }
+    completions = _ScriptedCompletions(
+        [
+            _tool_call("call_1", "search_a", {"query": "one"}),
+            _tool_call("call_2", "search_b", {"query": "two"}),
+            _tool_call("call_3", "search_c", {"query": "three"}),
+        ]
+    )
+    monkeypatch.setattr("planner.generate_chat_completion", completions)
+
+    pipe = _tool_pipe()
+    action = Action(id="research", type="tool", description="Research")
+
+    started = time.perf_counter()
+    asyncio.run(pipe.get_completion("Research", tools=tools, action=action))
+    elapsed = time.perf_counter() - started
+
+    assert tracker["max_active"] == 3
+    assert elapsed < 0.5
+    assert action.tool_calls == ["search_a", "search_b", "search_c"]
+    assert action.tool_results["search_c"] == "search_c result for three"
+
+    follow_up = completions.requests[1]["messages"]
+    assistant_turns = [m for m in follow_up if m.get("tool_calls")]
+    assert len(assistant_turns) == 1
+    assert len(assistant_turns[0]["tool_calls"]) == 3
+    tool_messages = [m for m in follow_up if m.get("tool_call_id")]
+    assert [m["tool_call_id"] for m in tool_messages] == ["call_1", "call_2", "call_3"]
+    assert sum(1 for m in follow_up if m["role"] == "user") == 2
+
+
+def test_parallel_tool_calls_respect_valve_limit(monkeypatch: pytest.MonkeyPatch) -> None:
+    tracker = {"active": 0, "max_active": 0}
+    tools = {"search": _sleeping_tool("search", 0.02, tracker)}
+    completions = _ScriptedCompletions(
+        [_tool_call(f"call_{i}", "search", {"query": str(i)}) for i in range(5)]
+    )
+    monkeypatch.setattr("planner.generate_chat_completion", completions)
+
+    pipe = _tool_pipe()
+    pipe.valves.MAX_PARALLEL_TOOL_CALLS = 2
+
+    asyncio.run(pipe.get_completion("Research", tools=tools, action=Action(id="a", type="tool", description="A")))
+
+    assert tracker["max_active"] == 2
+
+
+def test_slow_or_failing_tool_returns_error_result(monkeypatch: pytest.MonkeyPatch) -> None:
+    tracker = {"active": 0, "max_active": 0}
+
+    async def _broken(query: str) -> str:
+        raise RuntimeError("backend unavailable")
+
+    tools = {
+        "slow": _sleeping_tool("slow", 5, tracker),
+        "fast": _sleeping_tool("fast", 0, tracker),
+        "broken": {
+            "spec": {"name": "broken", "parameters": {"properties": {"query": {}}}},
+            "callable": _broken,
+        },
+    }
+    completions = _ScriptedCompletions(
+        [
+            _tool_call("call_1", "slow", {"query": "x"}),
+            _tool_call("call_2", "fast", {"query": "y"}),
+            _tool_call("call_3", "broken", {"query": "z"}),
+        ]
+    )
+    monkeypatch.setattr("planner.generate_chat_completion", completions)
+
+    pipe = _tool_pipe()
+    pipe.valves.TOOL_CALL_TIMEOUT = 0.05  # type: ignore[assignment]
+    action = Action(id="research", type="tool", description="Research")
+
+    result = asyncio.run(pipe.get_completion("Research", tools=tools, action=action))
+
+    assert json.loads(result)["primary_output"] == "done"
+    assert action.tool_results["slow"].startswith("ERROR:")
+    assert "timed out" in action.tool_results["slow"]
+    assert action.tool_results["fast"] == "fast result for y"
+    assert "backend unavailable" in action.tool_results["broken"]
+    tool_messages = [
+        m for m in completions.requests[1]["messages"] if m.get("tool_call_id")
+    ]
+    assert tool_messages[0]["content"].startswith("ERROR:")
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import sys
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan, Request, _PlanCache  # noqa: E402
+
+
+class PlanCountingPipe(Pipe):
+    def __init__(self) -> None:
+        super().__init__()
+        self.valves.PLAN_CACHE_ENABLED = True
+        self.plans_created = 0
+        self.executed_plans: list[Plan] = []
+        self.initial_statuses: list[list[str]] = []
+
+    async def create_plan(self, goal: str) -> Plan:  # type: ignore[override]
+        self.plans_created += 1
+        return Plan(
+            goal=goal,
+            actions=[
+                Action(id="research", type="tool", description=f"Research {goal}", tool_ids=["web"]),
+                Action(
+                    id="final_synthesis",
+                    type="text",
+                    description="{{research}}",
+                    dependencies=["research"],
+                ),
+            ],
+        )
+
+    async def execute_plan(self, plan: Plan) -> str:  # type: ignore[override]
+        self.executed_plans.append(plan)
+        self.initial_statuses.append([action.status for action in plan.actions])
+        for action in plan.actions:
+            action.status = "completed"
+        return plan.goal
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_full_state(self, *_args, **_kwargs) -> str:  # type: ignore[override]
+        return ""
+
+
+async def _noop(*_args: Any, **_kwargs: Any) -> None:
+    return None
+
+
+def _run(pipe: Pipe, goal: str, user_id: str = "user-1") -> Any:
+    return asyncio.run(
+        pipe.pipe(
+            body={"messages": [{"role": "user", "content": goal}]},
+            __user__={"id": user_id},
+            __request__=Request(),
+            __event_emitter__=_noop,
+            __event_call__=_noop,
+        )
+    )
+
+
+def test_repeated_goal_reuses_a_fresh_copy_of_the_plan() -> None:
+    pipe = PlanCountingPipe()
+
+    _run(pipe, "Daily AI news report")
+    _run(pipe, "  daily AI   news report ")
+
+    assert pipe.plans_created == 1
+    first, second = pipe.executed_plans
+    assert first is not second
+    assert pipe.initial_statuses[1] == ["pending", "pending"]
+    assert second.goal == "daily AI   news report"
+
+
+def test_cache_is_scoped_per_user_and_catalog(monkeypatch: pytest.MonkeyPatch) -> None:
+    pipe = PlanCountingPipe()
+    _run(pipe, "Weekly brief", user_id="user-1")
+    _run(pipe, "Weekly brief", user_id="user-2")
+    assert pipe.plans_created == 2
+
+    monkeypatch.setattr(
+        "planner.Tools.get_tools",
+        staticmethod(lambda: [SimpleNamespace(id="new", name="New", meta=SimpleNamespace(description=""))]),
+    )
+    _run(pipe, "Weekly brief", user_id="user-1")
+    assert pipe.plans_created == 3
+
+
+def test_near_duplicate_goals_need_a_similarity_threshold() -> None:
+    pipe = PlanCountingPipe()
+    _run(pipe, "Write the weekly research brief about solar panel efficiency for the team")
+    _run(pipe, "Write the weekly research brief about solar panel efficiency for the board")
+    assert pipe.plans_created == 2
+
+    pipe.valves.PLAN_CACHE_SIMILARITY_THRESHOLD = 0.7
+    _run(pipe, "Write the weekly research brief about solar panel efficiency for the staff")
+    assert pipe.plans_created == 2
+    assert pipe.executed_plans[-1].metadata["plan_cache_similarity"] >= 0.7
+
+    _run(pipe, "Generate a poem about autumn")
+    assert pipe.plans_created == 3
+
+
+def test_plan_cache_expires_and_evicts_least_recently_used() -> None:
+    cache = _PlanCache()
+    for goal in ("a", "b", "c"):
+        cache.put("u", "ctx", goal, {"goal": goal}, max_entries=2)
+
+    assert cache.get("u", "ctx", "a") is None
+    assert cache.get("u", "ctx", "b") == ({"goal": "b"}, 1.0)
+    assert len(cache) == 2
+    assert cache.get("u", "ctx", "c", ttl_seconds=1e-9) is None
+    assert len(cache) == 0
+
+
+def test_unrelated_valves_and_disabled_tools_keep_the_cache(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    pipe = PlanCountingPipe()
+    _run(pipe, "Weekly brief")
+    pipe.valves.USER_RESPONSE_TIMEOUT += 10
+    pipe.valves.REFLECTION_CACHE_MAX_ENTRIES = 1
+    _run(pipe, "Weekly brief")
+    assert pipe.plans_created == 1
+
+    pipe.valves.ACTION_MODEL = "other-model"
+    _run(pipe, "Weekly brief")
+    assert pipe.plans_created == 2
+
+    def _no_catalog() -> list[Any]:
+        raise AssertionError("tool catalog loaded with tool integration off")
+
+    pipe.valves.ENABLE_TOOL_INTEGRATION = False
+    monkeypatch.setattr("planner.Tools.get_tools", staticmethod(_no_catalog))
+    _run(pipe, "Weekly brief")
+    _run(pipe, "Weekly brief")
+    assert pipe.plans_created == 3
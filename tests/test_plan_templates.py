@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+from typing import Any
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Pipe, Plan, Request, _PlanTemplateLibrary  # noqa: E402
+
+
+WEEKLY_REPORT = {
+    "name": "weekly-report",
+    "description": "Weekly research report",
+    "params": {"topic": None, "audience": "the team"},
+    "match": [r"^weekly report (?:on|about) (?P<topic>.+)$"],
+    "goal": "Weekly report on {{topic}} for {{audience}}",
+    "actions": [
+        {
+            "id": "research",
+            "type": "tool",
+            "description": "Search this week's news about {{topic}}",
+            "tool_ids": ["web_search"],
+        },
+        {
+            "id": "write",
+            "type": "text",
+            "description": "Write a report about {{topic}} for {{audience}} using @research",
+            "dependencies": ["research"],
+        },
+        {
+            "id": "final_synthesis",
+            "type": "text",
+            "description": "# {{topic}}\n\n{{write}}",
+            "dependencies": ["write"],
+        },
+    ],
+}
+
+
+class TemplatePipe(Pipe):
+    def __init__(self, templates_dir: Path) -> None:
+        super().__init__()
+        self.valves.PLAN_TEMPLATES_DIR = str(templates_dir)
+        self.valves.WRITER_MODEL = "writer"
+        self.valves.ACTION_MODEL = "actor"
+        self.plans_created = 0
+        self.executed: list[Plan] = []
+        self.statuses: list[tuple[str, str]] = []
+
+    async def create_plan(self, goal: str) -> Plan:  # type: ignore[override]
+        self.plans_created += 1
+        return Plan(goal=goal, actions=[])
+
+    async def execute_plan(self, plan: Plan) -> str:  # type: ignore[override]
+        self.executed.append(plan)
+        return plan.goal
+
+    async def emit_status(self, level: str, message: str, done: bool) -> None:  # type: ignore[override]
+        self.statuses.append((level, message))
+
+    async def emit_full_state(self, *_args, **_kwargs) -> str:  # type: ignore[override]
+        return ""
+
+
+async def _noop(*_args: Any, **_kwargs: Any) -> None:
+    return None
+
+
+def _run(pipe: Pipe, message: str) -> Any:
+    return asyncio.run(
+        pipe.pipe(
+            body={"messages": [{"role": "user", "content": message}]},
+            __user__={"id": "user-1"},
+            __request__=Request(),
+            __event_emitter__=_noop,
+            __event_call__=_noop,
+        )
+    )
+
+
+@pytest.fixture()
+def templates_dir(tmp_path: Path) -> Path:
+    (tmp_path / "weekly-report.json").write_text(json.dumps(WEEKLY_REPORT))
+    return tmp_path
+
+
+def test_explicit_prefix_binds_parameters_and_skips_planning(templates_dir: Path) -> None:
+    pipe = TemplatePipe(templates_dir)
+
+    result = _run(pipe, '/plan weekly-report topic="solar storage" audience=investors')
+
+    assert pipe.plans_created == 0
+    assert result == "Weekly report on solar storage for investors"
+    plan = pipe.executed[0]
+    actions = {action.id: action for action in plan.actions}
+    assert actions["research"].description == "Search this week's news about solar storage"
+    assert actions["write"].description.endswith("for investors using @research")
+    # Action placeholders are not template parameters and stay untouched.
+    assert actions["final_synthesis"].description == "# solar storage\n\n{{write}}"
+    assert actions["research"].model == "actor"
+    assert actions["write"].model == "writer"
+    assert plan.metadata["plan_template_params"] == {
+        "topic": "solar storage",
+        "audience": "investors",
+    }
+
+
+def test_regex_matcher_and_defaults(templates_dir: Path) -> None:
+    pipe = TemplatePipe(templates_dir)
+
+    _run(pipe, "Weekly report about battery recycling")
+    _run(pipe, "Tell me a joke")
+
+    assert pipe.plans_created == 1
+    assert pipe.executed[0].goal == "Weekly report on battery recycling for the team"
+    assert pipe.executed[0].metadata["plan_template"] == "weekly-report"
+
+
+def test_bare_words_fill_first_missing_parameter(templates_dir: Path) -> None:
+    library = _PlanTemplateLibrary.load(str(templates_dir))
+
+    template, values = library.match("/plan weekly-report quantum sensors")
+
+    assert template.name == "weekly-report"
+    assert values == {"topic": "quantum sensors"}
+
+
+def test_invalid_explicit_requests_report_errors(templates_dir: Path) -> None:
+    pipe = TemplatePipe(templates_dir)
+
+    _run(pipe, "/plan unknown-template topic=x")
+    _run(pipe, "/plan weekly-report audience=board")
+
+    assert pipe.plans_created == 0
+    assert pipe.executed == []
+    errors = [message for level, message in pipe.statuses if level == "error"]
+    assert "Unknown plan template 'unknown-template'" in errors[0]
+    assert "missing parameter(s): topic" in errors[1]
+
+
+def test_yaml_templates_and_reload_on_change(templates_dir: Path) -> None:
+    pytest.importorskip("yaml")
+    pipe = TemplatePipe(templates_dir)
+    assert pipe._get_plan_template_library().templates.keys() == {"weekly-report"}
+
+    (templates_dir / "standup.yaml").write_text(
+        "name: standup\n"
+        "params: [team]\n"
+        "actions:\n"
+        "  - id: collect\n"
+        "    type: tool\n"
+        "    description: Collect updates from {{team}}\n"
+    )
+
+    plan = pipe._plan_from_template("/plan standup team=platform")
+
+    assert plan is not None
+    assert plan.actions[0].description == "Collect updates from platform"
+    assert plan.actions[-1].id == "final_synthesis"
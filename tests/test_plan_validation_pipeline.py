@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan  # noqa: E402
+
+
+class ValidationTrackingPipe(Pipe):
+    def __init__(self) -> None:
+        super().__init__()
+        self.valves.ENABLE_TOOL_INTEGRATION = True
+        self.valves.ENABLE_LIGHTWEIGHT_CONTEXT_OPTIMIZATION = True
+        self.valves.PLAN_VALIDATION_CONCURRENCY = 2
+        self.valves.BATCH_TOOL_SELECTION = False
+        # Send every candidate to the LLM instead of deciding clear cases locally.
+        self.valves.LIGHTWEIGHT_ACCEPT_THRESHOLD = 1.1
+        self.valves.LIGHTWEIGHT_REJECT_THRESHOLD = -0.1
+        self.active = 0
+        self.max_active = 0
+        self.events: list[tuple[str, str]] = []
+        self.statuses: list[str] = []
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools=None,
+        format=None,
+        action_results=None,
+        action=None,
+    ) -> str:
+        if "tool selection expert" in prompt:
+            kind = "tools"
+            target = prompt.split("- Description: ")[1].split("\n")[0]
+        elif "lightweight context mode" in prompt:
+            kind = "lightweight"
+            target = prompt.split("- ID: ")[1].split("\n")[0]
+        else:
+            kind = "template"
+            target = "final_synthesis"
+
+        self.events.append(("start", kind))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            # Later actions answer first, so results arrive out of plan order.
+            delay = {"Search A": 0.03, "Search B": 0.02, "Search C": 0.01}.get(target, 0.02)
+            await asyncio.sleep(delay)
+        finally:
+            self.active -= 1
+            self.events.append(("end", kind))
+
+        if kind == "tools":
+            return json.dumps(["web_search"] if target != "Search B" else ["unknown"])
+        if kind == "lightweight":
+            return "YES"
+        return "# Report\n{{search_a}}"
+
+    async def emit_status(self, level: str, message: str, done: bool) -> None:  # type: ignore[override]
+        self.statuses.append(message)
+
+
+def _plan() -> Plan:
+    return Plan(
+        goal="Research and save",
+        actions=[
+            Action(id="search_a", type="tool", description="Search A"),
+            Action(id="search_b", type="tool", description="Search B"),
+            Action(id="search_c", type="tool", description="Search C"),
+            Action(
+                id="save_notes",
+                type="tool",
+                description="Save results to the vault",
+                tool_ids=["obsidian"],
+                dependencies=["search_a", "search_c"],
+            ),
+            Action(
+                id="final_synthesis",
+                type="text",
+                description="{{search_a}}",
+                dependencies=["search_a", "search_b", "search_c", "save_notes"],
+            ),
+        ],
+    )
+
+
+def test_validation_passes_overlap_and_merge_deterministically(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(
+        "planner.Tools.get_tools",
+        staticmethod(
+            lambda: [
+                SimpleNamespace(
+                    id="web_search", name="Web", meta=SimpleNamespace(description="Search")
+                )
+            ]
+        ),
+    )
+    pipe = ValidationTrackingPipe()
+    plan = _plan()
+
+    asyncio.run(pipe._run_plan_validation_passes(plan))
+
+    assert [a.tool_ids for a in plan.actions[:3]] == [["web_search"], None, ["web_search"]]
+    tool_outcomes = [
+        message
+        for message in pipe.statuses
+        if message.startswith(("Added tools to", "No suitable tools found"))
+    ]
+    assert [message.split("search_")[1][0] for message in tool_outcomes] == ["a", "b", "c"]
+    assert plan.actions[3].use_lightweight_context is True
+    assert plan.actions[-1].description == "# Report\n{{search_a}}"
+
+    assert pipe.max_active == 2
+    kinds_started = [kind for event, kind in pipe.events if event == "start"]
+    assert kinds_started.index("template") < kinds_started.index("lightweight")
+    last_tool_end = max(
+        index for index, event in enumerate(pipe.events) if event == ("end", "tools")
+    )
+    assert pipe.events.index(("start", "lightweight")) > last_tool_end
+
+
+def test_failed_pass_does_not_block_the_others(monkeypatch: pytest.MonkeyPatch) -> None:
+    pipe = ValidationTrackingPipe()
+
+    async def broken(_plan: Plan) -> None:
+        raise RuntimeError("tool catalog unavailable")
+
+    monkeypatch.setattr(pipe, "validate_and_fix_tool_actions", broken)
+    plan = _plan()
+
+    asyncio.run(pipe._run_plan_validation_passes(plan))
+
+    assert plan.actions[-1].description == "# Report\n{{search_a}}"
+    assert plan.actions[3].use_lightweight_context is True
+    assert pipe.run_context.validation_semaphore is None
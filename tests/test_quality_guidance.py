@@ -212,7 +212,7 @@ def test_retry_feedback_reports_previous_tool_usage() -> None:
         ),
     ]
 
-    pipe.simulated_tool_call_sequence = [["search_tool"], []]
+    pipe.simulated_tool_call_sequence = [["search_tool"], ["search_tool"]]
 
     pipe.analysis_responses = [
         json.dumps(
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import sys
+from typing import Any
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan, _ReadyQueue  # noqa: E402
+
+
+def test_ready_queue_releases_dependents_once_all_dependencies_finish() -> None:
+    actions = [
+        Action(id="a", type="text", description="A"),
+        Action(id="b", type="text", description="B"),
+        Action(id="c", type="text", description="C", dependencies=["a", "b", "a"]),
+    ]
+    ready = _ReadyQueue(actions)
+
+    assert [ready.pop().id, ready.pop().id] == ["a", "b"]
+    assert ready.pop() is None
+
+    assert ready.mark_done("a") == []
+    assert ready.mark_done("b") == ["c"]
+    assert ready.pop().id == "c"
+
+
+def test_ready_queue_orders_by_priority_then_plan_position() -> None:
+    actions = [
+        Action(id="first", type="text", description="First"),
+        Action(id="second", type="text", description="Second"),
+        Action(id="third", type="text", description="Third"),
+    ]
+    ready = _ReadyQueue(actions, {"third": 5.0})
+
+    assert [ready.pop().id for _ in range(3)] == ["third", "first", "second"]
+
+
+def test_ready_queue_never_releases_unknown_dependencies() -> None:
+    actions = [Action(id="orphan", type="text", description="Orphan", dependencies=["ghost"])]
+    ready = _ReadyQueue(actions)
+
+    assert len(ready) == 0
+    assert ready.pop() is None
+
+
+class InstantPipe(Pipe):
+    def __init__(self) -> None:
+        super().__init__()
+        self.valves.CONCURRENT_ACTIONS = 4
+        self.valves.SHOW_ACTION_SUMMARIES = False
+        self.executed = 0
+
+    async def execute_action(  # type: ignore[override]
+        self,
+        plan: Plan,
+        action: Action,
+        context: dict[str, Any],
+        step_number: int,
+    ) -> dict[str, str]:
+        self.executed += 1
+        result = {"primary_output": action.id, "supporting_details": ""}
+        action.output = result
+        action.status = "completed"
+        return result
+
+    async def review_final_deliverable(  # type: ignore[override]
+        self, plan: Plan, assembled_output: str, default_supporting_details: str = ""
+    ) -> dict[str, str]:
+        return {"primary_output": assembled_output, "supporting_details": ""}
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_message(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_full_state(self, *_args, **_kwargs) -> str:  # type: ignore[override]
+        return ""
+
+
+def test_large_generated_plan_completes_without_polling() -> None:
+    actions = [Action(id="step_0", type="text", description="Step 0")]
+    for index in range(1, 60):
+        dependencies = [f"step_{index - 1}"] if index % 3 else []
+        actions.append(
+            Action(
+                id=f"step_{index}",
+                type="text",
+                description=f"Step {index}",
+                dependencies=dependencies,
+            )
+        )
+    actions.append(
+        Action(
+            id="final_synthesis",
+            type="text",
+            description="Done",
+            dependencies=[action.id for action in actions],
+        )
+    )
+    plan = Plan(goal="Many steps", actions=actions)
+    pipe = InstantPipe()
+
+    async def run() -> None:
+        await asyncio.wait_for(pipe.execute_plan(plan), timeout=2)
+
+    asyncio.run(run())
+
+    assert pipe.executed == 60
+    assert all(action.status == "completed" for action in plan.actions)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan  # noqa: E402
+
+
+class CountingJudgePipe(Pipe):
+    def __init__(self) -> None:
+        super().__init__()
+        self.valves.ENABLE_TOOL_INTEGRATION = False
+        self.judge_calls = 0
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools: dict[str, dict[object, object]] | None = None,
+        format: dict[str, object] | None = None,
+        action_results: dict[str, dict[str, str]] | None = None,
+        action=None,
+    ) -> str:
+        self.judge_calls += 1
+        return json.dumps(
+            {
+                "is_successful": False,
+                "quality_score": 0.6,
+                "issues": ["Too short"],
+                "suggestions": ["Expand"],
+            }
+        )
+
+
+def _output(text: str) -> str:
+    return json.dumps({"primary_output": text, "supporting_details": ""})
+
+
+def test_identical_outputs_are_judged_once() -> None:
+    pipe = CountingJudgePipe()
+    action = Action(id="write", type="text", description="Write")
+    plan = Plan(goal="Goal", actions=[action])
+
+    first = asyncio.run(pipe.analyze_output(plan, action, _output("Some  text")))
+    first.issues.append("mutated by caller")
+    second = asyncio.run(pipe.analyze_output(plan, action, _output("Some text")))
+
+    assert pipe.judge_calls == 1
+    assert second.quality_score == 0.6
+    assert second.issues == ["Too short"]
+
+
+def test_changed_inputs_miss_the_cache_and_lru_evicts() -> None:
+    pipe = CountingJudgePipe()
+    pipe.valves.REFLECTION_CACHE_MAX_ENTRIES = 1
+    action = Action(id="write", type="text", description="Write")
+    plan = Plan(goal="Goal", actions=[action])
+
+    asyncio.run(pipe.analyze_output(plan, action, _output("A")))
+    action.tool_calls.append("search")
+    asyncio.run(pipe.analyze_output(plan, action, _output("A")))
+    assert pipe.judge_calls == 2
+
+    action.tool_calls.clear()
+    asyncio.run(pipe.analyze_output(plan, action, _output("A")))
+    assert pipe.judge_calls == 3
+    assert len(pipe._reflection_cache) == 1
+
+
+def test_tool_results_and_judge_models_are_part_of_the_key() -> None:
+    pipe = CountingJudgePipe()
+    action = Action(id="write", type="text", description="Write")
+    plan = Plan(goal="Goal", actions=[action])
+
+    action.tool_results["search"] = "old results"
+    asyncio.run(pipe.analyze_output(plan, action, _output("A")))
+    action.tool_results["search"] = "new results"
+    asyncio.run(pipe.analyze_output(plan, action, _output("A")))
+    assert pipe.judge_calls == 2
+
+    pipe.valves.JUDGE_MODEL = "other-judge"
+    asyncio.run(pipe.analyze_output(plan, action, _output("A")))
+    pipe.valves.JUDGE_ESCALATION_MODEL = "strong-judge"
+    asyncio.run(pipe.analyze_output(plan, action, _output("A")))
+    # The borderline 0.6 verdict is also sent to the escalation model.
+    assert pipe.judge_calls == 5
+
+    asyncio.run(pipe.analyze_output(plan, action, _output("A")))
+    assert pipe.judge_calls == 5
+
+
+def test_cache_can_be_disabled() -> None:
+    pipe = CountingJudgePipe()
+    pipe.valves.REFLECTION_CACHE_MAX_ENTRIES = 0
+    action = Action(id="write", type="text", description="Write")
+    plan = Plan(goal="Goal", actions=[action])
+
+    for _ in range(2):
+        asyncio.run(pipe.analyze_output(plan, action, _output("A")))
+
+    assert pipe.judge_calls == 2
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import sys
+from typing import Any
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import (  # noqa: E402
+    _CURRENT_RUN_CONTEXT,
+    Pipe,
+    RunContext,
+    _bypass_llm_cache,
+    _SingleFlight,
+)
+
+
+class _SlowBackend:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def __call__(self, _request, form_data, user=None) -> dict[str, Any]:
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        prompt = form_data["messages"][-1]["content"]
+        return {"choices": [{"message": {"content": f"answer to {prompt}"}}]}
+
+
+def test_identical_in_flight_requests_share_one_backend_call(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    backend = _SlowBackend()
+    monkeypatch.setattr("planner.generate_chat_completion", backend)
+    pipe = Pipe()
+
+    async def scenario() -> list[str]:
+        return await asyncio.gather(
+            pipe.get_completion("same", model="m"),
+            pipe.get_completion("same", model="m"),
+            pipe.get_completion("same", model="m"),
+            pipe.get_completion("other", model="m"),
+        )
+
+    results = asyncio.run(scenario())
+
+    assert results == ["answer to same"] * 3 + ["answer to other"]
+    assert backend.calls == 2
+    assert pipe._llm_single_flight.stats() == {"hits": 2, "misses": 2, "in_flight": 0}
+
+
+def test_identical_requests_from_different_users_are_not_shared(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    backend = _SlowBackend()
+    monkeypatch.setattr("planner.generate_chat_completion", backend)
+    pipe = Pipe()
+
+    async def ask_as(user_id: str) -> str:
+        _CURRENT_RUN_CONTEXT.set(RunContext(user_info={"id": user_id}))
+        return await pipe.get_completion("same", model="m")
+
+    async def scenario() -> list[str]:
+        return await asyncio.gather(ask_as("a"), ask_as("a"), ask_as("b"))
+
+    asyncio.run(scenario())
+
+    assert backend.calls == 2
+    assert pipe._llm_single_flight.stats()["hits"] == 1
+
+
+def test_coalescing_can_be_disabled_or_bypassed(monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = _SlowBackend()
+    monkeypatch.setattr("planner.generate_chat_completion", backend)
+    pipe = Pipe()
+
+    async def bypassed() -> None:
+        with _bypass_llm_cache():
+            await asyncio.gather(
+                pipe.get_completion("same", model="m"),
+                pipe.get_completion("same", model="m"),
+            )
+
+    asyncio.run(bypassed())
+    pipe.valves.COALESCE_LLM_REQUESTS = False
+
+    async def disabled() -> None:
+        await asyncio.gather(
+            pipe.get_completion("same", model="m"),
+            pipe.get_completion("same", model="m"),
+        )
+
+    asyncio.run(disabled())
+
+    assert backend.calls == 4
+
+
+def test_calls_inside_cache_bypass_are_never_coalesced(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    backend = _SlowBackend()
+    monkeypatch.setattr("planner.generate_chat_completion", backend)
+    pipe = Pipe()
+
+    async def execute_like_an_action() -> str:
+        with _bypass_llm_cache():
+            return await pipe.get_completion("same", model="m")
+
+    async def scenario() -> list[str]:
+        return await asyncio.gather(
+            execute_like_an_action(),
+            execute_like_an_action(),
+            pipe.get_completion("same", model="m"),
+        )
+
+    asyncio.run(scenario())
+
+    assert backend.calls == 3
+    assert pipe._llm_single_flight.stats() == {"hits": 0, "misses": 1, "in_flight": 0}
+
+
+def test_followers_share_errors_and_survive_leader_cancellation() -> None:
+    flight = _SingleFlight()
+    calls = 0
+
+    async def failing() -> str:
+        await asyncio.sleep(0.01)
+        raise RuntimeError("backend down")
+
+    async def slow() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def scenario() -> str:
+        outcomes = await asyncio.gather(
+            flight.run("k", failing), flight.run("k", failing), return_exceptions=True
+        )
+        assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+
+        leader = asyncio.create_task(flight.run("k", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.run("k", slow))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == "ok"
+    assert calls == 2
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import sys
+from typing import Any
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan, Request, RunContext  # noqa: E402
+
+
+class InterleavingPipe(Pipe):
+    """Pipe whose planning and execution yield control so two runs interleave."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.seen_users: dict[str, Any] = {}
+
+    async def create_plan(self, goal: str) -> Plan:  # type: ignore[override]
+        await asyncio.sleep(0.01)
+        await self.emit_status("info", f"planned {goal}", False)
+        return Plan(goal=goal, actions=[])
+
+    async def execute_plan(self, plan: Plan) -> str:  # type: ignore[override]
+        await asyncio.sleep(0.01)
+        self.seen_users[plan.goal] = self.user
+        await self.emit_message(f"result for {plan.goal}")
+        return plan.goal
+
+    async def emit_full_state(self, *_args, **_kwargs) -> str:  # type: ignore[override]
+        return ""
+
+
+def _recording_emitter(sink: list[dict[str, Any]]):
+    async def emit(event: dict[str, Any]) -> None:
+        sink.append(event)
+
+    return emit
+
+
+async def _noop_call(*_args: Any, **_kwargs: Any) -> None:
+    return None
+
+
+def test_concurrent_runs_keep_their_own_emitter_and_user() -> None:
+    pipe = InterleavingPipe()
+    events_a: list[dict[str, Any]] = []
+    events_b: list[dict[str, Any]] = []
+
+    async def run_both() -> list[Any]:
+        return await asyncio.gather(
+            pipe.pipe(
+                body={"messages": [{"role": "user", "content": "goal A"}]},
+                __user__={"id": "user-a"},
+                __request__=Request(),
+                __event_emitter__=_recording_emitter(events_a),
+                __event_call__=_noop_call,
+            ),
+            pipe.pipe(
+                body={"messages": [{"role": "user", "content": "goal B"}]},
+                __user__={"id": "user-b"},
+                __request__=Request(),
+                __event_emitter__=_recording_emitter(events_b),
+                __event_call__=_noop_call,
+            ),
+        )
+
+    results = asyncio.run(run_both())
+
+    assert results == ["goal A", "goal B"]
+    contents_a = " ".join(str(event["data"]) for event in events_a)
+    contents_b = " ".join(str(event["data"]) for event in events_b)
+    assert "goal A" in contents_a and "goal B" not in contents_a
+    assert "goal B" in contents_b and "goal A" not in contents_b
+    assert pipe.seen_users == {"goal A": {"id": "user-a"}, "goal B": {"id": "user-b"}}
+
+
+def test_run_context_is_released_after_pipe_returns() -> None:
+    pipe = InterleavingPipe()
+    sink: list[dict[str, Any]] = []
+
+    asyncio.run(
+        pipe.pipe(
+            body={"messages": [{"role": "user", "content": "goal"}]},
+            __user__={"id": "user-a"},
+            __request__=Request(),
+            __event_emitter__=_recording_emitter(sink),
+            __event_call__=_noop_call,
+        )
+    )
+
+    assert isinstance(pipe.run_context, RunContext)
+    assert pipe.run_context.event_emitter is None
+    assert pipe.user is None
+
+
+def test_attributes_set_outside_a_run_use_the_default_context() -> None:
+    pipe = Pipe()
+    action = Action(id="a", type="text", description="A")
+    sink: list[dict[str, Any]] = []
+    pipe.__current_event_emitter__ = _recording_emitter(sink)  # type: ignore[assignment]
+
+    asyncio.run(pipe.emit_message(pipe.format_action_output(action, {"primary_output": "x"})))
+
+    assert len(sink) == 1
+    assert pipe._emitted_messages == [sink[0]["data"]["content"]]
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+from typing import Any
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan, Request, UserAbortedException  # noqa: E402
+
+
+class JournalingPipe(Pipe):
+    def __init__(self, journal_dir: Path) -> None:
+        super().__init__()
+        self.valves.RUN_JOURNAL_DIR = str(journal_dir)
+        self.valves.SHOW_ACTION_SUMMARIES = False
+        self.plans_created = 0
+        self.executed: list[str] = []
+        self.abort_ids: set[str] = set()
+
+    async def create_plan(self, goal: str) -> Plan:  # type: ignore[override]
+        self.plans_created += 1
+        return Plan(
+            goal=goal,
+            actions=[
+                Action(id="research", type="tool", description="Research"),
+                Action(id="draft", type="text", description="Draft", dependencies=["research"]),
+                Action(
+                    id="final_synthesis",
+                    type="text",
+                    description="{{research}}\n{{draft}}",
+                    dependencies=["research", "draft"],
+                ),
+            ],
+        )
+
+    async def execute_action(  # type: ignore[override]
+        self,
+        plan: Plan,
+        action: Action,
+        context: dict[str, Any],
+        step_number: int,
+    ) -> dict[str, str]:
+        self.executed.append(action.id)
+        if action.id in self.abort_ids:
+            raise UserAbortedException(action.id)
+        result = {
+            "primary_output": f"output of {action.id} using {sorted(context)}",
+            "supporting_details": "",
+        }
+        action.output = result
+        action.status = "completed"
+        plan.metadata.setdefault("raw_action_outputs", {})[action.id] = {
+            "primary_output": result["primary_output"]
+        }
+        return result
+
+    async def review_final_deliverable(  # type: ignore[override]
+        self, plan: Plan, assembled_output: str, default_supporting_details: str = ""
+    ) -> dict[str, str]:
+        return {"primary_output": assembled_output, "supporting_details": ""}
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_message(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_full_state(self, *_args, **_kwargs) -> str:  # type: ignore[override]
+        return ""
+
+
+async def _noop(*_args: Any, **_kwargs: Any) -> None:
+    return None
+
+
+def _run(pipe: Pipe, goal: str = "Write a report") -> Any:
+    return asyncio.run(
+        pipe.pipe(
+            body={"messages": [{"role": "user", "content": goal}]},
+            __user__={"id": "user-1"},
+            __request__=Request(),
+            __event_emitter__=_noop,
+            __event_call__=_noop,
+        )
+    )
+
+
+def test_aborted_run_resumes_remaining_actions_without_replanning(tmp_path: Path) -> None:
+    first = JournalingPipe(tmp_path)
+    first.abort_ids = {"draft"}
+    _run(first)
+    assert first.executed == ["research", "draft"]
+
+    # A fresh instance stands in for a restarted worker.
+    second = JournalingPipe(tmp_path)
+    _run(second)
+
+    assert second.plans_created == 0
+    assert second.executed == ["draft"]
+
+    journal = next(tmp_path.glob("*.jsonl"))
+    events = [json.loads(line) for line in journal.read_text().splitlines()]
+    assert [event["event"] for event in events] == ["plan", "action", "action", "complete"]
+    assert events[1]["action"]["id"] == "research"
+    assert events[1]["raw_output"]["primary_output"].startswith("output of research")
+    assert "seconds" in events[1]
+
+
+def test_completed_journal_starts_a_new_run(tmp_path: Path) -> None:
+    first = JournalingPipe(tmp_path)
+    _run(first)
+
+    second = JournalingPipe(tmp_path)
+    _run(second)
+
+    assert second.plans_created == 1
+    assert second.executed == ["research", "draft"]
+    assert len(list(tmp_path.glob("*.jsonl"))) == 1
+
+
+def test_journals_are_separate_per_goal_and_disabled_by_default(tmp_path: Path) -> None:
+    pipe = JournalingPipe(tmp_path)
+    _run(pipe, "goal one")
+    _run(pipe, "goal two")
+    assert len(list(tmp_path.glob("*.jsonl"))) == 2
+
+    plain = JournalingPipe(tmp_path / "unused")
+    plain.valves.RUN_JOURNAL_DIR = ""
+    _run(plain)
+    assert not (tmp_path / "unused").exists()
+
+
+def test_stale_journal_starts_a_new_run(tmp_path: Path) -> None:
+    first = JournalingPipe(tmp_path)
+    first.abort_ids = {"draft"}
+    _run(first)
+
+    journal = next(tmp_path.glob("*.jsonl"))
+    events = [json.loads(line) for line in journal.read_text().splitlines()]
+    events[0]["created_at"] -= 2 * 86400
+    journal.write_text("".join(json.dumps(event) + "\n" for event in events))
+
+    second = JournalingPipe(tmp_path)
+    _run(second)
+
+    assert second.plans_created == 1
+    assert second.executed == ["research", "draft"]
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+import time
+from typing import Any
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import (  # noqa: E402
+    Action,
+    Pipe,
+    Plan,
+    ReflectionResult,
+    UserAbortedException,
+)
+
+
+class SlowJudgePipe(Pipe):
+    """Action calls are instant; the evaluator takes JUDGE_SECONDS per verdict."""
+
+    JUDGE_SECONDS = 0.2
+
+    def __init__(self, verdicts: dict[str, list[bool]] | None = None) -> None:
+        super().__init__()
+        self.valves.SHOW_ACTION_SUMMARIES = False
+        self.valves.SPECULATIVE_EXECUTION_DEPTH = 1
+        self.verdicts = verdicts or {}
+        self.attempts: dict[str, int] = {}
+        self.contexts: dict[str, list[dict[str, Any]]] = {}
+        self.started: dict[str, list[float]] = {}
+        self.judged: dict[str, float] = {}
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools: dict[str, dict[object, object]] | None = None,
+        format: dict[str, object] | None = None,
+        action_results: dict[str, dict[str, str]] | None = None,
+        action=None,
+    ) -> str:
+        attempt = self.attempts.get(action.id, 0) + 1
+        self.attempts[action.id] = attempt
+        self.started.setdefault(action.id, []).append(time.perf_counter())
+        self.contexts.setdefault(action.id, []).append(
+            {k: v.get("primary_output") for k, v in (action_results or {}).items()}
+        )
+        return json.dumps(
+            {"primary_output": f"{action.id} v{attempt}", "supporting_details": ""}
+        )
+
+    async def analyze_output(self, plan, action, output) -> ReflectionResult:  # type: ignore[override]
+        await asyncio.sleep(self.JUDGE_SECONDS)
+        verdicts = self.verdicts.get(action.id) or [True]
+        passed = verdicts.pop(0) if len(verdicts) > 1 else verdicts[0]
+        self.judged[action.id] = time.perf_counter()
+        return ReflectionResult(
+            is_successful=passed,
+            quality_score=0.9 if passed else 0.2,
+            issues=[] if passed else ["Needs work"],
+            suggestions=[],
+        )
+
+    async def review_final_deliverable(  # type: ignore[override]
+        self, plan: Plan, assembled_output: str, default_supporting_details: str = ""
+    ) -> dict[str, str]:
+        return {"primary_output": assembled_output, "supporting_details": ""}
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_message(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_full_state(self, *_args, **_kwargs) -> str:  # type: ignore[override]
+        return ""
+
+
+def _chain_plan() -> Plan:
+    return Plan(
+        goal="Goal",
+        actions=[
+            Action(id="draft", type="text", description="Draft"),
+            Action(id="edit", type="text", description="Edit", dependencies=["draft"]),
+            Action(
+                id="final_synthesis",
+                type="text",
+                description="{edit}",
+                dependencies=["edit"],
+            ),
+        ],
+    )
+
+
+def test_dependent_starts_while_parent_is_being_judged() -> None:
+    pipe = SlowJudgePipe()
+    plan = _chain_plan()
+
+    started = time.perf_counter()
+    asyncio.run(asyncio.wait_for(pipe.execute_plan(plan), timeout=5))
+    elapsed = time.perf_counter() - started
+
+    assert pipe.started["edit"][0] < pipe.judged["draft"]
+    assert pipe.contexts["edit"] == [{"draft": "draft v1"}]
+    assert pipe.attempts["edit"] == 1
+    assert elapsed < 2 * SlowJudgePipe.JUDGE_SECONDS + 0.15
+    assert [a.status for a in plan.actions] == ["completed"] * 3
+    assert [o["id"] for o in plan.metadata["execution_outputs"]] == ["draft", "edit"]
+
+
+def test_rejected_parent_output_reruns_speculative_dependent() -> None:
+    pipe = SlowJudgePipe({"draft": [False, True]})
+    plan = _chain_plan()
+
+    asyncio.run(asyncio.wait_for(pipe.execute_plan(plan), timeout=5))
+
+    assert pipe.attempts["draft"] == 2
+    assert pipe.contexts["edit"] == [{"draft": "draft v1"}, {"draft": "draft v2"}]
+    assert plan.actions[1].output["primary_output"].startswith("edit v")
+    assert plan.actions[1].status == "completed"
+
+
+def test_speculation_disabled_waits_for_the_judge() -> None:
+    pipe = SlowJudgePipe()
+    pipe.valves.SPECULATIVE_EXECUTION_DEPTH = 0
+
+    asyncio.run(asyncio.wait_for(pipe.execute_plan(_chain_plan()), timeout=5))
+
+    assert pipe.started["edit"][0] >= pipe.judged["draft"]
+
+
+def test_tool_actions_are_not_speculated_by_default() -> None:
+    pipe = SlowJudgePipe()
+    plan = _chain_plan()
+    plan.actions[1].type = "tool"
+
+    asyncio.run(asyncio.wait_for(pipe.execute_plan(plan), timeout=5))
+
+    assert pipe.started["edit"][0] >= pipe.judged["draft"]
+
+
+class FlakyDependentPipe(SlowJudgePipe):
+    """The dependent fails whenever it runs before its parent has been judged."""
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools: dict[str, dict[object, object]] | None = None,
+        format: dict[str, object] | None = None,
+        action_results: dict[str, dict[str, str]] | None = None,
+        action=None,
+    ) -> str:
+        if action.id == "edit" and "draft" not in self.judged:
+            self.started.setdefault("edit", []).append(time.perf_counter())
+            raise RuntimeError("backend unavailable")
+        return await super().get_completion(
+            prompt, model, tools, format, action_results, action
+        )
+
+
+def test_failed_speculation_waits_for_the_committed_parent() -> None:
+    pipe = FlakyDependentPipe()
+    pipe.valves.MAX_RETRIES = 1
+    plan = _chain_plan()
+
+    asyncio.run(asyncio.wait_for(pipe.execute_plan(plan), timeout=5))
+
+    assert len(pipe.started["edit"]) == 3
+    assert pipe.started["edit"][-1] >= pipe.judged["draft"]
+    assert [a.status for a in plan.actions] == ["completed"] * 3
+
+
+class AbortingDependentPipe(SlowJudgePipe):
+    async def execute_action(self, plan, action, context, step_number):  # type: ignore[override]
+        if action.id == "edit":
+            self.attempts["edit"] = self.attempts.get("edit", 0) + 1
+            raise UserAbortedException(action.id, "User chose to abort")
+        return await super().execute_action(plan, action, context, step_number)
+
+
+def test_abort_during_speculative_run_stops_the_plan() -> None:
+    pipe = AbortingDependentPipe()
+    plan = _chain_plan()
+
+    asyncio.run(asyncio.wait_for(pipe.execute_plan(plan), timeout=5))
+
+    assert pipe.attempts["edit"] == 1
+    assert plan.actions[1].status == "aborted"
+    assert plan.actions[2].status == "pending"
+
+
+def test_discarded_speculative_run_emits_nothing() -> None:
+    pipe = SlowJudgePipe({"draft": [False, True]})
+    messages: list[str] = []
+
+    async def record(event: dict[str, Any]) -> None:
+        if event["type"] == "message":
+            messages.append(event["data"]["content"])
+
+    pipe.emit_message = Pipe.emit_message.__get__(pipe)  # type: ignore[method-assign]
+    pipe.__current_event_emitter__ = record  # type: ignore[assignment]
+
+    asyncio.run(asyncio.wait_for(pipe.execute_plan(_chain_plan()), timeout=5))
+
+    assert pipe.attempts["edit"] == 2
+    assert not any("edit v1" in message for message in messages)
+    assert any("edit v2" in message for message in messages)
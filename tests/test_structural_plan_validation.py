@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+from typing import Any
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan, _validate_plan_structure  # noqa: E402
+
+
+def _action(action_id: str, dependencies: list[str] | None = None, **kwargs: Any) -> Action:
+    return Action(
+        id=action_id,
+        type="text",
+        description=kwargs.pop("description", action_id),
+        dependencies=dependencies or [],
+        **kwargs,
+    )
+
+
+def test_trivial_problems_are_repaired_without_errors() -> None:
+    plan = Plan(
+        goal="Goal",
+        actions=[
+            _action("research", ["ghost", "research"], tool_ids=["web_search", "made_up"]),
+            _action("final_synthesis", ["research"], description="{research} {draft}"),
+            _action("draft", ["research", "final_synthesis"]),
+        ],
+    )
+
+    errors, repairs = _validate_plan_structure(plan, {"web_search"})
+
+    assert errors == []
+    assert len(repairs) == 5
+    assert [a.id for a in plan.actions] == ["research", "draft", "final_synthesis"]
+    assert plan.actions[0].dependencies == []
+    assert plan.actions[0].tool_ids == ["web_search"]
+    assert plan.actions[1].dependencies == ["research"]
+    assert plan.actions[2].dependencies == ["research", "draft"]
+
+
+def test_all_structural_errors_are_reported_together() -> None:
+    plan = Plan(
+        goal="Goal",
+        actions=[
+            _action("a", ["b"]),
+            _action("b", ["a"]),
+            _action("a"),
+            _action("stray"),
+            _action(
+                "final_synthesis",
+                ["a"],
+                description="{a.output} {missing} <div>{a}</div>",
+            ),
+        ],
+    )
+
+    errors, _ = _validate_plan_structure(plan)
+    combined = "\n".join(errors)
+
+    assert len(errors) == 5
+    assert "Duplicated ids: ['a']" in combined
+    assert "nested placeholders" in combined
+    assert "HTML tags" in combined
+    assert "non-existent actions: ['missing']" in combined
+    assert "Dependency cycle detected" in combined
+    assert "stray" not in combined
+
+
+def test_side_effect_leaf_is_not_a_structural_error() -> None:
+    plan = Plan(
+        goal="Goal",
+        actions=[
+            _action("write"),
+            Action(
+                id="save",
+                type="tool",
+                description="Save chapter to Obsidian vault",
+                dependencies=["write"],
+            ),
+            _action("final_synthesis", ["write"], description="{write}"),
+        ],
+    )
+
+    errors, repairs = _validate_plan_structure(plan)
+
+    assert errors == []
+    assert repairs == []
+
+
+class ScriptedPlanPipe(Pipe):
+    def __init__(self, responses: list[dict[str, Any]]) -> None:
+        super().__init__()
+        self.valves.ENABLE_TOOL_INTEGRATION = False
+        self.responses = responses
+        self.prompts: list[list[dict[str, str]]] = []
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools: dict[str, dict[object, object]] | None = None,
+        format: dict[str, object] | None = None,
+        action_results: dict[str, dict[str, str]] | None = None,
+        action=None,
+    ) -> str:
+        self.prompts.append(list(prompt))
+        return json.dumps(self.responses.pop(0))
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def _run_plan_validation_passes(self, _plan) -> None:  # type: ignore[override]
+        return
+
+
+def _plan_action(action_id: str, dependencies: list[str], description: str = "") -> dict[str, Any]:
+    return {
+        "id": action_id,
+        "type": "text",
+        "description": description or action_id,
+        "tool_ids": [],
+        "dependencies": dependencies,
+        "model": "",
+    }
+
+
+def test_create_plan_repairs_locally_without_retrying() -> None:
+    pipe = ScriptedPlanPipe(
+        [
+            {
+                "goal": "Goal",
+                "actions": [
+                    _plan_action("final_synthesis", ["ghost"], "{research}"),
+                    _plan_action("research", ["final_synthesis"]),
+                ],
+            }
+        ]
+    )
+
+    plan = asyncio.run(pipe.create_plan("Goal"))
+
+    assert len(pipe.prompts) == 1
+    assert [a.id for a in plan.actions] == ["research", "final_synthesis"]
+    assert plan.actions[-1].dependencies == ["research"]
+
+
+def test_create_plan_sends_one_combined_correction() -> None:
+    broken = {
+        "goal": "Goal",
+        "actions": [
+            _plan_action("a", ["b"]),
+            _plan_action("b", ["a"]),
+            _plan_action("final_synthesis", ["a"], "{a.output} {nothing}"),
+        ],
+    }
+    fixed = {
+        "goal": "Goal",
+        "actions": [
+            _plan_action("a", []),
+            _plan_action("final_synthesis", ["a"], "{a}"),
+        ],
+    }
+    pipe = ScriptedPlanPipe([broken, fixed])
+
+    plan = asyncio.run(pipe.create_plan("Goal"))
+
+    assert [a.id for a in plan.actions] == ["a", "final_synthesis"]
+    assert len(pipe.prompts) == 2
+    corrections = [m for m in pipe.prompts[1] if m["content"].startswith("error::")]
+    assert len(corrections) == 1
+    assert "nested placeholders" in corrections[0]["content"]
+    assert "non-existent actions" in corrections[0]["content"]
+    assert "Dependency cycle detected" in corrections[0]["content"]
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Pipe, _encode_tool_catalog  # noqa: E402
+
+_BOILERPLATE = "Requires a valid API key configured by an administrator."
+
+
+def _summary(tool_id: str, name: str, description: str) -> dict[str, str]:
+    return {"tool_id": tool_id, "tool_name": name, "tool_description": description}
+
+
+def _catalog() -> list[dict[str, str]]:
+    return [
+        _summary("web_search", "Web Search", f"Search the web for pages. {_BOILERPLATE}"),
+        _summary("weather", "Forecast Lookup", f"Current weather and forecasts. {_BOILERPLATE}"),
+        _summary("sql_runner", "SQL Runner", f"Run read-only SQL queries. {_BOILERPLATE}"),
+        _summary("image_gen", "Image Generator", "Generate images from a prompt."),
+    ]
+
+
+def test_catalog_is_minified_and_deduplicated() -> None:
+    encoded = _encode_tool_catalog(_catalog())
+    payload = json.loads(encoded)
+
+    assert "\n" not in encoded and ": " not in encoded
+    assert encoded.count(_BOILERPLATE) == 1
+    assert payload["shared_description"] == _BOILERPLATE
+    tools = {tool["tool_id"]: tool for tool in payload["tools"]}
+    assert "name" not in tools["web_search"]
+    assert tools["weather"]["name"] == "Forecast Lookup"
+    assert tools["sql_runner"]["description"] == "Run read-only SQL queries."
+
+
+def test_descriptions_are_cut_to_the_token_budget() -> None:
+    long_description = " ".join(f"word{i}" for i in range(200))
+    encoded = _encode_tool_catalog(
+        [_summary("long_tool", "long_tool", long_description)], description_token_budget=10
+    )
+    description = json.loads(encoded)[0]["description"]
+
+    assert len(description) <= 41
+    assert description.endswith("…")
+    assert description.startswith("word0 word1")
+
+
+class CapturingPipe(Pipe):
+    def __init__(self) -> None:
+        super().__init__()
+        self.valves.ENABLE_TOOL_INTEGRATION = True
+        self.prompts: list[str] = []
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools: dict[str, dict[object, object]] | None = None,
+        format: dict[str, object] | None = None,
+        action_results: dict[str, dict[str, str]] | None = None,
+        action=None,
+    ) -> str:
+        self.prompts.append(json.dumps(prompt))
+        return json.dumps(
+            {
+                "goal": "Goal",
+                "actions": [
+                    {
+                        "id": "final_synthesis",
+                        "type": "text",
+                        "description": "Summary",
+                        "tool_ids": [],
+                        "dependencies": [],
+                        "model": "",
+                    }
+                ],
+            }
+        )
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def _run_plan_validation_passes(self, _plan) -> None:  # type: ignore[override]
+        return
+
+
+def test_planner_prompt_only_lists_top_k_tools(monkeypatch: pytest.MonkeyPatch) -> None:
+    catalog = [
+        SimpleNamespace(
+            id=tool["tool_id"],
+            name=tool["tool_name"],
+            meta=SimpleNamespace(description=tool["tool_description"]),
+        )
+        for tool in _catalog()
+    ]
+    monkeypatch.setattr("planner.Tools.get_tools", staticmethod(lambda: catalog))
+    pipe = CapturingPipe()
+    pipe.valves.TOOL_CATALOG_TOP_K = 1
+
+    asyncio.run(pipe.create_plan("Draw images of a cat"))
+
+    assert "image_gen" in pipe.prompts[0]
+    assert "Forecast Lookup" not in pipe.prompts[0]
+    assert "sql_runner" not in pipe.prompts[0]
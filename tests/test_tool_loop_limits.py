@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+from typing import Any
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe  # noqa: E402
+
+
+def _search_tool() -> dict[str, Any]:
+    async def _call(query: str) -> str:
+        return f"results for {query}"
+
+    return {
+        "spec": {
+            "name": "search",
+            "parameters": {"properties": {"query": {"type": "string"}}},
+        },
+        "callable": _call,
+    }
+
+
+class _ToolHappyModel:
+    """Fake backend that asks for a tool call whenever tools are offered."""
+
+    def __init__(self, queries: list[str]) -> None:
+        self.queries = queries
+        self.requests: list[dict[str, Any]] = []
+
+    async def __call__(self, _request, form_data, user=None) -> dict[str, Any]:
+        self.requests.append(form_data)
+        if "tools" in form_data:
+            query = self.queries[min(len(self.requests) - 1, len(self.queries) - 1)]
+            return {
+                "choices": [
+                    {
+                        "message": {
+                            "content": "",
+                            "tool_calls": [
+                                {
+                                    "id": f"call_{len(self.requests)}",
+                                    "type": "function",
+                                    "function": {
+                                        "name": "search",
+                                        "arguments": json.dumps({"query": query}),
+                                    },
+                                }
+                            ],
+                        }
+                    }
+                ]
+            }
+        return {"choices": [{"message": {"content": "final answer"}}]}
+
+
+def _pipe() -> Pipe:
+    pipe = Pipe()
+    pipe.valves.ENABLE_TOOL_INTEGRATION = True
+    pipe.valves.ACTION_MODEL = "action-model"
+    return pipe
+
+
+def test_tool_loop_stops_at_max_turns(monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = _ToolHappyModel([f"query {i}" for i in range(20)])
+    monkeypatch.setattr("planner.generate_chat_completion", backend)
+    pipe = _pipe()
+    pipe.valves.MAX_TOOL_TURNS = 3
+    action = Action(id="research", type="tool", description="Research")
+
+    result = asyncio.run(
+        pipe.get_completion(
+            "Research", model="action-model", tools={"search": _search_tool()}, action=action
+        )
+    )
+
+    assert result == "final answer"
+    assert len(backend.requests) == 4
+    assert "tools" not in backend.requests[-1]
+    assert [turn["turn"] for turn in action.tool_turns] == [1, 2, 3, 4]
+    assert action.tool_turns[-1]["stop_reason"] == "max_turns"
+    assert all("llm_seconds" in turn for turn in action.tool_turns)
+
+
+def test_repeated_tool_call_terminates_loop(monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = _ToolHappyModel(["same query"])
+    monkeypatch.setattr("planner.generate_chat_completion", backend)
+    pipe = _pipe()
+    action = Action(id="research", type="tool", description="Research")
+
+    result = asyncio.run(
+        pipe.get_completion(
+            "Research", model="action-model", tools={"search": _search_tool()}, action=action
+        )
+    )
+
+    assert result == "final answer"
+    assert len(backend.requests) == 3
+    assert action.tool_turns[-1]["stop_reason"] == "repeated_tool_call"
+    assert len(action.tool_turns) == 2
+
+
+def test_character_budget_forces_final_answer(monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = _ToolHappyModel([f"query {i}" for i in range(20)])
+    monkeypatch.setattr("planner.generate_chat_completion", backend)
+    pipe = _pipe()
+    pipe.valves.MAX_TOOL_TURNS = 0
+    pipe.valves.TOOL_LOOP_CHAR_BUDGET = 10
+    action = Action(id="research", type="tool", description="Research")
+
+    asyncio.run(
+        pipe.get_completion(
+            "Research", model="action-model", tools={"search": _search_tool()}, action=action
+        )
+    )
+
+    assert len(backend.requests) == 2
+    assert action.tool_turns[-1]["stop_reason"] == "char_budget"
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+from typing import Any
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan, _ToolRegistry  # noqa: E402
+
+
+class RetryingToolPipe(Pipe):
+    def __init__(self) -> None:
+        super().__init__()
+        self.valves.ENABLE_TOOL_INTEGRATION = True
+        self.valves.MAX_RETRIES = 2
+        self.received_tools: list[dict[str, Any]] = []
+        self.analysis_scores = [0.2, 0.3, 0.9]
+
+        async def _noop_emit(_event: dict[str, Any]) -> None:
+            return None
+
+        self.__current_event_emitter__ = _noop_emit  # type: ignore[assignment]
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools: dict[str, dict[object, object]] | None = None,
+        format: dict[str, object] | None = None,
+        action_results: dict[str, dict[str, str]] | None = None,
+        action=None,
+    ) -> str:
+        if action is not None:
+            self.received_tools.append(dict(tools or {}))
+            action.tool_calls.append("search")
+            return json.dumps({"primary_output": "Findings " * 20, "supporting_details": ""})
+
+        score = self.analysis_scores.pop(0)
+        return json.dumps(
+            {
+                "is_successful": score > 0.5,
+                "quality_score": score,
+                "issues": [] if score > 0.5 else ["Too thin"],
+                "suggestions": [],
+            }
+        )
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+    async def emit_message(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+
+def test_tools_resolved_once_across_retries(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: list[list[str]] = []
+
+    async def fake_get_tools(_request, tool_ids, _user, _extra_params):
+        calls.append(list(tool_ids))
+        return {"search": {"spec": {"name": "search"}, "callable": None}}
+
+    monkeypatch.setattr("planner.get_tools", fake_get_tools)
+
+    pipe = RetryingToolPipe()
+    action = Action(id="research", type="tool", description="Research", tool_ids=["web_search"])
+    plan = Plan(goal="Goal", actions=[action])
+
+    asyncio.run(pipe.execute_action(plan, action, {}, 1))
+
+    assert calls == [["web_search"]]
+    assert len(pipe.received_tools) == 3
+    assert all("search" in tools for tools in pipe.received_tools)
+
+
+def test_registry_shares_pending_resolution_and_supports_invalidation() -> None:
+    registry = _ToolRegistry()
+    loads: list[list[str]] = []
+
+    async def loader(tool_ids: list[str]) -> dict[str, Any]:
+        loads.append(tool_ids)
+        await asyncio.sleep(0.01)
+        return {name: {"spec": {}} for name in tool_ids}
+
+    async def scenario() -> None:
+        first, second = await asyncio.gather(
+            registry.resolve(["b", "a"], loader), registry.resolve(["a", "b"], loader)
+        )
+        assert first == second == {"a": {"spec": {}}, "b": {"spec": {}}}
+        await registry.resolve(["c"], loader)
+
+        registry.invalidate(["a"])
+        await registry.resolve(["a", "b"], loader)
+        await registry.resolve(["c"], loader)
+
+    asyncio.run(scenario())
+
+    assert loads == [["a", "b"], ["c"], ["a", "b"]]
+
+
+def test_registry_forgets_failed_resolutions() -> None:
+    registry = _ToolRegistry()
+    attempts = 0
+
+    async def flaky_loader(tool_ids: list[str]) -> dict[str, Any]:
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise RuntimeError("module failed to load")
+        return {"tool": {"spec": {}}}
+
+    async def scenario() -> dict[str, Any]:
+        with pytest.raises(RuntimeError):
+            await registry.resolve(["tool"], flaky_loader)
+        return await registry.resolve(["tool"], flaky_loader)
+
+    assert asyncio.run(scenario()) == {"tool": {"spec": {}}}
+    assert attempts == 2
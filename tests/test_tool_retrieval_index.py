@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from planner import Action, Pipe, Plan, _ToolRetrievalIndex  # noqa: E402
+
+
+def _tool(tool_id: str, description: str, specs: list[dict[str, Any]] | None = None):
+    return SimpleNamespace(
+        id=tool_id,
+        name=tool_id.replace("_", " ").title(),
+        meta=SimpleNamespace(description=description),
+        specs=specs or [],
+    )
+
+
+def _catalog() -> list[SimpleNamespace]:
+    return [
+        _tool("web_search", "Search the web for pages."),
+        _tool("weather", "Current weather and forecasts for a city."),
+        _tool(
+            "toolbox",
+            "Assorted utilities.",
+            [
+                {
+                    "name": "convert_currency",
+                    "description": "Convert an amount between currencies.",
+                    "parameters": {"properties": {"amount": {}, "target_currency": {}}},
+                }
+            ],
+        ),
+        _tool("image_gen", "Generate images from a prompt."),
+    ]
+
+
+def test_query_ranks_tools_and_indexes_function_specs() -> None:
+    index = _ToolRetrievalIndex(_catalog())
+
+    assert [t["tool_id"] for t in index.query("weather forecast in Paris", 1)] == ["weather"]
+    assert index.query("convert 20 EUR to another currency", 1)[0]["tool_id"] == "toolbox"
+    assert len(index.query("nothing matches this", 3)) == 3
+
+
+def test_specs_can_be_left_out_of_the_index() -> None:
+    index = _ToolRetrievalIndex(_catalog(), include_specs=False)
+
+    assert index.scores("currency") == {}
+
+
+class ShortlistPipe(Pipe):
+    def __init__(self) -> None:
+        super().__init__()
+        self.valves.ENABLE_TOOL_INTEGRATION = True
+        self.valves.BATCH_TOOL_SELECTION = False
+        self.valves.TOOL_CATALOG_TOP_K = 1
+        self.prompts: list[str] = []
+
+    async def get_completion(  # type: ignore[override]
+        self,
+        prompt,
+        model: str | dict[str, object] = "",
+        tools=None,
+        format=None,
+        action_results=None,
+        action=None,
+    ) -> str:
+        self.prompts.append(prompt)
+        return json.dumps({"tool_ids": ["weather"]})
+
+    async def emit_status(self, *_args, **_kwargs) -> None:  # type: ignore[override]
+        return
+
+
+def test_tool_selection_sees_only_the_shortlist(monkeypatch: pytest.MonkeyPatch) -> None:
+    catalog = _catalog()
+    monkeypatch.setattr("planner.Tools.get_tools", staticmethod(lambda: catalog))
+    pipe = ShortlistPipe()
+    plan = Plan(
+        goal="Trip",
+        actions=[
+            Action(id="forecast", type="tool", description="Look up the weather forecast"),
+            Action(id="final_synthesis", type="text", description="{{forecast}}"),
+        ],
+    )
+
+    asyncio.run(pipe.validate_and_fix_tool_actions(plan))
+
+    assert plan.actions[0].tool_ids == ["weather"]
+    assert '"tool_id":"weather"' in pipe.prompts[0]
+    assert '"tool_id":"image_gen"' not in pipe.prompts[0]
+
+
+def test_index_is_rebuilt_only_when_catalog_changes(monkeypatch: pytest.MonkeyPatch) -> None:
+    catalog = _catalog()
+    monkeypatch.setattr("planner.Tools.get_tools", staticmethod(lambda: list(catalog)))
+    pipe = Pipe()
+
+    first = pipe._get_tool_index()
+    pipe.run_context.tool_registry = type(pipe.run_context.tool_registry)()
+    assert pipe._get_tool_index() is first
+
+    catalog.append(_tool("calendar", "Manage calendar events."))
+    pipe.run_context.tool_registry = type(pipe.run_context.tool_registry)()
+    rebuilt = pipe._get_tool_index()
+
+    assert rebuilt is not first
+    assert len(rebuilt) == 5